@@ -6,7 +6,6 @@ from models.agent import Agent, NoteBook
 from models.dataset import Dataset
 from models.document import Document
 from models.question_answer import QuestionAnswer
-from models.retrieved_result import RetrievedResult
 from utils.tokenizer import PreprocessingMethod, tokenize
 
 
@@ -28,6 +27,42 @@ def tokenize_doc(doc: Document) -> list[str]:
     )
 
 
+def tokenize_query(question: str) -> list[str]:
+    """
+    Tokenize the query the same way as the documents.
+
+    Args:
+        question (str): the question to tokenize
+
+    Returns:
+        tokens (list[str]): the query tokens
+    """
+    return tokenize(
+        question,
+        ngrams=2,
+        remove_stopwords=True,
+        preprocessing_method=PreprocessingMethod.STEMMING
+    )
+
+
+def build_bm25_index(corpus: list[Document]) -> BM25Ranker:
+    """
+    Builds the BM25 index of the corpus.
+
+    Args:
+        corpus (list[Document]): the corpus to index
+
+    Returns:
+        index (BM25Ranker): the BM25 index
+    """
+    return BM25Ranker(
+        corpus,
+        tokenizer=tokenize_doc,
+        b=0.75,
+        k1=0.5
+    )
+
+
 class BM25(Agent):
     """BM25 RAG system for document retrieval using BM25 algorithm."""
 
@@ -47,14 +82,9 @@ class BM25(Agent):
         corpus = dataset.read_corpus()
 
         # Index the documents using BM25
-        self._index = BM25Ranker(
-            corpus,
-            tokenizer=tokenize_doc,
-            b=0.75,
-            k1=0.5
-        )
+        self._index = build_bm25_index(corpus)
         self._corpus = corpus
-        self._qa_prompt = dataset.get_prompt('qa_rel')
+        self.use_qa_prompt(dataset, 'qa_rel')
 
         Logger().info("Successfully indexed documents")
 
@@ -88,36 +118,13 @@ class BM25(Agent):
                 "QA prompt not created. Please index the dataset before retrieving documents.")
         # pylint: enable=duplicate-code
 
-        notebook = NoteBook()
         k = self._args.k or 5
 
-        # Tokenize the query
-        tokenized_query = tokenize(
-            question,
-            ngrams=2,
-            remove_stopwords=True,
-            preprocessing_method=PreprocessingMethod.STEMMING
-        )
-
         # Get scores for the query
-        scores = self._index.get_scores(tokenized_query)
+        scores = self._index.get_scores(tokenize_query(question))
 
         # Get top k documents with their scores
         top_k = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:k]
 
-        retrieved_docs = [RetrievedResult(
-            doc_id=self._corpus[idx]['doc_id'],
-            content=self._corpus[idx]['content'],
-            score=score
-        ) for idx, score in top_k]
-
-        notebook.update_sources(retrieved_docs)
-
         # Update the notebook with the retrieved documents
-        notes = self._qa_prompt.format(
-            context='\n'.join(doc['content']
-                              for doc in retrieved_docs))
-
-        notebook.update_notes(notes)
-
-        return notebook
+        return self.build_notebook(top_k)
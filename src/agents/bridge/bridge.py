@@ -0,0 +1,206 @@
+"""
+Bridge RAG system for multi-hop document retrieval.
+
+Retrieves the first hop using BM25 and then follows the titles mentioned in the first hop passages to the passages
+describing those entities (bridge passages), which are found with constant time lookups on a title index instead of
+another search over the whole corpus.
+"""
+
+import time
+from multiprocessing import Pool, cpu_count
+import numpy as np
+from agents.bm25.bm25 import build_bm25_index, tokenize_query
+from logger.logger import Logger
+from models.agent import Agent, NoteBook
+from models.dataset import Dataset
+from models.question_answer import QuestionAnswer
+from utils.tokenizer import normalize, tokenize
+
+# Maximum number of tokens of a title that can be matched (bounded by the tokenizer)
+MAX_TITLE_TOKENS = 5
+# Number of first hop passages whose mentions are followed
+HOP_SEEDS = 5
+# Weight of the score of the first hop passage when scoring the bridge passages it mentions
+HOP_WEIGHT = 0.5
+
+_titles: set[str] = set()
+
+
+def find_mentions(content: str) -> list[str]:
+    """
+    Finds the titles of the corpus mentioned in the given content.
+
+    Args:
+        content (str): the content of a passage
+
+    Returns:
+        mentions (list[str]): the normalized titles mentioned in the content
+    """
+    return list({
+        ngram for ngram in tokenize(content, ngrams=MAX_TITLE_TOKENS)
+        if ngram in _titles
+    })
+
+
+def init_titles(titles: set[str]) -> None:
+    """
+    Initializes the titles of the corpus in a worker process.
+
+    Args:
+        titles (set[str]): the normalized titles of the corpus
+    """
+    # pylint: disable-next=global-statement
+    global _titles
+    _titles = titles
+
+
+class Bridge(Agent):
+    """
+    Bridge RAG system for multi-hop document retrieval using BM25 and a title index.
+    """
+
+    def __init__(self, args):
+        self._index = None
+        self._corpus = None
+        self._qa_prompt = None
+        self._title_index = None
+        self._mention_index = None
+        super().__init__(args)
+
+    def index(self, dataset: Dataset) -> None:
+        """
+        Index the documents using BM25 and build the title and entity mention indexes.
+
+        Args:
+            dataset (Dataset): The dataset to index
+        """
+        Logger().info("Indexing documents using Bridge agent")
+        corpus = dataset.read_corpus()
+
+        self._index = build_bm25_index(corpus)
+
+        # Title -> docs with that title
+        title_index: dict[str, list[int]] = {}
+        for i, doc in enumerate(corpus):
+            title = normalize(doc['title']) if doc.get('title') else ''
+            if title:
+                title_index.setdefault(title, []).append(i)
+
+        Logger().info(f"Found {len(title_index)} unique titles in the corpus")
+
+        if len(title_index) == 0:
+            Logger().warn(
+                "Corpus has no titles. Bridge agent will only retrieve the first hop.")
+
+        with Pool(processes=cpu_count(), initializer=init_titles, initargs=(set(title_index.keys()),)) as pool:
+            doc_mentions = pool.map(
+                find_mentions, [doc['content'] for doc in corpus], chunksize=256)
+
+        # Doc -> docs whose titles are mentioned in the doc
+        self._mention_index = [
+            sorted({j for mention in mentions for j in title_index[mention] if j != i})
+            for i, mentions in enumerate(doc_mentions)
+        ]
+
+        Logger().info(
+            f"Found {sum(len(mentions) for mentions in self._mention_index)} entity mentions in the corpus")
+
+        self._title_index = title_index
+        self._corpus = corpus
+        self.use_qa_prompt(dataset, 'qa_rel')
+
+        Logger().info("Successfully indexed documents")
+
+    def batch_reason(self, _: list[QuestionAnswer]) -> list[NoteBook]:  # type: ignore
+        """
+        Uses its question index to answer the questions.
+
+        Raises:
+            NotImplementedError: Batch reasoning is not implemented for the Bridge agent.
+        """
+        raise NotImplementedError(
+            "Batch reasoning is not implemented for the Bridge agent.")
+
+    def reason(self, question: str) -> NoteBook:
+        """
+        Retrieve the top k documents for the given question.
+
+        Args:
+            question (str): The question
+
+        Returns:
+            notebook (NoteBook): The notebook containing the retrieved documents and notes gathered by the agent
+        """
+        notebook, _ = self.retrieve(question)
+
+        return notebook
+
+    def multiprocessing_reason(self, questions: list[str]) -> list[NoteBook]:
+        """
+        Processes the questions in parallel using multiprocessing and reports the latency of each hop.
+
+        Args:
+            questions (list[str]): the given questions
+
+        Returns:
+            notebook (list[Notebook]): the detailed findings to help answer all questions (context)
+        """
+        with Pool(min(4, cpu_count())) as pool:
+            results = pool.map(self.retrieve, questions)
+
+        latencies = np.array([hop_latencies for _, hop_latencies in results])
+
+        if len(latencies) > 0:
+            for hop, hop_latencies in enumerate(latencies.T):
+                Logger().info(
+                    f"Hop {hop + 1} latency: mean {np.mean(hop_latencies) * 1000:.2f}ms, \
+p50 {np.percentile(hop_latencies, 50) * 1000:.2f}ms, p95 {np.percentile(hop_latencies, 95) * 1000:.2f}ms")
+
+        return [notebook for notebook, _ in results]
+
+    # pylint: disable-next=too-many-locals
+    def retrieve(self, question: str) -> tuple[NoteBook, tuple[float, float]]:
+        """
+        Retrieve the top k documents for the given question in two hops.
+        The first hop ranks the corpus using BM25, while the second hop adds the passages whose titles are
+        mentioned in the best first hop passages.
+
+        Args:
+            question (str): The question
+
+        Returns:
+            result (tuple[NoteBook, tuple[float, float]]): the notebook containing the retrieved documents and
+            the latency of each hop in seconds
+        """
+        # pylint: disable=duplicate-code
+        if not self._index or not self._corpus or self._mention_index is None:
+            raise ValueError(
+                "Index not created. Please index the dataset before retrieving documents.")
+
+        if not self._qa_prompt:
+            raise ValueError(
+                "QA prompt not created. Please index the dataset before retrieving documents.")
+        # pylint: enable=duplicate-code
+
+        k = self._args.k or 5
+
+        start = time.perf_counter()
+
+        scores = self._index.get_scores(tokenize_query(question))
+        first_hop = np.argsort(-scores)[:k]
+
+        first_hop_latency = time.perf_counter() - start
+        start = time.perf_counter()
+
+        candidates = {int(idx): float(scores[idx]) for idx in first_hop}
+        for idx in first_hop[:HOP_SEEDS]:
+            for bridge_idx in self._mention_index[idx]:
+                bridge_score = float(scores[bridge_idx]) + HOP_WEIGHT * float(scores[idx])
+                if bridge_score > candidates.get(bridge_idx, float('-inf')):
+                    candidates[bridge_idx] = bridge_score
+
+        top_k = sorted(candidates.items(), key=lambda x: x[1], reverse=True)[:k]
+
+        second_hop_latency = time.perf_counter() - start
+
+        return self.build_notebook(top_k), (first_hop_latency, second_hop_latency)
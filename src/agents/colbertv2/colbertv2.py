@@ -45,7 +45,7 @@ class ColbertV2(Agent):
 
         self._index = dataset.name or 'index'
         self._corpus = corpus
-        self._qa_prompt = dataset.get_prompt('qa_rel')
+        self.use_qa_prompt(dataset, 'qa_rel')
         Logger().info("Successfully indexed documents")
 
     def reason(self, _: str) -> NoteBook: # type: ignore
@@ -122,11 +122,7 @@ class ColbertV2(Agent):
             notebook = NoteBook()
             notebook.update_sources(retrieved_docs)
 
-            notes = self._qa_prompt.format(
-                context='\n'.join(
-                    doc['content']
-                    for doc in retrieved_docs)
-            )
+            notes = self.build_notes(retrieved_docs, self._qa_prompt)
 
             notebook.update_notes(notes)
             notebooks.append(notebook)
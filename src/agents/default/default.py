@@ -1,17 +1,94 @@
 """Default system for document retrieval that chooses docs directly from the dataset."""
 
-from itertools import repeat
-from multiprocessing import Pool, cpu_count
-from typing import Union
+import pickle
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from multiprocessing import Pool, cpu_count, get_start_method
+from typing import Any, Optional, Union
 
-import tiktoken
 from logger.logger import Logger
 from models.agent import Agent, NoteBook
 from models.dataset import Dataset
 from models.document import Document
 from models.question_answer import QuestionAnswer
 from models.retrieved_result import RetrievedResult
-from utils.token_utils import get_encoding, get_max_context_length
+from utils.byte_utils import format_size
+from utils.token_utils import TokenCounter, get_max_context_length
+
+# Maximum number of questions answered in a single request
+MAX_BATCH_SIZE = 8
+# Maximum number of questions answered in a single request when the supporting docs of all of them fit in the same
+# context window, which is then shared by all of them instead of being repeated in several requests
+MAX_SHARED_BATCH_SIZE = 32
+
+# State shared by the worker processes of batch_reason, initialized once per worker
+_worker_state: dict[str, Any] = {}
+
+
+def init_worker(
+    doc_ids: list[str],
+    token_counter: 'ContextTokenCounter',
+    questions: dict[str, tuple[str, list[str]]],
+    max_tokens: int
+) -> None:
+    """
+    Initializes the state of a batch_reason worker process so that tasks only carry question ids.
+
+    Args:
+        doc_ids (list[str]): the ids of the documents grouped by folder
+        token_counter (ContextTokenCounter): the token counts of the documents
+        questions (dict[str, tuple[str, list[str]]]): the question and the ids of its supporting docs \
+by question id
+        max_tokens (int): the maximum number of tokens of the context
+    """
+    _worker_state['docs_map'] = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+    _worker_state['doc_ids'] = doc_ids
+    _worker_state['token_counter'] = token_counter
+    _worker_state['questions'] = questions
+    _worker_state['max_tokens'] = max_tokens
+
+
+def process_batch(question_ids: list[str]) -> dict[str, Union[str, list[int]]]:
+    """
+    Processes a batch of questions in a worker process.
+
+    Args:
+        question_ids (list[str]): the ids of the questions in the batch
+
+    Returns:
+        question_batch (dict[str, Union[str, list[int]]]): the questions of the batch and the indices of the \
+documents in their context
+    """
+    questions = _worker_state['questions']
+
+    return {
+        'content': format_questions(question_ids, questions),
+        'context': get_context_doc_indices(
+            doc_ids=_worker_state['doc_ids'],
+            docs_map=_worker_state['docs_map'],
+            must_have_docs=[doc_id
+                            for question_id in question_ids
+                            for doc_id in questions[question_id][1]],
+            max_tokens=_worker_state['max_tokens'],
+            token_counter=_worker_state['token_counter'])
+    }
+
+
+def format_questions(question_ids: list[str], questions: dict[str, tuple[str, list[str]]]) -> str:
+    """
+    Formats the questions of a batch the way they are presented to the model.
+
+    Args:
+        question_ids (list[str]): the ids of the questions in the batch
+        questions (dict[str, tuple[str, list[str]]]): the question and the ids of its supporting docs \
+by question id
+
+    Returns:
+        content (str): the questions of the batch
+    """
+    return '\n'.join(f'Q ({question_id}): {questions[question_id][0]}'
+                     for question_id in question_ids).strip()
 
 
 class Default(Agent):
@@ -21,6 +98,7 @@ class Default(Agent):
         self._corpus = None
         self._index = None
         self._qa_prompt = None
+        self._token_counter = None
         super().__init__(args)
 
         # Support batch reasoning
@@ -33,27 +111,23 @@ class Default(Agent):
             dataset (Dataset): The dataset to index
         """
         corpus = dataset.read_corpus()
+
+        grouped_docs: dict[Optional[str], list[Document]] = {}
+        for doc in corpus:
+            grouped_docs.setdefault(doc.get('folder_id'), []).append(doc)
+
+        # Documents are laid out grouped by folder, which is the order in which they are rendered in the context
+        flattened_docs = [doc for docs in grouped_docs.values() for doc in docs]
+
         self._corpus = corpus
-        self._index = corpus
-        self._qa_prompt = dataset.get_prompt('qa_all')
-
-    def process_batch(
-        self,
-        questions: list[QuestionAnswer],
-        grouped_docs: dict[Union[str, None], list[Document]]
-    ) -> dict[str, Union[str, list[Document]]]:
-        """Helper function to process a batch of questions."""
-        return {
-            'content': '\n'.join(f'Q ({question["question_id"]}): {question["question"]}'
-                                 for question in questions).strip(),
-            'context': get_context_docs(
-                docs=grouped_docs,
-                must_have_docs=[doc['doc_id']
-                                for question in questions
-                                for doc in question['docs']],
-                model=self._args.model)
-        }
+        self._index = flattened_docs
+        self._token_counter = ContextTokenCounter(flattened_docs, self._args.model)
+        self.use_qa_prompt(dataset, 'qa_all')
+
+        Logger().info(
+            f"Total number of tokens in the corpus context: {self._token_counter.count(0, len(flattened_docs))}")
 
+    # pylint: disable-next=too-many-locals
     def batch_reason(self, questions: list[QuestionAnswer]) -> list[NoteBook]:
         """
         Dummy batch reasoning since it just returns all the documents in the dataset.
@@ -61,36 +135,80 @@ class Default(Agent):
         Args:
             questions (QuestionAnswer): list of questions to reason about
         """
-        if not self._index or not self._corpus:
+        if not self._index or not self._corpus or not self._token_counter:
             raise ValueError(
                 "Index not created. Please index the dataset before retrieving documents.")
 
-        grouped_docs = {}
-        for doc in self._index:
-            folder_id = doc.get('folder_id')
-            if folder_id:
-                grouped_docs.setdefault(folder_id, []).append(doc)
-            else:
-                grouped_docs.setdefault(None, []).append(doc)
+        max_tokens = get_max_context_length(self._args.model)
+        docs_map = {doc['doc_id']: i for i, doc in enumerate(self._index)}
+        questions_map = {question['question_id']: (question['question'], [doc['doc_id'] for doc in question['docs']])
+                         for question in questions}
+
+        region_batches: list[tuple[list[QuestionAnswer], tuple[int, int]]] = []
+        remaining_questions = questions
+
+        if self._args.prefix_stable:
+            region_batches, remaining_questions = plan_region_batches(
+                questions, docs_map, self._token_counter, max_tokens, MAX_BATCH_SIZE)
+
+            Logger().info(
+                f"{len(questions) - len(remaining_questions)} out of {len(questions)} questions share the context \
+of their corpus region in {len(region_batches)} batches")
+
+        # Batches questions whose supporting docs are close to each other so they share the same context and
+        # ensures all supporting docs are included for all questions in the batch
+        tasks = [[question['question_id'] for question in batch]
+                 for batch in plan_batches(
+                     remaining_questions,
+                     docs_map,
+                     self._token_counter,
+                     max_tokens,
+                     MAX_SHARED_BATCH_SIZE
+        )]
+
+        worker_state = (
+            [doc['doc_id'] for doc in self._index],
+            self._token_counter,
+            questions_map,
+            max_tokens
+        )
 
-        # Batches questions in groups of 5 that share the same context and
-        # ensures all supporting docs are included for all 5 questions
-        batch_size = 8
+        start = time.perf_counter()
 
-        with Pool(processes=cpu_count()) as pool:
-            question_batches = pool.starmap(
-                self.process_batch,
-                zip([questions[i:i + batch_size]
-                     for i in range(0, len(questions), batch_size)], repeat(grouped_docs)),
-            )
+        with Pool(processes=cpu_count(), initializer=init_worker, initargs=worker_state) as pool:
+            question_batches = pool.map(process_batch, tasks)
+
+        elapsed = time.perf_counter() - start
+
+        # Batches of the same region go first and back to back, so their requests share the whole system prompt
+        # as a prefix that the provider can cache
+        question_batches = [{
+            'content': format_questions([question['question_id'] for question in batch], questions_map),
+            'context': list(range(region_start, region_end))
+        } for batch, (region_start, region_end) in region_batches] + question_batches
 
         Logger().info("Finished processing questions in batch.")
 
-        def get_notebook(question_batch: dict[str, Union[str, list[Document]]]) -> NoteBook:
+        Logger().info(
+            f"Batch processing throughput: {len(tasks) / elapsed:.2f} batches/s \
+({len(questions) / elapsed:.2f} questions/s)")
+
+        # Measuring the IPC payloads pickles them a second time, so it is only done when debugging
+        if Logger().is_debug_enabled():
+            # Forked workers inherit their state, otherwise it is sent once to each worker
+            state_bytes = 0 if get_start_method() == 'fork' else len(pickle.dumps(worker_state)) * cpu_count()
+            task_bytes = sum(len(pickle.dumps(task)) for task in tasks)
+            result_bytes = sum(len(pickle.dumps(question_batch)) for question_batch in question_batches)
+
+            Logger().debug(
+                f"Batch processing IPC: {format_size(state_bytes)} worker state, {format_size(task_bytes)} tasks, \
+{format_size(result_bytes)} results")
+
+        def get_notebook(question_batch: dict[str, Union[str, list[int]]]) -> NoteBook:
             """Get the notebook for a question batch.
 
             Args:
-                question_batch (dict[str, Union[str, list[Document]]]): The question batch
+                question_batch (dict[str, Union[str, list[int]]]): The question batch
 
             Returns:
                 NoteBook: The notebook containing the retrieved documents
@@ -101,14 +219,16 @@ class Default(Agent):
 
             notebook = NoteBook()
 
+            context = [self._index[idx] for idx in question_batch['context']]  # type: ignore
+
             notes = self._qa_prompt.format(
-                context=get_content(question_batch['context'])  # type: ignore
+                context=get_content(context)
             )
 
             notebook.update_notes(notes)
             notebook.update_sources([RetrievedResult(
                 doc_id=doc['doc_id'], content=doc['content'], score=None)  # type: ignore
-                for doc in question_batch['context']])
+                for doc in context])
             notebook.update_questions(
                 question_batch['content'])  # type: ignore
             return notebook
@@ -125,6 +245,13 @@ class Default(Agent):
         Logger().info(
             f"Average number of retrieved docs: {1.0 * retrieved_docs / len(notebooks)}")
 
+        context_tokens = sum(self._token_counter.count_docs(question_batch['context'])  # type: ignore
+                             for question_batch in question_batches)
+
+        Logger().info(
+            f"Planned {len(question_batches)} batches for {len(questions)} questions. \
+Average number of context tokens per question: {1.0 * context_tokens / max(1, len(questions)):.2f}")
+
         return notebooks
 
     def reason(self, question: str) -> NoteBook:
@@ -144,105 +271,358 @@ class Default(Agent):
         )
 
 
-def get_context_docs(
-    docs: dict[Union[str, None], list[Document]],
-    must_have_docs: list[str],
-    model: str
-) -> list[Document]:
+class ContextTokenCounter:
     """
-    Ensures that must_have_docs are included in the final documents.
+    Token counts of a list of documents laid out the way get_content renders them.
+    The counts of the documents and their folder headers are computed once and stored as prefix sums,
+    so the number of tokens of any contiguous slice of documents is computed in constant time.
+
+    The count of a slice is the sum of the token counts of its lines plus one token per line break. It is an upper
+    bound rather than the exact count of the rendered content: the pre-tokenizer of the tiktoken encodings merges a
+    line break with the punctuation or whitespace that ends the line before it (e.g., ".\n", " \n" or "\n\n"), which
+    typically saves one token per merged line break. Slices sized with these counts never exceed their token budget,
+    at the cost of leaving a few tokens of it unused.
+    """
+
+    def __init__(self, docs: list[Document], model: str):
+        doc_tokens = [num_tokens + 1 for num_tokens in TokenCounter().count_batch(
+            [doc['content'] for doc in docs], model)]
+
+        folders = list({doc['folder_id'] for doc in docs})
+        header_tokens = dict(zip(folders, (num_tokens + 1 for num_tokens in TokenCounter().count_batch(
+            [f"sample_id: {folder}" for folder in folders], model))))
+
+        # Whether get_content emits a header before the document when rendering all documents
+        has_header = [
+            doc['folder_id'] != (docs[i - 1]['folder_id'] if i > 0 else None)
+            for i, doc in enumerate(docs)
+        ]
+
+        self._folders = [doc['folder_id'] for doc in docs]
+        self._doc_tokens = doc_tokens
+        self._header_tokens = header_tokens
+        self._has_header = has_header
+        self._prefix_sum = [0] + list(accumulate(
+            tokens + (header_tokens[doc['folder_id']] if header else 0)
+            for tokens, doc, header in zip(doc_tokens, docs, has_header)
+        ))
+
+    def count(self, start: int, end: int) -> int:
+        """
+        Counts the number of tokens of the content of the documents in the slice [start, end).
+
+        Args:
+            start (int): the index of the first document in the slice
+            end (int): the index after the last document in the slice
+
+        Returns:
+            num_tokens (int): the number of tokens of the content of the documents in the slice
+        """
+        if end <= start:
+            return 0
+
+        folder = self._folders[start]
+
+        # A slice always starts with a header unless its first document has no folder
+        header_in_sum = self._header_tokens[folder] if self._has_header[start] else 0
+        header_at_start = self._header_tokens[folder] if folder is not None else 0
+
+        # The last line is not followed by a line break
+        return self._prefix_sum[end] - self._prefix_sum[start] - header_in_sum + header_at_start - 1
+
+    def count_docs(self, indices: list[int]) -> int:
+        """
+        Counts the number of tokens of the content of the documents at the given sorted indices.
+
+        Args:
+            indices (list[int]): the sorted indices of the documents
+
+        Returns:
+            num_tokens (int): the number of tokens of the content of the documents
+        """
+        num_tokens = 0
+        cur_folder = None
+        for idx in indices:
+            if self._folders[idx] != cur_folder:
+                num_tokens += self._header_tokens[self._folders[idx]]
+                cur_folder = self._folders[idx]
+            num_tokens += self._doc_tokens[idx]
+
+        return max(0, num_tokens - 1)
+
+    def folder(self, idx: int) -> Optional[str]:
+        """
+        Gets the folder of a document.
+
+        Args:
+            idx (int): the index of the document
+
+        Returns:
+            folder_id (Optional[str]): the folder of the document
+        """
+        return self._folders[idx]
+
+    def doc_tokens(self, idx: int) -> int:
+        """
+        Gets the number of tokens of a document, including its line break but not its folder header.
+
+        Args:
+            idx (int): the index of the document
+
+        Returns:
+            num_tokens (int): the number of tokens of the document
+        """
+        return self._doc_tokens[idx]
+
+
+# pylint: disable-next=too-many-locals
+def plan_batches(
+    questions: list[QuestionAnswer],
+    docs_map: dict[str, int],
+    token_counter: ContextTokenCounter,
+    max_tokens: int,
+    max_batch_size: int
+) -> list[list[QuestionAnswer]]:
+    """
+    Groups the questions into batches whose supporting docs lie close to each other in the corpus, so that
+    a single context window covers all of them without pruning and as few batches (and therefore contexts)
+    as possible are needed.
+
+    Questions are sorted by the position of their supporting docs and greedily added to the current batch while
+    the span of supporting docs of the batch fits within max_tokens. Batches never mix folders (e.g., the
+    conversations of LoCoMo).
+
+    The context of every batch is expanded to max_tokens around its supporting docs, so the context tokens per
+    question only drop below those of fixed batches of MAX_BATCH_SIZE questions when batches grow larger than that.
 
     Args:
-        docs (dict[str, list[Document]]): the documents to be used
-        must_have_docs (list[str]): the documents that must be included
-        model (str): the model to be used for tokenization
+        questions (list[QuestionAnswer]): the questions to be batched
+        docs_map (dict[str, int]): the index of each document in the corpus by its id
+        token_counter (ContextTokenCounter): the token counts of the corpus
+        max_tokens (int): the maximum number of tokens of the context of a batch
+        max_batch_size (int): the maximum number of questions in a batch
 
     Returns:
-        list[Document]: the final list of documents
+        batches (list[list[QuestionAnswer]]): the batches of questions
     """
-    encoding = get_encoding(model)
+    def span(question: QuestionAnswer) -> tuple[int, int]:
+        positions = [docs_map[doc['doc_id']] for doc in question['docs'] if doc['doc_id'] in docs_map]
+        return (min(positions), max(positions) + 1) if positions else (0, 0)
 
-    max_tokens = get_max_context_length(model)
+    spans = {question['question_id']: span(question) for question in questions}
 
-    flattened_docs = [doc for ds in docs.values() for doc in ds]
+    batches: list[list[QuestionAnswer]] = []
+    batch: list[QuestionAnswer] = []
+    batch_start, batch_end = 0, 0
 
-    start = 0
-    end = len(flattened_docs)
-    content = get_content(flattened_docs[start:end])
+    for question in sorted(questions, key=lambda q: spans[q['question_id']]):
+        start, end = spans[question['question_id']]
 
-    tokens = encoding.encode(content)
+        if len(batch) > 0:
+            merged_start, merged_end = min(batch_start, start), max(batch_end, end)
+            same_folder = token_counter.folder(merged_start) == token_counter.folder(merged_end - 1)
 
-    docs_map = {doc['doc_id']: i for i, doc in enumerate(flattened_docs)}
+            if len(batch) < max_batch_size and same_folder and \
+                    token_counter.count(merged_start, merged_end) <= max_tokens:
+                batch.append(question)
+                batch_start, batch_end = merged_start, merged_end
+                continue
 
-    if len(tokens) > max_tokens:
-        start, end = search_best_interval(
-            flattened_docs, must_have_docs, docs_map, max_tokens, encoding)
+            batches.append(batch)
+
+        batch = [question]
+        batch_start, batch_end = start, end
 
-        content = get_content(flattened_docs[start:end])
-        encoded_content = encoding.encode(content)
+    if len(batch) > 0:
+        batches.append(batch)
 
-        if len(encoded_content) > max_tokens:
+    return batches
+
+
+def plan_regions(token_counter: ContextTokenCounter, num_docs: int, max_tokens: int) -> list[tuple[int, int]]:
+    """
+    Partitions the documents into contiguous regions whose content fits within max_tokens.
+    Whole folders (e.g., the conversations of LoCoMo) are packed into the same region while they fit, and folders
+    larger than max_tokens are split into regions of contiguous documents.
+
+    Args:
+        token_counter (ContextTokenCounter): the token counts of the documents
+        num_docs (int): the number of documents
+        max_tokens (int): the maximum number of tokens of the content of a region
+
+    Returns:
+        regions (list[tuple[int, int]]): the [start, end) slices of the regions sorted by position
+    """
+    folder_spans: list[tuple[int, int]] = []
+    for idx in range(num_docs):
+        if idx == 0 or token_counter.folder(idx) != token_counter.folder(idx - 1):
+            folder_spans.append((idx, idx + 1))
+        else:
+            folder_spans[-1] = (folder_spans[-1][0], idx + 1)
+
+    regions: list[tuple[int, int]] = []
+    start, end = 0, 0
+    for folder_start, folder_end in folder_spans:
+        if token_counter.count(start, folder_end) <= max_tokens:
+            end = folder_end
+            continue
+
+        if end > start:
+            regions.append((start, end))
+
+        start = end = folder_start
+        for idx in range(folder_start, folder_end):
+            if idx > start and token_counter.count(start, idx + 1) > max_tokens:
+                regions.append((start, idx))
+                start = idx
+            end = idx + 1
+
+    if end > start:
+        regions.append((start, end))
+
+    return regions
+
+
+def plan_region_batches(
+    questions: list[QuestionAnswer],
+    docs_map: dict[str, int],
+    token_counter: ContextTokenCounter,
+    max_tokens: int,
+    max_batch_size: int
+) -> tuple[list[tuple[list[QuestionAnswer], tuple[int, int]]], list[QuestionAnswer]]:
+    """
+    Groups the questions whose supporting docs lie within the same region of the corpus into batches whose context
+    is the whole region. Since every batch of a region renders the same context, their prompts are byte-identical
+    up to the questions, which allows prefix caching (e.g., Azure OpenAI prompt caching or vLLM automatic
+    prefix caching).
+
+    Args:
+        questions (list[QuestionAnswer]): the questions to be batched
+        docs_map (dict[str, int]): the index of each document in the corpus by its id
+        token_counter (ContextTokenCounter): the token counts of the corpus
+        max_tokens (int): the maximum number of tokens of the context of a batch
+        max_batch_size (int): the maximum number of questions in a batch
+
+    Returns:
+        result (tuple[list[tuple[list[QuestionAnswer], tuple[int, int]]], list[QuestionAnswer]]): the batches \
+sorted by region along with the [start, end) slice of their region, and the questions that do not fit in a region
+    """
+    regions = plan_regions(token_counter, len(docs_map), max_tokens)
+    region_starts = [start for start, _ in regions]
+
+    region_questions: dict[int, list[QuestionAnswer]] = {}
+    remaining_questions: list[QuestionAnswer] = []
+
+    for question in questions:
+        positions = [docs_map[doc['doc_id']] for doc in question['docs'] if doc['doc_id'] in docs_map]
+
+        if len(positions) > 0:
+            region = bisect_right(region_starts, min(positions)) - 1
+            region_start, region_end = regions[region]
+
+            if max(positions) < region_end and token_counter.count(region_start, region_end) <= max_tokens:
+                region_questions.setdefault(region, []).append(question)
+                continue
+
+        remaining_questions.append(question)
+
+    batches = [
+        (region_question_set[i:i + max_batch_size], regions[region])
+        for region, region_question_set in sorted(region_questions.items())
+        for i in range(0, len(region_question_set), max_batch_size)
+    ]
+
+    return batches, remaining_questions
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def get_context_doc_indices(
+    doc_ids: list[str],
+    docs_map: dict[str, int],
+    must_have_docs: list[str],
+    max_tokens: int,
+    token_counter: ContextTokenCounter
+) -> list[int]:
+    """
+    Ensures that must_have_docs are included in the final documents.
+
+    Args:
+        doc_ids (list[str]): the ids of the documents to be used grouped by folder
+        docs_map (dict[str, int]): the index of each document in doc_ids by its id
+        must_have_docs (list[str]): the documents that must be included
+        max_tokens (int): the maximum number of tokens of the content of the final documents
+        token_counter (ContextTokenCounter): the token counts of the documents
+
+    Returns:
+        list[int]: the indices of the final list of documents
+    """
+    start = 0
+    end = len(doc_ids)
+
+    if token_counter.count(start, end) > max_tokens:
+        start, end = search_best_interval(
+            doc_ids, must_have_docs, docs_map, max_tokens, token_counter)
+
+        if token_counter.count(start, end) > max_tokens:
             return search_optimal_removal(
-                flattened_docs, start, end, must_have_docs, max_tokens, encoding)
+                doc_ids, start, end, must_have_docs, max_tokens, token_counter)
 
-    return flattened_docs[start:end]
+    return list(range(start, end))
 
 # pylint: disable-next=too-many-locals,too-many-arguments,too-many-positional-arguments
 def search_optimal_removal(
-    docs: list[Document],
+    doc_ids: list[str],
     start: int, end: int,
     must_have_docs: list[str], max_tokens: int,
-    encoding: tiktoken.Encoding
-) -> list[Document]:
+    token_counter: ContextTokenCounter
+) -> list[int]:
     """
     Find the optimal documents to remove from the list of documents to ensure that the remaining documents
     fit within the max_tokens limit while still containing all must_have_docs.
+    Folder headers of removed documents are still counted, so the estimate is never below the actual count.
     """
-    target_slice = docs[start:end]
+    target_slice = doc_ids[start:end]
+    must_have = set(must_have_docs)
 
     # Indices relative to target_slice
     removable_indices = [
-        i for i, doc in enumerate(target_slice)
-        if doc['doc_id'] not in must_have_docs
+        i for i, doc_id in enumerate(target_slice)
+        if doc_id not in must_have
     ]
 
+    total_tokens = token_counter.count(start, end)
+    removed_tokens = [0] + list(accumulate(
+        token_counter.doc_tokens(start + i) for i in removable_indices))
+
     # Binary search to find the minimal number of docs to remove
     left, right = 0, len(removable_indices)
-    best_indices_to_remove = set(removable_indices)
+    best_to_remove = len(removable_indices)
 
     while left <= right:
         mid = (left + right) // 2
-        indices_to_remove = set(removable_indices[:mid])
-
-        # Create updated docs excluding indices_to_remove
-        updated_docs = [
-            doc for i, doc in enumerate(target_slice)
-            if i not in indices_to_remove
-        ]
 
         # Check if the updated content satisfies the token limit
-        updated_content = get_content(updated_docs)
-        encoded_updated_content = encoding.encode(updated_content)
-
-        if len(encoded_updated_content) <= max_tokens:
-            best_indices_to_remove = indices_to_remove
+        if total_tokens - removed_tokens[mid] <= max_tokens:
+            best_to_remove = mid
             right = mid - 1
         else:
             left = mid + 1
 
+    best_indices_to_remove = set(removable_indices[:best_to_remove])
+
     # Construct the new docs with only the pruned slice changed
     return [
-        doc for i, doc in enumerate(target_slice)
+        start + i for i in range(len(target_slice))
         if i not in best_indices_to_remove
     ]
 
 # pylint: disable-next=too-many-locals
 def search_best_interval(
-    docs: list[Document],
+    doc_ids: list[str],
     must_have_docs: list[str],
     docs_map: dict[str, int],
     max_tokens: int,
-    encoding: tiktoken.Encoding
+    token_counter: ContextTokenCounter
 ) -> tuple[int, int]:
     """
     Find the largest interval (start, end) such that the length of encoded(content)[start, end] is not greater 
@@ -253,11 +633,11 @@ def search_best_interval(
     ]
 
     smallest_start = min(start for start in must_have_indices)
-    largest_end = max(end for end in must_have_indices)
+    # Intervals are half-open, so the last must have doc is included by ending right after it
+    largest_end = max(end for end in must_have_indices) + 1
 
     def can_extend(start_idx: int, end_idx: int) -> tuple[bool, bool]:
-        token_count = len(encoding.encode(
-            get_content(docs[start_idx:end_idx])))
+        token_count = token_counter.count(start_idx, end_idx)
         return (token_count <= max_tokens, token_count == max_tokens)
 
     max_reached = False
@@ -282,7 +662,7 @@ def search_best_interval(
 
     if not max_reached:
         # Binary search to find the maximum extension to the right
-        right_start, right_end = largest_end, len(docs)
+        right_start, right_end = largest_end, len(doc_ids)
         while right_start <= right_end:
             mid = (right_start + right_end) // 2
             can_extend_flag, max_r = can_extend(best_left, mid)
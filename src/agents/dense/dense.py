@@ -6,7 +6,6 @@ from logger.logger import Logger
 from models.agent import Agent, NoteBook
 from models.dataset import Dataset
 from models.question_answer import QuestionAnswer
-from models.retrieved_result import RetrievedResult
 
 
 class Dense(Agent):
@@ -59,7 +58,7 @@ class Dense(Agent):
         Logger().info("Successfully indexed documents")
         self._index = corpus_embeddings
         self._corpus = corpus
-        self._qa_prompt = dataset.get_prompt('qa_rel')
+        self.use_qa_prompt(dataset, 'qa_rel')
         self._sentence_transformer = sentence_transformer
 
     def reason(self, question: str) -> NoteBook:
@@ -130,7 +129,6 @@ class Dense(Agent):
 
         Logger().info("Successfully computed query embeddings")
 
-        notebook = NoteBook()
         k = self._args.k or 5
 
         scores_matrix = util.dot_score(query_embeddings, self._index)
@@ -142,25 +140,8 @@ class Dense(Agent):
             # Get the top k indices for each query
             top_k_indices = torch.topk(scores, k, largest=True).indices
 
-            retrieved_docs = [
-                RetrievedResult(
-                    doc_id=self._corpus[idx]['doc_id'],
-                    content=self._corpus[idx]['content'],
-                    score=scores[idx].item()
-                ) for idx in top_k_indices
-            ]
-
             # Create a notebook for each query
-            notebook = NoteBook()
-            notebook.update_sources(retrieved_docs)
-
-            notes = self._qa_prompt.format(
-                context='\n'.join(
-                    doc['content']
-                    for doc in retrieved_docs)
-            )
-
-            notebook.update_notes(notes)
-            notebooks.append(notebook)
+            notebooks.append(self.build_notebook(
+                [(int(idx), scores[idx].item()) for idx in top_k_indices]))
 
         return notebooks
@@ -10,12 +10,15 @@ CUDA_VISIBLE_DEVICES: <gpu id>
 
 """
 
+import json
 import os
 from logger.logger import Logger
 from models.agent import Agent, NoteBook
 from models.dataset import Dataset
+from models.document import Document
 from models.question_answer import QuestionAnswer
 from models.retrieved_result import RetrievedResult
+from utils.hash_utils import get_content_hash, get_corpus_fingerprint
 
 
 class HippoRAG(Agent):
@@ -37,16 +40,43 @@ class HippoRAG(Agent):
 
         Args:
             dataset (Dataset): The dataset to index
+
+        Raises:
+            ValueError: if no model is given, since the graph is built from the OpenIE extractions of the LLM
         """
+        if not self._args.model:
+            Logger().error("HippoRAG agent requires a model (-m) to extract the OpenIE triples of the corpus")
+            raise ValueError(
+                "HippoRAG agent requires a model (-m) to extract the OpenIE triples of the corpus")
+
         Logger().info("Indexing documents using HippoRAG agent")
         corpus = dataset.read_corpus()
 
-        hipporag_dir = os.path.join(os.path.normpath(
+        embedding_model = 'facebook/contriever'
+
+        dataset_dir = os.path.join(os.path.normpath(
             os.getcwd() + os.sep + os.pardir), 'temp' + os.sep + 'hipporag' + os.sep + (dataset.name or ""))
 
+        # The working directory is keyed by the corpus and the models used to build the graph so that runs
+        # over different subsets of the dataset never share (possibly stale) graphs or embeddings
+        hipporag_dir = os.path.join(
+            dataset_dir,
+            f'{model_label(self._args.model)}_{model_label(embedding_model)}',
+            get_corpus_fingerprint([get_content_hash(doc['content']) for doc in corpus])
+        )
+
         os.makedirs(hipporag_dir, exist_ok=True)
 
-        embedding_model = 'facebook/contriever'
+        Logger().info(f"HippoRAG working directory: {hipporag_dir}")
+
+        # OpenIE extractions only depend on the passage and the LLM, so they are shared across corpora
+        openie_store_path = os.path.join(
+            dataset_dir, f'openie_results_{model_label(self._args.model)}.json')
+        openie_results_path = os.path.join(
+            hipporag_dir, f'openie_results_ner_{model_label(self._args.model)}.json')
+
+        seed_openie_results(openie_store_path, openie_results_path, corpus)
+
         hipporag = None
 
         # pylint: disable-next=import-outside-toplevel
@@ -61,6 +91,8 @@ class HippoRAG(Agent):
 
         hipporag.index(docs=[doc['content'] for doc in corpus])
 
+        update_openie_store(openie_store_path, openie_results_path)
+
         Logger().info("Successfully indexed documents")
 
         self._index = hipporag
@@ -112,13 +144,17 @@ class HippoRAG(Agent):
             raise ValueError(
                 "Reverse document map not created. Please index the dataset before retrieving documents.")
 
-        results = self._index.rag_qa(queries=questions)  # type: ignore
+        # In retrieve mode only the passages are retrieved, without answering the questions with the LLM
+        if self._args.execution == 'retrieve':
+            solutions = self._index.retrieve(queries=questions, num_to_retrieve=self._args.k)  # type: ignore
+        else:
+            solutions = self._index.rag_qa(queries=questions)[0]  # type: ignore
 
         Logger().info("Successfully retrieved documents")
 
         notebooks = []
 
-        for result in results[0]:
+        for result in solutions:
             retrieved_docs = [
                 RetrievedResult(
                     doc_id=self._reverse_doc_map[doc],
@@ -129,8 +165,116 @@ class HippoRAG(Agent):
 
             notebook = NoteBook()
             notebook.update_sources(retrieved_docs)
-            notebook.update_notes(result.answer[:1000])
+            notebook.update_notes(result.answer[:1000] if result.answer else None)
 
             notebooks.append(notebook)
 
         return notebooks
+
+
+def model_label(model: str) -> str:
+    """
+    Gets a label for the given model that is safe to use as part of a file name.
+
+    Args:
+        model (str): the model identifier
+
+    Returns:
+        label (str): the model label
+    """
+    return model.replace('/', '_')
+
+
+def read_openie_store(openie_store_path: str) -> dict[str, dict]:
+    """
+    Reads the OpenIE store which maps the content hash of each passage to its OpenIE extraction.
+
+    Args:
+        openie_store_path (str): the path to the OpenIE store
+
+    Returns:
+        openie_store (dict[str, dict]): the OpenIE extractions keyed by the content hash of the passage
+    """
+    if not os.path.isfile(openie_store_path):
+        return {}
+
+    with open(openie_store_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def seed_openie_results(openie_store_path: str, openie_results_path: str, corpus: list[Document]) -> None:
+    """
+    Seeds the OpenIE results of a HippoRAG working directory with the extractions already available in the
+    OpenIE store for the passages in the corpus. HippoRAG only runs OpenIE on passages that are not found in
+    its OpenIE results, so only new passages trigger an extraction.
+
+    Args:
+        openie_store_path (str): the path to the OpenIE store
+        openie_results_path (str): the path to the OpenIE results of the HippoRAG working directory
+        corpus (list[Document]): the corpus to be indexed
+    """
+    openie_store = read_openie_store(openie_store_path)
+
+    if os.path.isfile(openie_results_path):
+        with open(openie_results_path, 'r', encoding='utf-8') as f:
+            openie_store.update({
+                get_content_hash(openie_info['passage']): openie_info
+                for openie_info in json.load(f).get('docs', [])
+            })
+
+    # HippoRAG expects exactly one extraction per passage in the corpus
+    openie_docs = {}
+    for doc in corpus:
+        content_hash = get_content_hash(doc['content'])
+        if content_hash in openie_store and content_hash not in openie_docs:
+            openie_docs[content_hash] = openie_store[content_hash]
+
+    Logger().info(
+        f"Reusing OpenIE results for {len(openie_docs)} out of {len(corpus)} documents")
+
+    if len(openie_docs) == 0:
+        return
+
+    write_json_atomically(openie_results_path, {'docs': list(openie_docs.values())})
+
+
+def update_openie_store(openie_store_path: str, openie_results_path: str) -> None:
+    """
+    Adds the OpenIE extractions of a HippoRAG working directory to the OpenIE store.
+
+    Args:
+        openie_store_path (str): the path to the OpenIE store
+        openie_results_path (str): the path to the OpenIE results of the HippoRAG working directory
+    """
+    if not os.path.isfile(openie_results_path):
+        return
+
+    openie_store = read_openie_store(openie_store_path)
+    total_docs = len(openie_store)
+
+    with open(openie_results_path, 'r', encoding='utf-8') as f:
+        for openie_info in json.load(f).get('docs', []):
+            openie_store[get_content_hash(openie_info['passage'])] = {
+                'passage': openie_info['passage'],
+                'extracted_entities': openie_info['extracted_entities'],
+                'extracted_triples': openie_info['extracted_triples'],
+            }
+
+    if len(openie_store) > total_docs:
+        Logger().info(
+            f"Adding {len(openie_store) - total_docs} OpenIE results to the store {openie_store_path}")
+        write_json_atomically(openie_store_path, openie_store)
+
+
+def write_json_atomically(path: str, obj: dict) -> None:
+    """
+    Writes the given object as JSON so that readers never observe a partially written file.
+
+    Args:
+        path (str): the path to the file
+        obj (dict): the object to be written
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
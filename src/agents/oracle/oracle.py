@@ -33,7 +33,7 @@ class Oracle(Agent):
             for question in questions
         }
 
-        self._qa_prompt = dataset.get_prompt('qa_rel')
+        self.use_qa_prompt(dataset, 'qa_rel')
         self._corpus = corpus
 
     def reason(self, question: str) -> NoteBook:
@@ -69,13 +69,12 @@ class Oracle(Agent):
 
         notebook = NoteBook()
 
-        notes = self._qa_prompt.format(
-            context='\n'.join(doc['content'] for doc in docs))
-
-        notebook.update_notes(notes)
-        notebook.update_sources([RetrievedResult(
+        sources = [RetrievedResult(
             doc_id=doc['doc_id'], content=doc['content'], score=100.0)
-            for doc in docs])
+            for doc in docs]
+
+        notebook.update_notes(self.build_notes(sources, self._qa_prompt))
+        notebook.update_sources(sources)
 
         return notebook
 
@@ -0,0 +1,299 @@
+"""
+Phrase graph RAG system for multi-hop document retrieval.
+
+Builds a bipartite graph between passages and the phrases they contain without using an LLM, and ranks passages
+using personalized PageRank seeded from the phrases found in the question.
+Phrases are the n-grams produced by the tokenizer after removing stopwords, plus the passage titles when the
+dataset provides them (e.g., MuSiQue and 2Wiki). Since a title node is connected to every passage that mentions
+the title, the random walk can hop from a passage to the passages about the entities it mentions.
+"""
+
+from multiprocessing import Pool, cpu_count
+from typing import Optional
+import numpy as np
+from scipy import sparse
+from logger.logger import Logger
+from models.agent import Agent, NoteBook
+from models.dataset import Dataset
+from models.question_answer import QuestionAnswer
+from utils.tokenizer import PreprocessingMethod, tokenize
+
+# Maximum number of tokens in a phrase node that does not come from a title
+MAX_PHRASE_TOKENS = 2
+# Maximum number of tokens in a title node (bounded by the tokenizer)
+MAX_TITLE_TOKENS = 5
+# Phrases found in a larger fraction of the passages are not added to the graph
+MAX_DOC_FREQUENCY = 0.1
+# Probability of continuing the random walk instead of jumping back to the seed phrases
+DAMPING = 0.5
+MAX_ITERATIONS = 30
+TOLERANCE = 1e-6
+# Number of queries whose PageRank vectors are computed together
+QUERY_BATCH_SIZE = 16
+
+_titles: set[str] = set()
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalizes a title so that it can be matched against the phrases of a passage.
+
+    Args:
+        title (str): the title
+
+    Returns:
+        phrase (str): the normalized title
+    """
+    return ' '.join(tokenize(
+        title,
+        remove_stopwords=True,
+        preprocessing_method=PreprocessingMethod.STEMMING
+    ))
+
+
+def extract_phrases(text: str, title: Optional[str] = None) -> list[str]:
+    """
+    Extracts the phrases of the given text. Short n-grams are always kept, while longer n-grams are only kept
+    when they match a title of the corpus.
+
+    Args:
+        text (str): the text
+        title (Optional[str]): the normalized title of the text if any
+
+    Returns:
+        phrases (list[str]): the unique phrases found in the text
+    """
+    ngrams = tokenize(
+        text,
+        ngrams=MAX_TITLE_TOKENS if len(_titles) > 0 else MAX_PHRASE_TOKENS,
+        remove_stopwords=True,
+        preprocessing_method=PreprocessingMethod.STEMMING
+    )
+
+    phrases = {
+        ngram for ngram in ngrams
+        if ngram.count(' ') < MAX_PHRASE_TOKENS or ngram in _titles
+    }
+
+    if title:
+        phrases.add(title)
+
+    return list(phrases)
+
+
+def extract_doc_phrases(doc: tuple[str, Optional[str]]) -> list[str]:
+    """
+    Extracts the phrases of a document given as a (content, normalized title) tuple.
+
+    Args:
+        doc (tuple[str, Optional[str]]): the content and the normalized title of the document
+
+    Returns:
+        phrases (list[str]): the unique phrases found in the document
+    """
+    return extract_phrases(doc[0], doc[1])
+
+
+def init_titles(titles: set[str]) -> None:
+    """
+    Initializes the titles of the corpus in a worker process.
+
+    Args:
+        titles (set[str]): the normalized titles of the corpus
+    """
+    # pylint: disable-next=global-statement
+    global _titles
+    _titles = titles
+
+
+# pylint: disable-next=too-many-instance-attributes
+class PhraseGraph(Agent):
+    """
+    Phrase graph RAG system for multi-hop document retrieval using personalized PageRank.
+    """
+
+    def __init__(self, args):
+        self._index = None
+        self._corpus = None
+        self._qa_prompt = None
+        self._vocabulary = None
+        self._titles = None
+        self._idf = None
+        self._doc_weights = None
+        self._phrase_weights = None
+        super().__init__(args)
+
+    # pylint: disable-next=too-many-locals
+    def index(self, dataset: Dataset) -> None:
+        """
+        Index the documents by building a sparse passage-phrase graph.
+
+        Args:
+            dataset (Dataset): The dataset to index
+        """
+        Logger().info("Indexing documents using Phrase Graph agent")
+        corpus = dataset.read_corpus()
+
+        doc_titles = [normalize_title(doc['title']) if doc.get('title') else None
+                      for doc in corpus]
+        titles = {title for title in doc_titles if title}
+
+        Logger().info(f"Found {len(titles)} unique titles in the corpus")
+
+        init_titles(titles)
+
+        with Pool(processes=cpu_count(), initializer=init_titles, initargs=(titles,)) as pool:
+            doc_phrases = pool.map(
+                extract_doc_phrases,
+                zip([doc['content'] for doc in corpus], doc_titles),
+                chunksize=256
+            )
+
+        vocabulary: dict[str, int] = {}
+        rows = []
+        cols = []
+        for i, phrases in enumerate(doc_phrases):
+            for phrase in phrases:
+                rows.append(i)
+                cols.append(vocabulary.setdefault(phrase, len(vocabulary)))
+
+        graph = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(corpus), len(vocabulary))
+        )
+
+        doc_frequency = np.asarray(graph.sum(axis=0)).ravel()
+        max_doc_frequency = max(2.0, MAX_DOC_FREQUENCY * len(corpus))
+        idf = np.log((len(corpus) + 1) / (doc_frequency + 1)).astype(np.float32) + 1.0
+        idf[doc_frequency > max_doc_frequency] = 0.0
+
+        Logger().info(
+            f"Pruned {int(np.sum(doc_frequency > max_doc_frequency))} frequent phrases out of {len(vocabulary)}")
+
+        # Edges are weighted by the idf of the phrase so that rare phrases (entities) drive the random walk
+        graph = graph @ sparse.diags(idf)
+        graph.eliminate_zeros()
+
+        doc_weights = np.asarray(graph.sum(axis=1)).ravel()
+        phrase_weights = np.asarray(graph.sum(axis=0)).ravel()
+
+        Logger().info(
+            f"Successfully indexed documents. Graph with {len(corpus)} passages, {len(vocabulary)} phrases \
+and {graph.nnz} edges")
+
+        self._index = graph.tocsr()
+        self._corpus = corpus
+        self.use_qa_prompt(dataset, 'qa_rel')
+        self._vocabulary = vocabulary
+        self._titles = titles
+        self._idf = idf
+        self._doc_weights = np.where(doc_weights > 0, doc_weights, 1.0).astype(np.float32)
+        self._phrase_weights = np.where(phrase_weights > 0, phrase_weights, 1.0).astype(np.float32)
+
+    def batch_reason(self, _: list[QuestionAnswer]) -> list[NoteBook]:  # type: ignore
+        """
+        Uses its question index to answer the questions.
+
+        Raises:
+            NotImplementedError: Batch reasoning is not implemented for the Phrase Graph agent.
+        """
+        raise NotImplementedError(
+            "Batch reasoning is not implemented for the Phrase Graph agent.")
+
+    def reason(self, question: str) -> NoteBook:
+        """
+        Retrieve the top k documents for the given question.
+
+        Args:
+            question (str): The question
+
+        Returns:
+            notebook (NoteBook): The notebook containing the retrieved documents and notes gathered by the agent
+        """
+        return self.multiprocessing_reason([question])[0]
+
+    def multiprocessing_reason(self, questions: list[str]) -> list[NoteBook]:
+        """
+        Retrieve the top k documents for each question. The PageRank vectors of the questions are computed
+        together using sparse matrix products, so no worker processes are needed.
+
+        Args:
+            questions (list[str]): The questions to ask
+
+        Returns:
+            list[NoteBook]: The notebooks containing the retrieved documents
+        """
+        # pylint: disable=duplicate-code
+        if self._index is None or not self._corpus:
+            raise ValueError(
+                "Index not created. Please index the dataset before retrieving documents.")
+
+        if not self._qa_prompt:
+            raise ValueError(
+                "QA prompt not created. Please index the dataset before retrieving documents.")
+        # pylint: enable=duplicate-code
+
+        k = min(self._args.k or 5, len(self._corpus))
+
+        notebooks = []
+        for i in range(0, len(questions), QUERY_BATCH_SIZE):
+            scores = self._personalized_pagerank(questions[i:i + QUERY_BATCH_SIZE])
+
+            for query_scores in scores.T:
+                top_k = np.argpartition(-query_scores, k - 1)[:k]
+                top_k = top_k[np.argsort(-query_scores[top_k])]
+
+                notebooks.append(self.build_notebook(
+                    [(int(idx), float(query_scores[idx])) for idx in top_k]))
+
+        Logger().info(f"Successfully retrieved documents for {len(questions)} questions")
+
+        return notebooks
+
+    # pylint: disable-next=too-many-locals
+    def _personalized_pagerank(self, questions: list[str]) -> np.ndarray:
+        """
+        Computes the personalized PageRank of every passage for each question, with the teleport distribution
+        concentrated on the phrases of the question.
+
+        Args:
+            questions (list[str]): the questions
+
+        Returns:
+            scores (np.ndarray): the passage scores with shape (number of passages, number of questions)
+        """
+        graph: sparse.csr_matrix = self._index  # type: ignore
+        num_docs, num_phrases = graph.shape
+
+        init_titles(self._titles)  # type: ignore
+
+        seeds = np.zeros((num_phrases, len(questions)), dtype=np.float32)
+        for j, question in enumerate(questions):
+            for phrase in extract_phrases(question):
+                phrase_id = self._vocabulary.get(phrase)  # type: ignore
+                if phrase_id is not None:
+                    seeds[phrase_id, j] = self._idf[phrase_id]  # type: ignore
+
+        seed_mass = seeds.sum(axis=0)
+        if np.any(seed_mass == 0):
+            Logger().warn(
+                f"{int(np.sum(seed_mass == 0))} questions do not contain any phrase of the graph")
+        seeds /= np.where(seed_mass > 0, seed_mass, 1.0)
+
+        doc_weights = self._doc_weights[:, None]  # type: ignore
+        phrase_weights = self._phrase_weights[:, None]  # type: ignore
+
+        doc_scores = np.zeros((num_docs, len(questions)), dtype=np.float32)
+        phrase_scores = seeds
+        for iteration in range(MAX_ITERATIONS):
+            next_doc_scores = DAMPING * (graph @ (phrase_scores / phrase_weights))
+            next_phrase_scores = (1 - DAMPING) * seeds + DAMPING * (graph.T @ (doc_scores / doc_weights))
+
+            delta = np.abs(next_doc_scores - doc_scores).sum() + np.abs(next_phrase_scores - phrase_scores).sum()
+            doc_scores, phrase_scores = next_doc_scores, next_phrase_scores
+
+            if delta < TOLERANCE * len(questions):
+                Logger().debug(f"Personalized PageRank converged after {iteration + 1} iterations")
+                break
+
+        return doc_scores
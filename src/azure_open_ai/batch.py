@@ -1,14 +1,29 @@
 """Azure OpenAI Batch Job Queueing Module"""
-import io
 import json
+import os
 import time
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 from openai.types import Batch
 
 from azure_open_ai.openai_client import OpenAIClient
+from azure_open_ai.response_cache import ResponseCache
 from logger.logger import Logger
 from utils.byte_utils import format_size
 
+# Limits of the input file of a batch job
+MAX_BATCH_FILE_SIZE = 190 * 1024 * 1024
+MAX_BATCH_REQUESTS = 100_000
+# Polling intervals in seconds of a batch job, which grow while the job makes no progress
+MIN_BATCH_POLL_INTERVAL = 10.0
+MAX_BATCH_POLL_INTERVAL = 120.0
+# Polling intervals in seconds of an uploaded file while it is being processed
+MIN_FILE_POLL_INTERVAL = 1.0
+MAX_FILE_POLL_INTERVAL = 10.0
+# Factor by which a polling interval grows after each poll without progress
+POLL_BACKOFF = 1.5
+# Statuses of a batch job that has not finished yet
+PENDING_BATCH_STATUSES = ("in_progress", "validating", "finalizing", "cancelling")
+
 
 def queue_batch_job(
     jobs: list[dict],
@@ -28,14 +43,81 @@ def queue_batch_job(
         raise ValueError(
             "jobs must be a non-empty list of dictionaries.")
 
-    jobs_jsonl = "\n".join(json.dumps(job) for job in jobs)
-    jsonl_encoded = jobs_jsonl.encode("utf-8")
+    shards = write_batch_files(jobs, max_size=float('inf'), max_requests=len(jobs))
+
+    return queue_batch_file(shards[0][0])
+
+
+def write_batch_files(
+    jobs: Iterable[dict],
+    max_size: float = MAX_BATCH_FILE_SIZE,
+    max_requests: int = MAX_BATCH_REQUESTS,
+) -> list[tuple[str, list[str]]]:
+    """
+    Writes the jobs to JSONL batch files under the temp folder, starting a new file (shard) whenever adding a job
+    would exceed the maximum size in bytes or the maximum number of requests of a batch.
+    Each job is serialized exactly once and streamed to disk, so jobs are never held in memory in their serialized
+    form. The cache keys of the jobs are registered by split_cached_jobs, which computes them when looking up the
+    cache, so that their responses are cached once their batch completes.
+
+    Args:
+        jobs (Iterable[dict]): the jobs
+        max_size (float): the maximum size in bytes of a batch file
+        max_requests (int): the maximum number of requests of a batch file
+
+    Returns:
+        shards (list[tuple[str, list[str]]]): the path of each batch file and the custom ids of its jobs
+    """
+    batch_dir = get_batch_dir()
+
+    shards: list[tuple[str, list[str]]] = []
+    shard_size = 0
+    f = None
 
-    Logger().info(f"batch file size: {format_size(len(jsonl_encoded))}")
+    try:
+        for job in jobs:
+            line = (json.dumps(job) + '\n').encode('utf-8')
 
-    byte_stream = io.BytesIO(jsonl_encoded)
+            if f is None or shard_size + len(line) > max_size or len(shards[-1][1]) >= max_requests:
+                if f is not None:
+                    f.close()
+                    Logger().info(f"Batch file {shards[-1][0]} size: {format_size(shard_size)}")
 
-    Logger().info("Starting batch file upload ...")
+                path = os.path.join(batch_dir, f'batch_{len(shards)}_{int(time.time() * 1000)}.jsonl')
+                # pylint: disable-next=consider-using-with
+                f = open(path, 'wb')
+                shards.append((path, []))
+                shard_size = 0
+
+            f.write(line)
+            shard_size += len(line)
+            shards[-1][1].append(job['custom_id'])
+    finally:
+        if f is not None:
+            f.close()
+
+    if len(shards) > 0:
+        Logger().info(f"Batch file {shards[-1][0]} size: {format_size(shard_size)}")
+
+    Logger().info(f"Total number of batch files: {len(shards)}.")
+
+    return shards
+
+
+def queue_batch_file(path: str) -> Batch:
+    """
+    Queues a batch job using Azure OpenAI from a JSONL batch file, which is uploaded from the file handle.
+
+    Args:
+        path (str): the path of the batch file
+
+    Raises:
+        RuntimeError: if the file upload fails
+
+    Returns:
+        Batch: the batch job object
+    """
+    Logger().info(f"Starting batch file upload of {path} ({format_size(os.path.getsize(path))}) ...")
 
     openai_client = OpenAIClient().get_client()
 
@@ -43,19 +125,22 @@ def queue_batch_job(
         raise RuntimeError("Failed to create OpenAI client.")
 
     # Upload jsonl file for batch processing
-    batch_file = openai_client.files.create(
-        file=(f'locomo-run-{Logger().get_run_id()}.jsonl',
-              byte_stream, 'application/jsonl'),
-        purpose="batch",
-    )
-
-    # Wait until the file is uploaded
+    with open(path, 'rb') as f:
+        batch_file = openai_client.files.create(
+            file=(f'locomo-run-{Logger().get_run_id()}-{os.path.basename(path)}',
+                  f, 'application/jsonl'),
+            purpose="batch",
+        )
+
+    # Wait until the file is uploaded, polling often at first since small files are processed quickly
+    delay = MIN_FILE_POLL_INTERVAL
     while True:
         file = openai_client.files.retrieve(batch_file.id)
         if file.status in ("processed", "error"):
             break
         Logger().info("Waiting for file to be uploaded...")
-        time.sleep(10)
+        time.sleep(delay)
+        delay = min(MAX_FILE_POLL_INTERVAL, delay * POLL_BACKOFF)
 
     if file.status == "error":
         # pylint: disable-next=broad-except
@@ -88,12 +173,7 @@ def wait_for_batch_job_and_save_result(
     Raises:
         RuntimeError: if the batch job fails
     """
-    # Polling for batch job completion
-    while batch.status in ("in_progress", "validating", "finalizing"):
-        Logger().info(
-            f"Batch job status: {batch.status}. Waiting for completion...")
-        time.sleep(120)  # Sleep for 2 minutes
-        batch = retrieve_batch_job(batch.id)
+    batch = wait_for_batch_job(batch)
 
     if batch.status != "completed":
         Logger().error(
@@ -106,10 +186,49 @@ def wait_for_batch_job_and_save_result(
     Logger().info(
         f"Batch job output file ID: {batch.output_file_id}")
 
-    result = retrieve_file(batch.output_file_id)
+    download_file(batch.output_file_id, output_file_path)
+
+    ResponseCache().store_batch_results(read_batch_results(output_file_path))
+
+
+def wait_for_batch_job(batch: Batch) -> Batch:
+    """
+    Waits until a batch job is no longer running, whether it completed, failed, expired or was cancelled.
+    The job is polled often while its status or number of completed requests changes, and the polling interval
+    grows up to MAX_BATCH_POLL_INTERVAL while it makes no progress.
+
+    Args:
+        batch (Batch): the batch job object
+
+    Returns:
+        batch (Batch): the batch job object in its final status
+    """
+    delay = MIN_BATCH_POLL_INTERVAL
+    progress = get_batch_progress(batch)
+    while batch.status in PENDING_BATCH_STATUSES:
+        Logger().info(
+            f"Batch job {batch.id} status: {batch.status}. Waiting for completion...")
+        time.sleep(delay)
+        batch = retrieve_batch_job(batch.id)
 
-    with open(output_file_path, 'wb') as f:
-        f.write(result)
+        last_progress, progress = progress, get_batch_progress(batch)
+        delay = MIN_BATCH_POLL_INTERVAL if progress != last_progress else \
+            min(MAX_BATCH_POLL_INTERVAL, delay * POLL_BACKOFF)
+
+    return batch
+
+
+def get_batch_progress(batch: Batch) -> tuple[str, Optional[int]]:
+    """
+    Gets the progress of a batch job.
+
+    Args:
+        batch (Batch): the batch job object
+
+    Returns:
+        progress (tuple[str, Optional[int]]): the status and the number of completed requests of the batch job
+    """
+    return batch.status, batch.request_counts.completed if batch.request_counts else None
 
 
 def retrieve_batch_job(
@@ -153,3 +272,55 @@ def retrieve_file(
         raise RuntimeError("Failed to create OpenAI client.")
 
     return openai_client.files.content(file_id).content
+
+
+def download_file(
+    file_id: Optional[str],
+    path: str,
+) -> None:
+    """
+    Downloads a file using Azure OpenAI, streaming its content to disk.
+
+    Args:
+        file_id (str): the ID of the file to download
+        path (str): the path to save the file
+    """
+    if not file_id:
+        raise ValueError("file_id must be a non-empty string.")
+
+    openai_client = OpenAIClient().get_client()
+
+    if not openai_client:
+        raise RuntimeError("Failed to create OpenAI client.")
+
+    openai_client.files.content(file_id).write_to_file(path)
+
+
+def read_batch_results(path: str) -> Iterator[dict]:
+    """
+    Reads the lines of a batch output or error file one at a time.
+
+    Args:
+        path (str): the path of the batch output or error file
+
+    Returns:
+        results (Iterator[dict]): the results in the file
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def get_batch_dir() -> str:
+    """
+    Gets the folder of the batch input and output files of the current run under the temp folder.
+
+    Returns:
+        batch_dir (str): the path of the folder
+    """
+    batch_dir = os.path.join(os.path.normpath(
+        os.getcwd() + os.sep + os.pardir), 'temp' + os.sep + 'batch_files' + os.sep + Logger().get_run_id())
+    os.makedirs(batch_dir, exist_ok=True)
+
+    return batch_dir
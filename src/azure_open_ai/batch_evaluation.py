@@ -3,8 +3,9 @@ from typing import Optional
 from openai.types import Batch
 
 from azure_open_ai.batch import queue_batch_job
+from azure_open_ai.response_cache import split_cached_jobs
 from logger.logger import Logger
-from utils.token_utils import estimate_cost, estimate_num_tokens
+from utils.token_utils import TokenCounter, estimate_cost
 
 EVALUATION_PROMPT = '''You are a helpful judge evaluating the quality of an answer. \
 You will answer 'Yes' or 'No' to indicate whether the provided answer matches the expected answer.
@@ -19,10 +20,11 @@ def queue_evaluation_batch_job(
     model: str,
     question_answers: list[tuple[str, str, str]],
     job_args: Optional[dict] = None
-) -> Optional[Batch]:
+) -> tuple[Optional[Batch], list[dict]]:
     """
     Queues a batch job for evaluation using Azure OpenAI.
     The evaluation is done by comparing the expected answer with the provided answer.
+    Evaluations whose responses are cached are not queued.
 
     Args:
         model (str): model name to be used for evaluation
@@ -42,7 +44,8 @@ expected and actual answer pairs
         RuntimeError: if the file upload fails
 
     Returns:
-        Optional[Batch]: the batch job object if the job is queued successfully, None otherwise
+        tuple[Optional[Batch], list[dict]]: the batch job object if any job is queued, None otherwise, and the \
+cached results in the format of a batch output file
     """
     if job_args is None:
         job_args = {
@@ -58,12 +61,12 @@ expected and actual answer pairs
 
     cost = 0.0
 
-    for question, expected, actual in question_answers:
-        prompt = EVALUATION_PROMPT.format(
-            question=question,
-            answer=expected,
-        ) + actual
-        token_count = estimate_num_tokens(prompt, model)
+    prompts = [EVALUATION_PROMPT.format(
+        question=question,
+        answer=expected,
+    ) + actual for question, expected, actual in question_answers]
+
+    for token_count in TokenCounter().count_batch(prompts, model):
         cost += estimate_cost(token_count, model)
         if token_count > 1000:
             Logger().warn(
@@ -95,4 +98,9 @@ expected and actual answer pairs
         for idx, (question, expected, actual) in enumerate(question_answers)
     ]
 
-    return queue_batch_job(jobs)
+    cached_results, jobs = split_cached_jobs(jobs)
+
+    if len(jobs) == 0:
+        return None, cached_results
+
+    return queue_batch_job(jobs), cached_results
@@ -0,0 +1,290 @@
+"""Azure OpenAI Batch Manager Module to submit and wait for several batch jobs concurrently."""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+from openai.types import Batch
+
+from azure_open_ai.batch import download_file, get_batch_dir, queue_batch_file, read_batch_results
+from azure_open_ai.batch import wait_for_batch_job, write_batch_files
+from azure_open_ai.response_cache import ResponseCache
+from logger.logger import Logger
+
+# Maximum number of batch files uploaded at the same time
+MAX_PARALLEL_UPLOADS = 8
+# Maximum number of times the failed or missing requests of the batch jobs are queued again
+MAX_REQUEUE_ATTEMPTS = 3
+# Error codes of failed requests without a status code that may succeed if they are queued again
+RETRYABLE_ERROR_CODES = {'batch_expired', 'batch_cancelled', 'rate_limit_exceeded', 'server_error', 'timeout',
+                         'internal_error'}
+
+
+class BatchManager:
+    """
+    Submits batch files in parallel and waits for all the batch jobs concurrently, so that each batch output is
+    downloaded as soon as its job completes and the total latency is set by the slowest job.
+    The outputs of all the batch jobs are streamed into a single result file without duplicates. Requests that
+    failed with a retryable error (rate limits, server errors, expiration), or are missing from the output because
+    their job failed or expired, are read back from their batch file and queued again, up to MAX_REQUEUE_ATTEMPTS
+    times. Requests that failed with any other error (e.g., a context length exceeded) fail again if queued, so
+    they are reported as failed right away.
+    An optional on_submit callback is called with each batch job and its batch file and custom ids as soon as the
+    job is created, e.g., to checkpoint it, and an optional on_result callback is called with each successful
+    result of a batch job written to the result file.
+    """
+
+    def __init__(
+        self,
+        on_submit: Optional[Callable[[Batch, tuple[str, list[str]]], None]] = None,
+        on_result: Optional[Callable[[dict], None]] = None,
+    ):
+        self._on_submit = on_submit
+        self._on_result = on_result
+        self._jobs: list[tuple[Batch, tuple[Optional[str], list[str]]]] = []
+        self._lock = threading.Lock()
+
+    def submit(self, shards: list[tuple[str, list[str]]]) -> list[Batch]:
+        """
+        Uploads the batch files in parallel and creates a batch job for each of them.
+
+        Args:
+            shards (list[tuple[str, list[str]]]): the path of each batch file and the custom ids of its jobs
+
+        Returns:
+            batches (list[Batch]): the batch jobs in the order of the batch files
+        """
+        def submit_shard(shard: tuple[str, list[str]]) -> Batch:
+            batch = queue_batch_file(shard[0])
+
+            Logger().info(
+                f"Batch job queued with ID: {batch.id} and status: {batch.status}")
+
+            if self._on_submit is not None:
+                self._on_submit(batch, shard)
+
+            return batch
+
+        if len(shards) == 0:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_UPLOADS, len(shards))) as executor:
+            batches = list(executor.map(submit_shard, shards))
+
+        self._jobs.extend(zip(batches, shards))
+
+        return batches
+
+    def add(self, batch: Batch, shard: tuple[Optional[str], list[str]]) -> None:
+        """
+        Adds a batch job queued before, e.g., by a previous run, to the batch jobs to wait for.
+
+        Args:
+            batch (Batch): the batch job
+            shard (tuple[Optional[str], list[str]]): the path of its batch file, if known, and the custom ids of \
+its jobs
+        """
+        self._jobs.append((batch, shard))
+
+    # pylint: disable-next=too-many-locals
+    def wait(self, output_path: str, previous_results: Optional[list[dict]] = None) -> list[str]:
+        """
+        Waits for all the batch jobs concurrently and streams their successful results to the output file as soon
+        as each job finishes. The failed or missing requests are queued again once all the jobs of a round finish.
+
+        Args:
+            output_path (str): the path of the result file
+            previous_results (Optional[list[dict]]): results in the format of a batch output file obtained \
+otherwise, e.g., by a previous run or from the cache, written first
+
+        Returns:
+            failed (list[str]): the custom ids of the requests that could not be answered
+        """
+        start = time.perf_counter()
+        seen: set[str] = set()
+        failed: list[str] = []
+        # Reasons of the requests that failed with errors that are not retried by custom id
+        rejected: dict[str, str] = {}
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            def write(results: Iterator[dict], notify: bool = True) -> None:
+                with self._lock:
+                    for result in results:
+                        custom_id = str(result['custom_id'])
+                        if custom_id in seen:
+                            continue
+
+                        seen.add(custom_id)
+                        f.write(json.dumps(result) + '\n')
+
+                        if notify and self._on_result is not None:
+                            self._on_result(result)
+
+                    f.flush()
+
+            write(iter(previous_results or []), notify=False)
+
+            for attempt in range(MAX_REQUEUE_ATTEMPTS + 1):
+                jobs, self._jobs = self._jobs, []
+
+                if len(jobs) == 0:
+                    break
+
+                with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                    futures = [executor.submit(collect_batch_results, batch, write) for batch, _ in jobs]
+
+                for (batch, _), future in zip(jobs, futures):
+                    if future.exception() is not None:
+                        Logger().error(f"Failed to collect the results of batch job {batch.id}: {future.exception()}")
+                    else:
+                        rejected.update(future.result())
+
+                retry = [(path, [custom_id for custom_id in custom_ids
+                                 if custom_id not in seen and custom_id not in rejected])
+                         for _, (path, custom_ids) in jobs]
+                retry = [(path, custom_ids) for path, custom_ids in retry if len(custom_ids) > 0]
+                failed = list(rejected) + [custom_id for _, custom_ids in retry for custom_id in custom_ids]
+
+                if len(retry) == 0 or attempt == MAX_REQUEUE_ATTEMPTS:
+                    break
+
+                requeue = [(path, set(custom_ids)) for path, custom_ids in retry
+                           if path is not None and os.path.exists(path)]
+
+                if len(requeue) < len(retry):
+                    Logger().warn(
+                        f"Batch files of {len(retry) - len(requeue)} batch jobs are not available. \
+Their failed requests cannot be queued again.")
+
+                Logger().info(
+                    f"Queuing {sum(len(custom_ids) for _, custom_ids in requeue)} failed or missing requests again \
+(attempt {attempt + 1} of {MAX_REQUEUE_ATTEMPTS})")
+
+                self.submit(write_batch_files(read_shard_jobs(requeue)))
+
+        Logger().info(
+            f"Saved {len(seen)} results to {output_path} in {time.perf_counter() - start:.2f}s. \
+Failed requests: {len(failed)}.")
+
+        if len(rejected) > 0:
+            Logger().warn(f"{len(rejected)} requests failed with errors that are not retried: \
+{dict(Counter(rejected.values()))}")
+
+        if len(failed) > 0:
+            Logger().warn(f"{len(failed)} requests could not be answered: {failed[:10]}")
+
+        return failed
+
+
+def collect_batch_results(batch: Batch, write: Callable[[Iterator[dict]], None]) -> dict[str, str]:
+    """
+    Waits for a batch job to finish, streams its successful results to the given writer, caches them and logs
+    the reasons of its failed requests from its output and error files.
+
+    Args:
+        batch (Batch): the batch job
+        write (Callable[[Iterator[dict]], None]): the writer of the successful results
+
+    Returns:
+        rejected (dict[str, str]): the reason of each request that failed with an error that is not retryable \
+by custom id
+    """
+    batch = wait_for_batch_job(batch)
+    failures: list[dict] = []
+
+    Logger().info(
+        f"Batch job {batch.id} finished with status: {batch.status}. Requests: {batch.request_counts}")
+
+    if batch.output_file_id:
+        output_path = os.path.join(get_batch_dir(), f'output_{batch.id}.jsonl')
+        download_file(batch.output_file_id, output_path)
+
+        write(result for result in read_batch_results(output_path) if is_successful(result))
+
+        ResponseCache().store_batch_results(read_batch_results(output_path))
+
+        failures.extend(result for result in read_batch_results(output_path) if not is_successful(result))
+
+    if batch.error_file_id:
+        error_path = os.path.join(get_batch_dir(), f'errors_{batch.id}.jsonl')
+        download_file(batch.error_file_id, error_path)
+
+        failures.extend(read_batch_results(error_path))
+
+    if len(failures) > 0:
+        reasons = Counter(get_error_reason(result) for result in failures)
+
+        Logger().warn(f"Batch job {batch.id} failed requests by reason: {dict(reasons)}")
+
+    if batch.status != "completed":
+        Logger().warn(
+            f"Batch job {batch.id} finished with status: {batch.status}. Errors: {batch.errors}")
+
+    return {str(result['custom_id']): get_error_reason(result) for result in failures if not is_retryable(result)}
+
+
+def read_shard_jobs(shards: list[tuple[str, set[str]]]) -> Iterator[dict]:
+    """
+    Reads the jobs with the given custom ids back from their batch files.
+
+    Args:
+        shards (list[tuple[str, set[str]]]): the path of each batch file and the custom ids of the jobs to read
+
+    Returns:
+        jobs (Iterator[dict]): the jobs
+    """
+    for path, custom_ids in shards:
+        for job in read_batch_results(path):
+            if str(job['custom_id']) in custom_ids:
+                yield job
+
+
+def is_successful(result: dict) -> bool:
+    """
+    Checks whether a line of a batch output file holds a successful response.
+
+    Args:
+        result (dict): the line of the batch output file
+
+    Returns:
+        successful (bool): whether the response succeeded
+    """
+    response = result.get('response') or {}
+
+    return result.get('error') is None and response.get('status_code', 200) == 200
+
+
+def get_error_reason(result: dict) -> str:
+    """
+    Gets the reason of a failed request from a line of a batch error or output file.
+
+    Args:
+        result (dict): the line of the batch error or output file
+
+    Returns:
+        reason (str): the error code, or the status code of the response if there is none
+    """
+    error = result.get('error') or ((result.get('response') or {}).get('body') or {}).get('error') or {}
+
+    return str(error.get('code') or (result.get('response') or {}).get('status_code'))
+
+
+def is_retryable(result: dict) -> bool:
+    """
+    Checks whether a failed request from a line of a batch error or output file may succeed if it is queued again,
+    which is the case of rate limits, server errors and requests of expired or cancelled jobs.
+
+    Args:
+        result (dict): the line of the batch error or output file
+
+    Returns:
+        retryable (bool): whether the request may succeed if it is queued again
+    """
+    status_code = (result.get('response') or {}).get('status_code')
+
+    if isinstance(status_code, int) and status_code != 200:
+        return status_code == 429 or status_code >= 500
+
+    return get_error_reason(result) in RETRYABLE_ERROR_CODES
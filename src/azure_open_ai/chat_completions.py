@@ -1,44 +1,371 @@
 """Azure OpenAI Chat Completions Module"""
+import asyncio
+import random
+import time
+from typing import Any, Callable, Iterator, Optional
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 from openai.types.chat.chat_completion import ChatCompletion
 from azure_open_ai.openai_client import OpenAIClient
+from azure_open_ai.response_cache import ResponseCache, get_cache_key
+from azure_open_ai.rate_limiter import RateLimiter, estimate_request_tokens, get_rate_limiter, get_retry_after
 from logger.logger import Logger
 
+# Maximum number of requests in flight at the same time
+DEFAULT_CONCURRENCY = 16
+# Maximum number of retries of a request that failed with a transient error
+MAX_RETRIES = 6
+# Base and maximum delay in seconds of the exponential backoff between retries
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Optional parameters forwarded to the API only when the job defines them
+OPTIONAL_JOB_ARGS = ['stop', 'response_format']
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
 
 def chat_completions(
     jobs: list[dict],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_complete: Optional[Callable[[ChatCompletion, str], None]] = None,
+    on_error: Optional[Callable[[Exception, str], None]] = None,
 ) -> list[tuple[ChatCompletion, str]]:
     """
     Function to handle chat completions using Azure OpenAI.
+    Jobs whose responses are cached are not sent, and the rest are sent concurrently with at most concurrency
+    requests in flight. The results keep the order of the jobs.
+
+    Args:
+        jobs (list[dict]): List of jobs to process.
+        concurrency (int): Maximum number of requests in flight at the same time.
+        on_complete (Optional[Callable[[ChatCompletion, str], None]]): Called with the completion and the \
+custom id of each job as soon as it completes.
+        on_error (Optional[Callable[[Exception, str], None]]): Called with the error and the custom id of each job \
+that fails after all retries. If not provided, the first failure is raised.
+
+    Raises:
+        ValueError: if concurrency is not positive
+
+    Returns:
+        list[tuple[ChatCompletion, str]]: List of completions with the custom id of their job, in the order of \
+the jobs. Failed jobs are skipped when on_error is provided.
+    """
+    if concurrency <= 0:
+        raise ValueError("concurrency must be a positive integer.")
+
+    cache = ResponseCache()
+    cache_keys = {job['custom_id']: get_cache_key(job) for job in jobs}
+
+    results: list[Optional[tuple[ChatCompletion, str]]] = []
+    pending_jobs = []
+
+    for job in jobs:
+        response = cache.get(cache_keys[job['custom_id']])
+
+        if response is None:
+            results.append(None)
+            pending_jobs.append(job)
+            continue
+
+        completion = ChatCompletion.model_validate(response)
+        results.append((completion, job['custom_id']))
+
+        if on_complete is not None:
+            on_complete(completion, job['custom_id'])
+
+    cache.log_stats()
+
+    def complete(completion: ChatCompletion, custom_id: str) -> None:
+        cache.put(cache_keys[custom_id], completion.to_dict())
+
+        if on_complete is not None:
+            on_complete(completion, custom_id)
+
+    start = time.perf_counter()
+
+    pending_results = iter(asyncio.run(
+        chat_completions_async(pending_jobs, concurrency, complete, on_error)) if len(pending_jobs) > 0 else [])
+
+    elapsed = time.perf_counter() - start
+
+    # Cached results are kept in place and the results of the pending jobs fill the gaps in order
+    results = [result if result is not None else next(pending_results) for result in results]
+
+    Logger().info(
+        f"Completed {len(pending_jobs)} chat completions in {elapsed:.2f}s \
+({len(pending_jobs) / max(elapsed, 1e-9):.2f} requests/s, concurrency {concurrency})")
+
+    return [result for result in results if result is not None]
+
+
+async def chat_completions_async(
+    jobs: list[dict],
+    concurrency: int,
+    on_complete: Optional[Callable[[ChatCompletion, str], None]] = None,
+    on_error: Optional[Callable[[Exception, str], None]] = None,
+) -> list[Optional[tuple[ChatCompletion, str]]]:
+    """
+    Sends the chat completion requests of the jobs concurrently, within the rate limits of each deployment.
 
     Args:
         jobs (list[dict]): List of jobs to process.
+        concurrency (int): Maximum number of requests in flight at the same time.
+        on_complete (Optional[Callable[[ChatCompletion, str], None]]): Called with each completion.
+        on_error (Optional[Callable[[Exception, str], None]]): Called with each failure.
+
+    Raises:
+        RuntimeError: if the OpenAI client is not initialized
 
     Returns:
-        list[dict]: List of processed jobs with chat completions.
+        list[Optional[tuple[ChatCompletion, str]]]: List of completions with the custom id of their job, in the \
+order of the jobs, or None for the jobs that failed.
     """
-    openai_client = OpenAIClient().get_client()
+    openai_client = OpenAIClient().get_async_client()
 
     if not openai_client:
         Logger().error("OpenAI client is not initialized.")
         raise RuntimeError("OpenAI client is not initialized.")
 
-    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiters = {model: get_rate_limiter(model) for model in {job['model'] for job in jobs}}
 
-    for job in jobs:
-        completion = openai_client.chat.completions.create(
-            model=job["model"],
-            messages=job["messages"],
-            temperature=job["temperature"],
-            frequency_penalty=job["frequency_penalty"],
-            presence_penalty=job["presence_penalty"],
-            max_tokens=job["max_completion_tokens"],
-            stop=job["stop"],
-        )
-
-        Logger().debug(
-            f"Chat completion for job {job['custom_id']} with model {job['model']} completed"
-        )
+    async def run(job: dict) -> Optional[tuple[ChatCompletion, str]]:
+        async with semaphore:
+            return await complete_job(openai_client, job, rate_limiters[job['model']], on_complete, on_error)
 
-        results.append((completion, job['custom_id']))
+    async with openai_client:
+        results = await asyncio.gather(*(run(job) for job in jobs))
+
+    for model, rate_limiter in rate_limiters.items():
+        Logger().info(f"Requests to {model} waited {rate_limiter.get_waited_time():.2f}s for rate limits")
 
     return results
+
+
+def chat_completions_stream(
+    jobs: Iterator[dict],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_complete: Optional[Callable[[ChatCompletion, str], None]] = None,
+    on_error: Optional[Callable[[Exception, str], None]] = None,
+) -> int:
+    """
+    Function to handle chat completions of jobs that are produced while the requests are being sent, e.g., by
+    a retrieval stage running in another thread. A job is only taken from the iterator when a request slot is free,
+    so a bounded producer is throttled to the pace of the model. Results are reported through on_complete in
+    completion order.
+
+    Args:
+        jobs (Iterator[dict]): Iterator of jobs to process. It may block until the next job is available.
+        concurrency (int): Maximum number of requests in flight at the same time.
+        on_complete (Optional[Callable[[ChatCompletion, str], None]]): Called with the completion and the \
+custom id of each job as soon as it completes.
+        on_error (Optional[Callable[[Exception, str], None]]): Called with the error and the custom id of each job \
+that fails after all retries. If not provided, the first failure is raised.
+
+    Raises:
+        ValueError: if concurrency is not positive
+
+    Returns:
+        int: The number of jobs processed.
+    """
+    if concurrency <= 0:
+        raise ValueError("concurrency must be a positive integer.")
+
+    start = time.perf_counter()
+
+    num_jobs = asyncio.run(chat_completions_stream_async(jobs, concurrency, on_complete, on_error))
+
+    elapsed = time.perf_counter() - start
+
+    ResponseCache().log_stats()
+
+    Logger().info(
+        f"Streamed {num_jobs} chat completions in {elapsed:.2f}s \
+({num_jobs / max(elapsed, 1e-9):.2f} requests/s, concurrency {concurrency})")
+
+    return num_jobs
+
+
+# pylint: disable-next=too-many-locals
+async def chat_completions_stream_async(
+    jobs: Iterator[dict],
+    concurrency: int,
+    on_complete: Optional[Callable[[ChatCompletion, str], None]] = None,
+    on_error: Optional[Callable[[Exception, str], None]] = None,
+) -> int:
+    """
+    Sends the chat completion requests of the jobs as they are produced, serving cached responses without
+    sending them.
+
+    Args:
+        jobs (Iterator[dict]): Iterator of jobs to process.
+        concurrency (int): Maximum number of requests in flight at the same time.
+        on_complete (Optional[Callable[[ChatCompletion, str], None]]): Called with each completion.
+        on_error (Optional[Callable[[Exception, str], None]]): Called with each failure.
+
+    Raises:
+        RuntimeError: if the OpenAI client is not initialized
+        Exception: the first failure of a job, if on_error is not provided
+
+    Returns:
+        int: The number of jobs processed.
+    """
+    openai_client = OpenAIClient().get_async_client()
+
+    if not openai_client:
+        Logger().error("OpenAI client is not initialized.")
+        raise RuntimeError("OpenAI client is not initialized.")
+
+    loop = asyncio.get_running_loop()
+    cache = ResponseCache()
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiters: dict[str, RateLimiter] = {}
+    tasks: set[asyncio.Task] = set()
+    # Failures of the finished tasks, which are no longer in tasks when they are gathered
+    errors: list[BaseException] = []
+    num_jobs = 0
+
+    def done(task: asyncio.Task) -> None:
+        tasks.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            errors.append(task.exception())  # type: ignore
+
+    def complete(key: str, completion: ChatCompletion, custom_id: str) -> None:
+        cache.put(key, completion.to_dict())
+
+        if on_complete is not None:
+            on_complete(completion, custom_id)
+
+    async def run(job: dict) -> None:
+        try:
+            key = get_cache_key(job)
+            response = cache.get(key)
+
+            if response is not None:
+                if on_complete is not None:
+                    on_complete(ChatCompletion.model_validate(response), job['custom_id'])
+                return
+
+            if job['model'] not in rate_limiters:
+                rate_limiters[job['model']] = get_rate_limiter(job['model'])
+
+            await complete_job(
+                openai_client, job, rate_limiters[job['model']],
+                lambda completion, custom_id: complete(key, completion, custom_id), on_error)
+        finally:
+            semaphore.release()
+
+    async with openai_client:
+        while True:
+            await semaphore.acquire()
+
+            # The iterator may block, so it is consumed outside the event loop
+            # No more jobs are sent once a job failed without on_error
+            job = await loop.run_in_executor(None, next, jobs, None) if len(errors) == 0 else None
+
+            if job is None:
+                semaphore.release()
+                break
+
+            num_jobs += 1
+            task = asyncio.create_task(run(job))
+            tasks.add(task)
+            task.add_done_callback(done)
+
+        await asyncio.gather(*tasks)
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    return num_jobs
+
+
+async def complete_job(
+    openai_client: Any,
+    job: dict,
+    rate_limiter: RateLimiter,
+    on_complete: Optional[Callable[[ChatCompletion, str], None]] = None,
+    on_error: Optional[Callable[[Exception, str], None]] = None,
+) -> Optional[tuple[ChatCompletion, str]]:
+    """
+    Sends the chat completion request of a job and reports its result through the callbacks.
+
+    Args:
+        openai_client (Any): The async OpenAI client.
+        job (dict): The job to process.
+        rate_limiter (RateLimiter): The rate limiter of the deployment of the job.
+        on_complete (Optional[Callable[[ChatCompletion, str], None]]): Called with the completion.
+        on_error (Optional[Callable[[Exception, str], None]]): Called with the failure. If not provided, \
+the failure is raised.
+
+    Returns:
+        Optional[tuple[ChatCompletion, str]]: The completion with the custom id of the job, or None if it failed.
+    """
+    try:
+        completion = await create_completion(openai_client, job, rate_limiter)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        if on_error is None:
+            raise
+        Logger().error(f"Chat completion for job {job['custom_id']} failed: {e}")
+        on_error(e, job['custom_id'])
+        return None
+
+    Logger().debug(
+        f"Chat completion for job {job['custom_id']} with model {job['model']} completed"
+    )
+
+    if on_complete is not None:
+        on_complete(completion, job['custom_id'])
+
+    return completion, job['custom_id']
+
+
+async def create_completion(openai_client: Any, job: dict, rate_limiter: RateLimiter) -> ChatCompletion:
+    """
+    Sends the chat completion request of a job, retrying transient errors (rate limits, timeouts, connection
+    and server errors) with exponential backoff and full jitter.
+    Quota is reserved before each attempt, and the deployment is paused for as long as the server asks in the
+    retry-after headers of a rate limited response.
+
+    Args:
+        openai_client (Any): The async OpenAI client.
+        job (dict): The job to process.
+        rate_limiter (RateLimiter): The rate limiter of the deployment of the job.
+
+    Returns:
+        ChatCompletion: The chat completion of the job.
+    """
+    num_tokens = estimate_request_tokens(job)
+
+    attempt = 0
+    while True:
+        await rate_limiter.acquire(num_tokens)
+
+        try:
+            return await openai_client.chat.completions.create(
+                model=job["model"],
+                messages=job["messages"],
+                temperature=job["temperature"],
+                frequency_penalty=job["frequency_penalty"],
+                presence_penalty=job["presence_penalty"],
+                max_tokens=job["max_completion_tokens"],
+                **{arg: job[arg] for arg in OPTIONAL_JOB_ARGS if arg in job},
+            )
+        except RETRYABLE_ERRORS as e:
+            if attempt >= MAX_RETRIES:
+                raise
+
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                rate_limiter.pause(retry_after)
+                delay = max(delay, retry_after)
+
+            Logger().warn(
+                f"Chat completion for job {job['custom_id']} failed with {type(e).__name__}. \
+Retrying in {delay:.2f}s (attempt {attempt} of {MAX_RETRIES})")
+
+            await asyncio.sleep(delay)
@@ -0,0 +1,577 @@
+"""
+Local emulator of the OpenAI Batch API that runs batch jobs as concurrent chat completions against any
+OpenAI-compatible endpoint, e.g., a VLLM server.
+
+Usage (from the src folder):
+    python -m azure_open_ai.local_batch_server -p 8100 -cc 64
+
+Then set LLM_BATCH_ENDPOINT=http://localhost:8100/v1 so that the batch flow of the predictor and the evaluator
+uploads its batch files to the emulator.
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+from dotenv import load_dotenv
+from openai.types.chat.chat_completion import ChatCompletion
+
+from azure_open_ai.chat_completions import chat_completions_stream
+from logger.logger import Logger
+
+# Default port of the emulator
+DEFAULT_PORT = 8100
+# Default number of chat completion requests in flight for each batch job
+DEFAULT_CONCURRENCY = 64
+# Minimum number of seconds between two writes of the state of a running batch job to disk
+STATE_SAVE_INTERVAL = 1.0
+# Statuses of a batch job that has not finished yet
+PENDING_BATCH_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+
+
+class LocalBatchStore:
+    """
+    Files and batch jobs of the emulator, persisted under temp/local_batch.
+    Each batch job runs in its own thread and appends its results to its output and error files as they complete,
+    so a batch job interrupted by a restart of the emulator resumes where it stopped.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY):
+        self._concurrency = concurrency
+        self._dir = os.path.join(os.path.normpath(
+            os.getcwd() + os.sep + os.pardir), 'temp' + os.sep + 'local_batch')
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self._dir, 'files'), exist_ok=True)
+        os.makedirs(os.path.join(self._dir, 'batches'), exist_ok=True)
+
+        self._files = {name[:-len('.json')]: self._load(os.path.join(self._dir, 'files', name))
+                       for name in os.listdir(os.path.join(self._dir, 'files')) if name.endswith('.json')}
+        self._batches = {name[:-len('.json')]: self._load(os.path.join(self._dir, 'batches', name))
+                         for name in os.listdir(os.path.join(self._dir, 'batches')) if name.endswith('.json')}
+
+        Logger().info(
+            f"Local batch store at {self._dir} with {len(self._files)} files and {len(self._batches)} batch jobs")
+
+    def resume(self) -> None:
+        """
+        Restarts the batch jobs that were running when the emulator stopped.
+        """
+        for batch in self._batches.values():
+            if batch['status'] in PENDING_BATCH_STATUSES:
+                Logger().info(f"Resuming batch job {batch['id']}")
+                threading.Thread(target=self._run_batch, args=(batch['id'],), daemon=True).start()
+
+    def create_file(self, content: bytes, filename: str, purpose: str) -> dict[str, Any]:
+        """
+        Stores an uploaded file.
+
+        Args:
+            content (bytes): the content of the file
+            filename (str): the name of the file
+            purpose (str): the purpose of the file
+
+        Returns:
+            file (dict[str, Any]): the file object
+        """
+        file_id = f'file-{uuid.uuid4().hex}'
+
+        with open(self.get_file_path(file_id), 'wb') as f:
+            f.write(content)
+
+        return self._register_file(file_id, filename, purpose)
+
+    def get_file(self, file_id: str) -> Optional[dict[str, Any]]:
+        """
+        Gets a file object.
+
+        Args:
+            file_id (str): the id of the file
+
+        Returns:
+            file (Optional[dict[str, Any]]): the file object, None if it does not exist
+        """
+        return self._files.get(file_id)
+
+    def get_file_path(self, file_id: str) -> str:
+        """
+        Gets the path of the content of a file.
+
+        Args:
+            file_id (str): the id of the file
+
+        Returns:
+            path (str): the path of the content of the file
+        """
+        return os.path.join(self._dir, 'files', f'{file_id}.jsonl')
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str,
+                     metadata: Optional[dict] = None) -> dict[str, Any]:
+        """
+        Creates a batch job and starts running it.
+
+        Args:
+            input_file_id (str): the id of the batch file
+            endpoint (str): the endpoint of the requests of the batch file
+            completion_window (str): the completion window of the batch job
+            metadata (Optional[dict]): the metadata of the batch job
+
+        Raises:
+            ValueError: if the batch file does not exist
+
+        Returns:
+            batch (dict[str, Any]): the batch object
+        """
+        if input_file_id not in self._files:
+            raise ValueError(f"File {input_file_id} not found.")
+
+        now = int(time.time())
+        batch_id = f'batch_{uuid.uuid4().hex}'
+        batch = {
+            'id': batch_id,
+            'object': 'batch',
+            'endpoint': endpoint,
+            'errors': None,
+            'input_file_id': input_file_id,
+            'completion_window': completion_window,
+            'status': 'validating',
+            'output_file_id': None,
+            'error_file_id': None,
+            'created_at': now,
+            'in_progress_at': None,
+            'expires_at': now + 24 * 3600,
+            'finalizing_at': None,
+            'completed_at': None,
+            'failed_at': None,
+            'cancelling_at': None,
+            'cancelled_at': None,
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+            'metadata': metadata,
+        }
+
+        with self._lock:
+            self._batches[batch_id] = batch
+            self._save_batch(batch)
+
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+
+        Logger().info(f"Created batch job {batch_id} for file {input_file_id}")
+
+        return dict(batch)
+
+    def get_batch(self, batch_id: str) -> Optional[dict[str, Any]]:
+        """
+        Gets a batch object.
+
+        Args:
+            batch_id (str): the id of the batch job
+
+        Returns:
+            batch (Optional[dict[str, Any]]): a copy of the batch object, None if it does not exist
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return json.loads(json.dumps(batch)) if batch is not None else None
+
+    def cancel_batch(self, batch_id: str) -> Optional[dict[str, Any]]:
+        """
+        Cancels a running batch job. Requests in flight complete and the rest are not sent.
+
+        Args:
+            batch_id (str): the id of the batch job
+
+        Returns:
+            batch (Optional[dict[str, Any]]): the batch object, None if it does not exist
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+
+            if batch is not None and batch['status'] in ("validating", "in_progress"):
+                batch['status'] = 'cancelling'
+                batch['cancelling_at'] = int(time.time())
+                self._save_batch(batch)
+
+        return self.get_batch(batch_id)
+
+    # pylint: disable-next=too-many-locals,too-many-statements
+    def _run_batch(self, batch_id: str) -> None:
+        """
+        Runs the requests of a batch job as concurrent chat completions, skipping the requests that already have
+        a result from a previous run of the emulator.
+
+        Args:
+            batch_id (str): the id of the batch job
+        """
+        batch = self._batches[batch_id]
+        input_path = self.get_file_path(batch['input_file_id'])
+        output_file_id = f'file-{batch_id}-output'
+        error_file_id = f'file-{batch_id}-errors'
+        output_path = self.get_file_path(output_file_id)
+        error_path = self.get_file_path(error_file_id)
+
+        try:
+            done = set(read_custom_ids(output_path)) | set(read_custom_ids(error_path))
+
+            with self._lock:
+                batch['request_counts'] = {
+                    'total': sum(1 for _ in read_custom_ids(input_path)),
+                    'completed': len(set(read_custom_ids(output_path))),
+                    'failed': len(set(read_custom_ids(error_path)))
+                }
+                if batch['status'] == 'validating':
+                    batch['status'] = 'in_progress'
+                    batch['in_progress_at'] = int(time.time())
+                self._save_batch(batch)
+
+            def jobs() -> Iterator[dict]:
+                with open(input_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        if batch['status'] == 'cancelling':
+                            return
+
+                        request = json.loads(line)
+                        if request['custom_id'] not in done:
+                            yield {'custom_id': request['custom_id'], **request['body']}
+
+            last_save = [time.monotonic()]
+
+            with open(output_path, 'a', encoding='utf-8') as output, \
+                    open(error_path, 'a', encoding='utf-8') as errors:
+                def save_result(f, result: dict, count: str) -> None:
+                    with self._lock:
+                        f.write(json.dumps(result) + '\n')
+                        f.flush()
+                        batch['request_counts'][count] += 1
+
+                        if time.monotonic() - last_save[0] >= STATE_SAVE_INTERVAL:
+                            last_save[0] = time.monotonic()
+                            self._save_batch(batch)
+
+                def on_complete(completion: ChatCompletion, custom_id: str) -> None:
+                    save_result(output, {
+                        'id': f'batch_req_{uuid.uuid4().hex}',
+                        'custom_id': custom_id,
+                        'response': {
+                            'status_code': 200,
+                            'request_id': completion.id,
+                            'body': completion.to_dict()
+                        },
+                        'error': None
+                    }, 'completed')
+
+                def on_error(error: Exception, custom_id: str) -> None:
+                    save_result(errors, {
+                        'id': f'batch_req_{uuid.uuid4().hex}',
+                        'custom_id': custom_id,
+                        'response': {
+                            'status_code': getattr(error, 'status_code', 500),
+                            'request_id': None,
+                            'body': {'error': {'code': getattr(error, 'code', None) or 'server_error',
+                                               'message': str(error)}}
+                        },
+                        'error': None
+                    }, 'failed')
+
+                chat_completions_stream(jobs(), concurrency=self._concurrency,
+                                        on_complete=on_complete, on_error=on_error)
+
+            with self._lock:
+                batch['output_file_id'] = self._register_file(
+                    output_file_id, f'{batch_id}_output.jsonl', 'batch_output')['id']
+                if batch['request_counts']['failed'] > 0:
+                    batch['error_file_id'] = self._register_file(
+                        error_file_id, f'{batch_id}_errors.jsonl', 'batch_output')['id']
+
+                if batch['status'] == 'cancelling':
+                    batch['status'] = 'cancelled'
+                    batch['cancelled_at'] = int(time.time())
+                else:
+                    batch['status'] = 'completed'
+                    batch['finalizing_at'] = batch['completed_at'] = int(time.time())
+                self._save_batch(batch)
+
+            Logger().info(f"Batch job {batch_id} finished with status {batch['status']}: {batch['request_counts']}")
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            Logger().error(f"Batch job {batch_id} failed: {e}")
+
+            with self._lock:
+                batch['status'] = 'failed'
+                batch['failed_at'] = int(time.time())
+                batch['errors'] = {'object': 'list', 'data': [{'code': 'server_error', 'message': str(e)}]}
+                self._save_batch(batch)
+
+    def _register_file(self, file_id: str, filename: str, purpose: str) -> dict[str, Any]:
+        """
+        Stores the metadata of a file whose content is already on disk.
+
+        Args:
+            file_id (str): the id of the file
+            filename (str): the name of the file
+            purpose (str): the purpose of the file
+
+        Returns:
+            file (dict[str, Any]): the file object
+        """
+        file = {
+            'id': file_id,
+            'object': 'file',
+            'bytes': os.path.getsize(self.get_file_path(file_id)),
+            'created_at': int(time.time()),
+            'filename': filename,
+            'purpose': purpose,
+            'status': 'processed',
+        }
+
+        write_json(os.path.join(self._dir, 'files', f'{file_id}.json'), file)
+        self._files[file_id] = file
+
+        return file
+
+    def _save_batch(self, batch: dict[str, Any]) -> None:
+        """
+        Writes the state of a batch job to disk. Must be called with the lock held.
+
+        Args:
+            batch (dict[str, Any]): the batch object
+        """
+        write_json(os.path.join(self._dir, 'batches', f"{batch['id']}.json"), batch)
+
+    def _load(self, path: str) -> dict[str, Any]:
+        """
+        Loads a file or batch object from disk.
+
+        Args:
+            path (str): the path of the object
+
+        Returns:
+            obj (dict[str, Any]): the object
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+class LocalBatchHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler of the /files and /batches endpoints of the OpenAI API. Paths may be prefixed with /v1.
+    """
+
+    server: Any
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Handles GET /files/{id}, GET /files/{id}/content and GET /batches/{id}.
+        """
+        store: LocalBatchStore = self.server.store
+
+        if match := re.fullmatch(r'(?:/v1)?/files/([^/]+)/content', self.path):
+            if store.get_file(match.group(1)) is None:
+                self._send_error(404, f"File {match.group(1)} not found.")
+                return
+
+            self._send_file(store.get_file_path(match.group(1)))
+        elif match := re.fullmatch(r'(?:/v1)?/files/([^/]+)', self.path):
+            self._send_object(store.get_file(match.group(1)))
+        elif match := re.fullmatch(r'(?:/v1)?/batches/([^/]+)', self.path):
+            self._send_object(store.get_batch(match.group(1)))
+        else:
+            self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """
+        Handles POST /files, POST /batches and POST /batches/{id}/cancel.
+        """
+        store: LocalBatchStore = self.server.store
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        try:
+            if re.fullmatch(r'(?:/v1)?/files', self.path):
+                fields = parse_multipart(self.headers.get('Content-Type', ''), body)
+                filename, content = fields['file']
+                self._send_object(store.create_file(content, filename or 'batch.jsonl',
+                                                    fields.get('purpose', (None, b'batch'))[1].decode('utf-8')))
+            elif re.fullmatch(r'(?:/v1)?/batches', self.path):
+                request = json.loads(body)
+                self._send_object(store.create_batch(request['input_file_id'], request['endpoint'],
+                                                     request['completion_window'], request.get('metadata')))
+            elif match := re.fullmatch(r'(?:/v1)?/batches/([^/]+)/cancel', self.path):
+                self._send_object(store.cancel_batch(match.group(1)))
+            else:
+                self._send_error(404, f"Unknown path {self.path}")
+        except (KeyError, ValueError) as e:
+            self._send_error(400, f"Invalid request: {e}")
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        Logger().debug(f"{self.address_string()} - {format % args}")
+
+    def _send_object(self, obj: Optional[dict[str, Any]]) -> None:
+        """
+        Sends an object as a JSON response, or a 404 error if it does not exist.
+
+        Args:
+            obj (Optional[dict[str, Any]]): the object
+        """
+        if obj is None:
+            self._send_error(404, f"Object not found: {self.path}")
+            return
+
+        content = json.dumps(obj).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_file(self, path: str) -> None:
+        """
+        Streams the content of a file as the response.
+
+        Args:
+            path (str): the path of the file
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                self.wfile.write(chunk)
+
+    def _send_error(self, status_code: int, message: str) -> None:
+        """
+        Sends an error response in the format of the OpenAI API.
+
+        Args:
+            status_code (int): the HTTP status code
+            message (str): the error message
+        """
+        content = json.dumps({'error': {'message': message, 'type': 'invalid_request_error'}}).encode('utf-8')
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict[str, tuple[Optional[str], bytes]]:
+    """
+    Parses a multipart/form-data request body.
+
+    Args:
+        content_type (str): the Content-Type header of the request, including its boundary
+        body (bytes): the request body
+
+    Raises:
+        ValueError: if the body is not multipart
+
+    Returns:
+        fields (dict[str, tuple[Optional[str], bytes]]): the file name, if any, and the content of each field
+    """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body)
+
+    if not message.is_multipart():
+        raise ValueError("Expected a multipart/form-data body.")
+
+    return {
+        part.get_param('name', header='content-disposition'): (part.get_filename(), part.get_payload(decode=True))
+        for part in message.iter_parts()  # type: ignore
+    }
+
+
+def read_custom_ids(path: str) -> Iterator[str]:
+    """
+    Reads the custom ids of the lines of a batch input, output or error file, skipping a truncated last line.
+
+    Args:
+        path (str): the path of the file
+
+    Returns:
+        custom_ids (Iterator[str]): the custom ids
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)['custom_id']
+            except json.JSONDecodeError:
+                continue
+
+
+def write_json(path: str, obj: dict[str, Any]) -> None:
+    """
+    Writes an object to a JSON file atomically, so that a crash never leaves a truncated file.
+
+    Args:
+        path (str): the path of the file
+        obj (dict[str, Any]): the object
+    """
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+
+    os.replace(path + '.tmp', path)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='local-batch-server',
+        description='Emulate the OpenAI Batch API with concurrent chat completions against LLM_ENDPOINT'
+    )
+
+    parser.add_argument('-H', '--host', type=str, default='127.0.0.1',
+                        help='host to listen on (optional)')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help='port to listen on (optional)')
+    parser.add_argument('-cc', '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='maximum number of chat completion requests in flight for each batch job (optional)')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    """
+    Starts the emulator and resumes the batch jobs that were running when it stopped.
+    """
+    load_dotenv()
+
+    # Requests of the emulator itself go to the chat completions endpoint, never back to the emulator
+    os.environ.pop('LLM_BATCH_ENDPOINT', None)
+
+    args = parse_args()
+
+    store = LocalBatchStore(args.concurrency)
+    store.resume()
+
+    server = ThreadingHTTPServer((args.host, args.port), LocalBatchHandler)
+    server.daemon_threads = True
+    setattr(server, 'store', store)
+
+    Logger().info(f"Local batch server listening on http://{args.host}:{args.port}/v1")
+    print(f"Local batch server listening on http://{args.host}:{args.port}/v1")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
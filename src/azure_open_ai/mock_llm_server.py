@@ -0,0 +1,364 @@
+"""
+Deterministic mock of an OpenAI-compatible chat completions server to benchmark the whole pipeline offline.
+Answers are derived from the gold answers of a dataset, and latency, generation speed and errors are simulated.
+
+Usage (from the src folder):
+    python -m azure_open_ai.mock_llm_server -d hotpot -l 100 -p 8000 -lt lognormal -lm 800 -tps 60 -e429 0.05
+
+Then set LLM_ENDPOINT=http://localhost:8000/v1 (without REMOTE_LLM=1) so that the OpenAI client sends its
+chat completions to the mock.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from dotenv import load_dotenv
+
+from data.hotpot.hotpot import Hotpot
+from data.locomo.locomo import Locomo
+from data.musique.musique import MuSiQue
+from data.twowikimultihopqa.two_wiki import TwoWiki
+from logger.logger import Logger
+from models.dataset import Dataset
+from utils.arg_utils import add_dataset_args
+from utils.hash_utils import get_content_hash
+from utils.tokenizer import normalize
+
+# Default port of the mock, the same as a local VLLM server
+DEFAULT_PORT = 8000
+# Answer of the questions that are not in the dataset or that are answered wrongly on purpose
+UNKNOWN_ANSWER = "I don't know"
+# Rough number of characters per token, used instead of a tokenizer to keep the mock cheap
+CHARS_PER_TOKEN = 4
+# Number of requests between two logs of the statistics of the mock
+STATS_LOG_INTERVAL = 1_000
+# Prefix of the user message of a question of a batch of questions of the default agent
+BATCH_QUESTION_PATTERN = re.compile(r'^Q \((.+?)\): (.*)$', re.MULTILINE)
+# Expected answer in the system message of the judge evaluation
+JUDGE_ANSWER_PATTERN = re.compile(r'The expected answer is: (.*?)\. Please answer with', re.DOTALL)
+
+
+# pylint: disable-next=too-few-public-methods
+class MockLLM:
+    """
+    Generates the responses of the mock and decides their latency and injected errors.
+    Every random decision is drawn from a generator seeded with the seed of the mock, the content of the request
+    and the number of times the same request was received, so a run is reproducible regardless of the order in
+    which concurrent requests arrive, and retries of a failed request can succeed.
+    """
+
+    def __init__(self, answers: dict[str, list[str]], args: argparse.Namespace):
+        self._answers = answers
+        self._args = args
+        self._attempts: dict[str, int] = {}
+        self._stats = {'requests': 0, '429': 0, '5xx': 0}
+        self._lock = threading.Lock()
+
+    def handle(self, request: dict[str, Any]) -> tuple[int, dict[str, Any], dict[str, str], float]:
+        """
+        Handles a chat completion request.
+
+        Args:
+            request (dict[str, Any]): the body of the request
+
+        Returns:
+            response (tuple[int, dict[str, Any], dict[str, str], float]): the status code, the body and the \
+headers of the response, and the number of seconds to wait before sending it
+        """
+        key = get_content_hash(json.dumps(request, sort_keys=True))
+
+        with self._lock:
+            attempt = self._attempts[key] = self._attempts.get(key, 0) + 1
+            self._stats['requests'] += 1
+            if self._stats['requests'] % STATS_LOG_INTERVAL == 0:
+                Logger().info(f"Mock LLM stats: {self._stats}")
+
+        rng = random.Random(f'{self._args.seed}:{key}:{attempt}')
+        latency = self._sample_latency(rng)
+
+        if rng.random() < self._args.error_429:
+            with self._lock:
+                self._stats['429'] += 1
+            return 429, error_body('Rate limit exceeded', 'rate_limit_exceeded'), \
+                {'retry-after-ms': str(self._args.retry_after_ms)}, latency / 10.0
+
+        if rng.random() < self._args.error_5xx:
+            with self._lock:
+                self._stats['5xx'] += 1
+            return rng.choice([500, 502, 503]), error_body('Internal server error', 'server_error'), {}, latency
+
+        content = self._answer(request, rng)
+        prompt_tokens = sum(len(str(message.get('content') or '')) for message in request.get('messages', [])) \
+            // CHARS_PER_TOKEN
+        completion_tokens = max(1, len(content) // CHARS_PER_TOKEN)
+
+        body = {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model'),
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content}
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+                'prompt_tokens_details': {'cached_tokens': 0}
+            }
+        }
+
+        return 200, body, {}, latency + completion_tokens / self._args.tokens_per_second
+
+    def _answer(self, request: dict[str, Any], rng: random.Random) -> str:
+        """
+        Generates the content of the response from the gold answers.
+
+        Args:
+            request (dict[str, Any]): the body of the request
+            rng (random.Random): the random generator of the request
+
+        Returns:
+            content (str): the content of the response
+        """
+        messages = request.get('messages', [])
+        system = next((str(m.get('content')) for m in messages if m.get('role') == 'system'), '')
+        user = next((str(m.get('content')) for m in reversed(messages) if m.get('role') == 'user'), '')
+
+        # Judge evaluation: the expected answer is in the system message and the answer to judge is the user message
+        if match := JUDGE_ANSWER_PATTERN.search(system):
+            expected, actual = normalize(match.group(1)), normalize(user)
+            return 'Yes' if len(expected) > 0 and expected in actual else 'No'
+
+        # Batch of questions of the default agent answered with structured outputs
+        if request.get('response_format') is not None:
+            return json.dumps({'result': [
+                {'question_id': question_id, 'answer': self._gold_answer(question, rng)}
+                for question_id, question in BATCH_QUESTION_PATTERN.findall(user)
+            ]})
+
+        return self._gold_answer(user, rng)
+
+    def _gold_answer(self, question: str, rng: random.Random) -> str:
+        """
+        Gets the gold answer of a question, which is answered wrongly with a probability of 1 - accuracy.
+
+        Args:
+            question (str): the question
+            rng (random.Random): the random generator of the request
+
+        Returns:
+            answer (str): the answer
+        """
+        answers = self._answers.get(question.strip())
+
+        if answers is None or rng.random() >= self._args.accuracy:
+            return UNKNOWN_ANSWER
+
+        return answers[0]
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        """
+        Samples the time to first token of a request from the latency distribution.
+
+        Args:
+            rng (random.Random): the random generator of the request
+
+        Returns:
+            latency (float): the latency in seconds
+        """
+        mean = self._args.latency_ms / 1000.0
+
+        if self._args.latency_distribution == 'uniform':
+            return rng.uniform(0.0, 2.0 * mean)
+        if self._args.latency_distribution == 'exponential':
+            return rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        if self._args.latency_distribution == 'lognormal':
+            # Lognormal with the given mean and a long tail, like the latency of a loaded deployment
+            sigma = 0.75
+            return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma) if mean > 0 else 0.0
+
+        return mean
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler of the /chat/completions and /models endpoints of the OpenAI API. Paths may be prefixed with /v1.
+    """
+
+    server: Any
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Handles GET /models.
+        """
+        if re.fullmatch(r'(?:/v1)?/models', self.path):
+            self._send(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+        else:
+            self._send(404, error_body(f"Unknown path {self.path}", 'not_found'))
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """
+        Handles POST /chat/completions.
+        """
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if not re.fullmatch(r'(?:/v1)?/chat/completions', self.path):
+            self._send(404, error_body(f"Unknown path {self.path}", 'not_found'))
+            return
+
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError as e:
+            self._send(400, error_body(f"Invalid request: {e}", 'invalid_request_error'))
+            return
+
+        status_code, response, headers, delay = self.server.llm.handle(request)
+
+        time.sleep(delay)
+
+        self._send(status_code, response, headers)
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        Logger().debug(f"{self.address_string()} - {format % args}")
+
+    def _send(self, status_code: int, body: dict[str, Any], headers: Optional[dict[str, str]] = None) -> None:
+        """
+        Sends a JSON response.
+
+        Args:
+            status_code (int): the HTTP status code
+            body (dict[str, Any]): the body of the response
+            headers (Optional[dict[str, str]]): additional headers of the response
+        """
+        content = json.dumps(body).encode('utf-8')
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def error_body(message: str, code: str) -> dict[str, Any]:
+    """
+    Builds the body of an error response in the format of the OpenAI API.
+
+    Args:
+        message (str): the error message
+        code (str): the error code
+
+    Returns:
+        body (dict[str, Any]): the body of the error response
+    """
+    return {'error': {'message': message, 'type': code, 'code': code}}
+
+
+def load_answers(args: argparse.Namespace) -> dict[str, list[str]]:
+    """
+    Loads the gold answers of the questions of a dataset by question.
+
+    Args:
+        args (argparse.Namespace): the arguments of the mock, including the dataset filters
+
+    Returns:
+        answers (dict[str, list[str]]): the gold answers by question
+    """
+    datasets: dict[str, type[Dataset]] = {
+        'locomo': Locomo,
+        'hotpot': Hotpot,
+        '2wiki': TwoWiki,
+        'musique': MuSiQue,
+    }
+
+    dataset = datasets[args.dataset](args)
+    dataset.read()
+
+    answers = {str(qa['question']).strip(): [str(answer) for answer in qa['answer']]
+               for question_set in dataset.get_questions().values() for qa in question_set}
+
+    Logger().info(f"Loaded gold answers of {len(answers)} questions from the {args.dataset} dataset")
+
+    return answers
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='mock-llm-server',
+        description='Serve deterministic chat completions derived from the gold answers of a dataset'
+    )
+
+    parser.add_argument('-H', '--host', type=str, default='127.0.0.1',
+                        help='host to listen on (optional)')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help='port to listen on (optional)')
+
+    # Dataset arguments, the same as the ones of the script, whose gold answers are used to answer the questions
+    add_dataset_args(parser)
+
+    # Simulation arguments
+    parser.add_argument('-lt', '--latency-distribution', choices=['constant', 'uniform', 'exponential', 'lognormal'],
+                        default='constant', help='distribution of the time to first token (optional)')
+    parser.add_argument('-lm', '--latency-ms', type=float, default=500.0,
+                        help='mean time to first token in milliseconds (optional)')
+    parser.add_argument('-tps', '--tokens-per-second', type=float, default=50.0,
+                        help='generation speed of the completion tokens of each request (optional)')
+    parser.add_argument('-e429', '--error-429', type=float, default=0.0,
+                        help='probability of a 429 error with a retry-after-ms header (optional)')
+    parser.add_argument('-ra', '--retry-after-ms', type=int, default=1_000,
+                        help='value of the retry-after-ms header of 429 errors (optional)')
+    parser.add_argument('-e5xx', '--error-5xx', type=float, default=0.0,
+                        help='probability of a 500, 502 or 503 error (optional)')
+    parser.add_argument('-acc', '--accuracy', type=float, default=1.0,
+                        help='probability of answering a question with its gold answer (optional)')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='seed of the random decisions of the mock (optional)')
+
+    args = parser.parse_args()
+    # Datasets read the model to choose their prompts
+    args.model = None
+
+    return args
+
+
+def main() -> None:
+    """
+    Starts the mock.
+    """
+    load_dotenv()
+
+    args = parse_args()
+
+    llm = MockLLM(load_answers(args), args)
+
+    with ThreadingHTTPServer((args.host, args.port), MockLLMHandler) as server:
+        server.daemon_threads = True
+        setattr(server, 'llm', llm)
+
+        Logger().info(f"Mock LLM server listening on http://{args.host}:{args.port}/v1 with {vars(args)}")
+        print(f"Mock LLM server listening on http://{args.host}:{args.port}/v1")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            Logger().info("Mock LLM server stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 """A module to create a singleton instance of the Azure OpenAI client."""
 import os
-from openai import AzureOpenAI, Timeout
+from openai import AsyncAzureOpenAI, AsyncOpenAI, AzureOpenAI, Timeout
 from openai import OpenAI
 
 from logger.logger import Logger
@@ -14,6 +14,7 @@ class OpenAIClient(metaclass=Singleton):
 
     def __init__(self):
         self._client = None
+        self._async_client_factory = None
         self.initialize_client()
 
     def initialize_client(self):
@@ -36,6 +37,12 @@ class OpenAIClient(metaclass=Singleton):
                     api_key='PLACEHOLDER',
                     timeout=Timeout(180.0),
                 )
+                self._async_client_factory = lambda: AsyncOpenAI(
+                    base_url=llm_endpoint,
+                    api_key='PLACEHOLDER',
+                    timeout=Timeout(180.0),
+                    max_retries=0,
+                )
             else:
                 azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or ""
                 api_key = os.getenv("AZURE_OPENAI_API_KEY")
@@ -47,6 +54,23 @@ class OpenAIClient(metaclass=Singleton):
                     api_key=api_key,
                     api_version=api_version
                 )
+                self._async_client_factory = lambda: AsyncAzureOpenAI(
+                    azure_endpoint=azure_endpoint,
+                    api_key=api_key,
+                    api_version=api_version,
+                    max_retries=0,
+                )
+
+            llm_batch_endpoint = os.getenv("LLM_BATCH_ENDPOINT", None)
+
+            # The client is only used for files and batches, which can be served by the local batch server
+            if llm_batch_endpoint is not None and len(llm_batch_endpoint) > 0:
+                Logger().info(f"Using custom LLM batch endpoint: {llm_batch_endpoint}")
+                self._client = OpenAI(
+                    base_url=llm_batch_endpoint,
+                    api_key='PLACEHOLDER',
+                    timeout=Timeout(180.0),
+                )
 
     def get_client(self):
         """
@@ -56,3 +80,14 @@ class OpenAIClient(metaclass=Singleton):
             client (AzureOpenAI): A singleton instance of the Azure OpenAI client.
         """
         return self._client
+
+    def get_async_client(self):
+        """
+        Creates a new async Azure OpenAI client with the same configuration as the client.
+        A new client is created on each call since its connections are bound to the running event loop, and
+        it does not retry failed requests since its callers handle retries themselves.
+
+        Returns:
+            client (AsyncAzureOpenAI): A new instance of the async Azure OpenAI client.
+        """
+        return self._async_client_factory() if self._async_client_factory else None
@@ -0,0 +1,175 @@
+"""Rate limiter for the requests per minute (RPM) and tokens per minute (TPM) quotas of a deployment."""
+import asyncio
+import time
+from typing import Optional
+from openai import APIStatusError
+from logger.logger import Logger
+from utils.model_utils import get_rate_limits
+from utils.token_utils import estimate_num_tokens
+
+# Quotas are enforced over short windows, so only a few seconds worth of quota can be spent at once
+BURST_SECONDS = 10.0
+
+
+class TokenBucket:
+    """
+    Token bucket that refills continuously at a rate of limit per minute, holding at most BURST_SECONDS
+    worth of quota.
+    """
+
+    def __init__(self, limit: int):
+        self._rate = limit / 60.0
+        self._capacity = max(1.0, self._rate * BURST_SECONDS)
+        self._level = self._capacity
+        self._last = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Computes how long to wait until the bucket holds the given amount.
+        Amounts larger than the capacity only wait until the bucket is full so that they are never starved.
+
+        Args:
+            amount (float): the amount to take from the bucket
+            now (float): the current monotonic time
+
+        Returns:
+            wait_time (float): the number of seconds to wait
+        """
+        self._level = min(self._capacity, self._level + (now - self._last) * self._rate)
+        self._last = now
+
+        return max(0.0, min(amount, self._capacity) - self._level) / self._rate
+
+    def consume(self, amount: float) -> None:
+        """
+        Takes the given amount from the bucket. The level can become negative for amounts larger than the capacity,
+        which delays the requests that follow.
+
+        Args:
+            amount (float): the amount to take from the bucket
+        """
+        self._level -= amount
+
+
+class RateLimiter:
+    """
+    Rate limiter for a deployment that reserves quota before each request, so that requests are delayed
+    client side instead of being rejected with 429 errors.
+    The limiter must only be used from a single event loop.
+    """
+
+    def __init__(self, rpm: Optional[int], tpm: Optional[int]):
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._waited = 0.0
+
+    async def acquire(self, num_tokens: int) -> None:
+        """
+        Waits until the deployment has quota for one more request with the given number of tokens and reserves it.
+        Requests acquire quota in the order in which they ask for it.
+
+        Args:
+            num_tokens (int): the estimated number of tokens of the request
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self._paused_until - now,
+                    self._requests.wait_time(1, now) if self._requests else 0.0,
+                    self._tokens.wait_time(num_tokens, now) if self._tokens else 0.0,
+                )
+
+                if wait <= 0:
+                    break
+
+                self._waited += wait
+                await asyncio.sleep(wait)
+
+            if self._requests:
+                self._requests.consume(1)
+            if self._tokens:
+                self._tokens.consume(num_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops granting quota for the given number of seconds, e.g., when the server responds with a retry-after
+        header.
+
+        Args:
+            seconds (float): the number of seconds to pause
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def get_waited_time(self) -> float:
+        """
+        Gets the total time spent by requests waiting for quota.
+
+        Returns:
+            waited_time (float): the total waiting time in seconds
+        """
+        return self._waited
+
+
+def get_rate_limiter(model: str) -> RateLimiter:
+    """
+    Creates a rate limiter with the quotas of the given deployment.
+
+    Args:
+        model (str): the model deployment identifier
+
+    Returns:
+        rate_limiter (RateLimiter): the rate limiter of the deployment
+    """
+    rpm, tpm = get_rate_limits(model)
+
+    Logger().info(f"Rate limits for {model}: {rpm or 'unlimited'} RPM, {tpm or 'unlimited'} TPM")
+
+    return RateLimiter(rpm, tpm)
+
+
+def estimate_request_tokens(job: dict) -> int:
+    """
+    Estimates the number of tokens a chat completion job counts against the TPM quota, which includes the prompt
+    tokens and the maximum number of completion tokens.
+
+    Args:
+        job (dict): the chat completion job
+
+    Returns:
+        num_tokens (int): the estimated number of tokens of the job
+    """
+    prompt_tokens = sum(estimate_num_tokens(message['content'], job['model'])
+                        for message in job['messages'] if isinstance(message.get('content'), str))
+
+    return prompt_tokens + int(job.get('max_completion_tokens') or 0)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Gets the number of seconds to wait before retrying from the retry-after-ms or retry-after headers of an error
+    response.
+
+    Args:
+        error (Exception): the error raised by the request
+
+    Returns:
+        retry_after (Optional[float]): the number of seconds to wait if the server provided it
+    """
+    if not isinstance(error, APIStatusError):
+        return None
+
+    headers = error.response.headers
+
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except ValueError:
+        # retry-after can also be an HTTP date, in which case the backoff delay is used
+        return None
+
+    return None
@@ -0,0 +1,255 @@
+"""Persistent cache of chat completion responses keyed by the content of the request."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+from logger.logger import Logger
+from utils.hash_utils import get_content_hash
+from utils.singleton import Singleton
+
+# Maximum number of responses kept in the cache. The least recently used responses are evicted first
+DEFAULT_MAX_ENTRIES = 200_000
+# Number of writes between two checks of the size of the cache
+EVICTION_INTERVAL = 1_000
+
+
+def get_cache_key(job: dict) -> str:
+    """
+    Gets the cache key of a chat completion job from the request parameters that determine its response.
+
+    Args:
+        job (dict): the chat completion job, either the body of a batch job or a job of chat_completions
+
+    Returns:
+        key (str): the cache key of the job
+    """
+    return get_content_hash(json.dumps({
+        'model': job.get('model'),
+        'messages': job.get('messages'),
+        'temperature': job.get('temperature'),
+        'stop': job.get('stop'),
+        'max_tokens': job.get('max_completion_tokens', job.get('max_tokens')),
+        'response_format': job.get('response_format'),
+    }, sort_keys=True))
+
+
+class ResponseCache(metaclass=Singleton):
+    """
+    SQLite cache of chat completion responses stored under the temp folder.
+    The database uses write-ahead logging so that each write is an atomic transaction that does not block readers,
+    and it is safe to use from multiple threads.
+    The cache can be disabled by setting the DISABLE_LLM_CACHE environment variable to 1.
+    """
+
+    def __init__(self):
+        self._max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)))
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        # Cache key of the batch jobs waiting for their results by custom id
+        self._pending: dict[str, str] = {}
+        self._conn = None
+
+        if os.getenv("DISABLE_LLM_CACHE", None) == "1":
+            Logger().info("LLM response cache is disabled")
+            return
+
+        cache_dir = os.path.join(os.path.normpath(
+            os.getcwd() + os.sep + os.pardir), 'temp' + os.sep + 'llm_cache')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, 'responses.sqlite'), check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, last_access REAL NOT NULL)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Gets the cached response of a request.
+
+        Args:
+            key (str): the cache key of the request
+
+        Returns:
+            response (Optional[dict]): the chat completion response if it is cached, None otherwise
+        """
+        if self._conn is None:
+            return None
+
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+
+        return json.loads(row[0])
+
+    def put(self, key: str, response: dict) -> None:
+        """
+        Caches the response of a request.
+
+        Args:
+            key (str): the cache key of the request
+            response (dict): the chat completion response
+        """
+        self.put_many([(key, response)])
+
+    def put_many(self, responses: list[tuple[str, dict]]) -> None:
+        """
+        Caches the responses of several requests in a single transaction, evicting the least recently used
+        responses when the cache grows beyond its maximum size.
+
+        Args:
+            responses (list[tuple[str, dict]]): the cache key and the chat completion response of each request
+        """
+        if self._conn is None or len(responses) == 0:
+            return
+
+        now = time.time()
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO responses (key, response, last_access) VALUES (?, ?, ?)",
+                [(key, json.dumps(response), now) for key, response in responses])
+
+            self._writes += len(responses)
+            if self._writes >= EVICTION_INTERVAL:
+                self._writes = 0
+                self._evict()
+
+    def _evict(self) -> None:
+        """
+        Deletes the least recently used responses beyond the maximum size of the cache.
+        Must be called within a transaction.
+        """
+        size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]  # type: ignore
+
+        if size > self._max_entries:
+            self._conn.execute(  # type: ignore
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (size - self._max_entries,))
+            Logger().info(f"Evicted {size - self._max_entries} responses from the LLM response cache")
+
+    def register_pending(self, keys: dict[str, str]) -> None:
+        """
+        Registers the cache keys of batch jobs so that their responses are cached once the batch completes.
+
+        Args:
+            keys (dict[str, str]): the cache key of each batch job by custom id
+        """
+        if self._conn is None:
+            return
+
+        self._pending.update(keys)
+
+    def store_batch_results(self, results: Iterable[dict]) -> None:
+        """
+        Caches the successful responses of a batch output file whose jobs were registered as pending.
+        Failed jobs stay registered, so their responses are cached if they are queued again and succeed.
+
+        Args:
+            results (Iterable[dict]): the results of the batch output file
+        """
+        if self._conn is None:
+            return
+
+        responses = []
+        for result in results:
+            response = result.get('response') or {}
+
+            if response.get('status_code') == 200:
+                key = self._pending.pop(str(result.get('custom_id')), None)
+                if key is not None:
+                    responses.append((key, response['body']))
+
+        self.put_many(responses)
+
+        Logger().info(f"Cached {len(responses)} responses from the batch output")
+
+    def log_stats(self) -> None:
+        """
+        Logs the hit rate of the cache.
+        """
+        if self._conn is None:
+            return
+
+        lookups = self._hits + self._misses
+        Logger().info(
+            f"LLM response cache: {self._hits} hits, {self._misses} misses \
+({100.0 * self._hits / max(1, lookups):.2f}% hit rate)")
+
+
+def split_cached_jobs(jobs: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    Splits batch jobs into the ones whose responses are cached, which are returned as batch output results, and
+    the ones that still need to be sent. The cache keys of the jobs to be sent are registered as pending, so that
+    their responses are cached once their batch completes without serializing the jobs again.
+
+    Args:
+        jobs (list[dict]): the batch jobs
+
+    Returns:
+        result (tuple[list[dict], list[dict]]): the cached results in the format of a batch output file and the \
+pending jobs
+    """
+    cache = ResponseCache()
+
+    cached_results = []
+    pending_jobs = []
+    pending_keys = {}
+
+    for job in jobs:
+        key = get_cache_key(job['body'])
+        response = cache.get(key)
+
+        if response is None:
+            pending_jobs.append(job)
+            pending_keys[str(job['custom_id'])] = key
+            continue
+
+        cached_results.append({
+            "custom_id": job['custom_id'],
+            "response": {
+                "status_code": 200,
+                "body": response
+            }
+        })
+
+    cache.register_pending(pending_keys)
+    cache.log_stats()
+
+    return cached_results, pending_jobs
+
+
+def write_cached_results(cached_results: list[dict], output_path: str) -> None:
+    """
+    Appends the cached results to a batch output file.
+
+    Args:
+        cached_results (list[dict]): the cached results in the format of a batch output file
+        output_path (str): the path of the batch output file
+    """
+    if len(cached_results) == 0:
+        return
+
+    with open(output_path, 'a', encoding='utf-8') as f:
+        for result in cached_results:
+            f.write(json.dumps(result) + '\n')
+
+    Logger().info(f"Saved {len(cached_results)} cached results to {output_path}")
@@ -10,6 +10,6 @@ if __name__ == "__main__":
     # Read the hotpot dataset
     generate_corpus(
         input_path='hotpot_dev_distractor_v1.json',
-        output_path='hotpot_corpus.json',
+        output_path='hotpot_corpus.jsonl',
         context_extractor=lambda context: { 'title': context[0], 'text': ''.join(context[1]) }
     )
@@ -1,8 +1,8 @@
 """Locomo dataset module."""
 
-import json
 import os
 import re
+from itertools import islice
 from typing import Optional
 
 from logger.logger import Logger
@@ -10,6 +10,7 @@ from models.dataset import Dataset, DatasetSample, DatasetSampleInstance
 from models.document import Document
 from models.question_answer import QuestionAnswer, QuestionCategory
 from utils.hash_utils import get_content_hash
+from utils.json_utils import iter_json_records
 from utils.question_utils import filter_questions
 
 
@@ -59,12 +60,24 @@ class Locomo(Dataset):
 
     def __init__(self, args):
         super().__init__(args, name="locomo")
-        # Override the default prompts
-        self._prompt_dict = {
+        Logger().info("Initialized an instance of the Locomo dataset")
+
+    # @override
+    @classmethod
+    def get_prompts(cls, model: Optional[str]) -> dict[str, str]:
+        """
+        Gets the prompts of the Locomo dataset, which override the default prompts for all the models.
+
+        Args:
+            model (Optional[str]): the model the prompts are built for, if any
+
+        Returns:
+            prompts (dict[str, str]): the prompts by prompt id
+        """
+        return {
             'qa_rel': QA_PROMPT_RELEVANT,
             'qa_all': QA_PROMPT_ALL
         }
-        Logger().info("Initialized an instance of the Locomo dataset")
 
     # @override
     def read(self) -> list[DatasetSample]:
@@ -78,44 +91,42 @@ class Locomo(Dataset):
         conversation_id = self._args.conversation
         file_path = os.path.join("data", "locomo", "locomo10.json")
 
-        with open(file_path, "r", encoding="utf-8") as locomo_dataset:
-            dataset = [
-                DatasetSample(
-                    sample_id=cs['sample_id'],
-                    sample=DatasetSampleInstance(
-                        qa=filter_questions([QuestionAnswer(
-                            docs=[Document(
-                                doc_id=f'{ev}:{cs["sample_id"]}',
-                                folder_id=cs['sample_id'],
-                                content=format_content(
-                                    date=cs['conversation'][f'{session_id(ev)}_date_time'],
-                                    message=dia_idx(ev) + 1,
-                                    speaker=cs['conversation'][session_id(
-                                        ev)][dia_idx(ev)]['speaker'],
-                                    text=cs['conversation'][session_id(
-                                        ev)][dia_idx(ev)]['text'],
-                                    alt_text=cs['conversation'][session_id(ev)][dia_idx(ev)].get('blip_caption'))
-                            )
-                                for ev in qa['evidence']
-                                if session_id(ev) in cs['conversation'] and dia_idx(ev) <
-                                len(cs['conversation'][session_id(ev)])],
-                            question_id=f'{cs["sample_id"]}-{get_content_hash(qa["question"])}',
-                            question=qa['question'],
-                            answer=[str(qa.get('answer')) or str(qa.get(
-                                'adversarial_answer'))],
-                            category=QuestionCategory(qa['category'])
-                        ) for _, qa in enumerate(cs['qa'])], self._args.questions, self._args.category)
-                    )
+        dataset = super()._read_cached(file_path, lambda: (
+            DatasetSample(
+                sample_id=cs['sample_id'],
+                sample=DatasetSampleInstance(
+                    qa=filter_questions([QuestionAnswer(
+                        docs=[Document(
+                            doc_id=f'{ev}:{cs["sample_id"]}',
+                            folder_id=cs['sample_id'],
+                            content=format_content(
+                                date=cs['conversation'][f'{session_id(ev)}_date_time'],
+                                message=dia_idx(ev) + 1,
+                                speaker=cs['conversation'][session_id(
+                                    ev)][dia_idx(ev)]['speaker'],
+                                text=cs['conversation'][session_id(
+                                    ev)][dia_idx(ev)]['text'],
+                                alt_text=cs['conversation'][session_id(ev)][dia_idx(ev)].get('blip_caption'))
+                        )
+                            for ev in qa['evidence']
+                            if session_id(ev) in cs['conversation'] and dia_idx(ev) <
+                            len(cs['conversation'][session_id(ev)])],
+                        question_id=f'{cs["sample_id"]}-{get_content_hash(qa["question"])}',
+                        question=qa['question'],
+                        answer=[str(qa.get('answer')) or str(qa.get(
+                            'adversarial_answer'))],
+                        category=QuestionCategory(qa['category'])
+                    ) for _, qa in enumerate(cs['qa'])], self._args.questions, self._args.category)
                 )
-                for cs in json.load(locomo_dataset)
-                if conversation_id is None or cs['sample_id'] == conversation_id
-            ]
-            dataset = super().process_dataset(dataset)
+            )
+            for cs in iter_json_records(file_path)
+            if conversation_id is None or cs['sample_id'] == conversation_id
+        ))
 
-            Logger().info(
-                f"Locomo dataset read successfully. Total samples: {len(dataset)}")
+        Logger().info(
+            f"Locomo dataset read successfully. Total samples: {len(dataset)}")
 
-            return dataset
+        return dataset
 
     # @override
     def read_corpus(self) -> list[Document]:
@@ -127,11 +138,21 @@ class Locomo(Dataset):
         """
         Logger().info("Reading the LoCoMo dataset corpus")
         file_path = os.path.join("data", "locomo", "locomo10.json")
-        with open(file_path, encoding="utf-8") as locomo_corpus:
-            corpus = json.load(locomo_corpus)
-
+        corpus_cache = super()._get_corpus_cache(file_path, {
+            'conversation': self._args.conversation,
+            'limit': self._args.limit,
+        })
+        corpus = corpus_cache.load_corpus()
+        if corpus is None:
             pattern = re.compile(r"^session_\d+$")
             conversation_id = self._args.conversation
+            limit = self._args.limit
+
+            # A negative limit drops the last conversations, as when the whole corpus was sliced with it, so all of
+            # them are read first
+            conversation_samples = iter_json_records(file_path)
+            conversation_samples = islice(conversation_samples, limit) if limit is None or limit >= 0 else \
+                list(conversation_samples)[:limit]
 
             corpus = [
                 Document(
@@ -145,57 +166,15 @@ class Locomo(Dataset):
                         alt_text=message.get('blip_caption'),
                     ),
                 )
-                for conversation_sample in corpus[:self._args.limit]
+                for conversation_sample in conversation_samples
                 if conversation_id is None or conversation_sample['sample_id'] == conversation_id
                 for key, session in conversation_sample['conversation'].items() if pattern.match(key)
                 for message in session
             ]
-            super()._log_dataset_stats(corpus)
-
-            return corpus
-
-    # @override
-    def get_question(self, question_id: str) -> Optional[QuestionAnswer]:
-        """
-        Gets a question from the dataset.
-
-        Args:
-            question_id (str): the id of the question to be retrieved
-
-        Raises:
-            ValueError: if the dataset is not read or the question id is not found in the dataset
-
-        Returns:
-            question (Optional[QuestionAnswer]): the question if found, None otherwise
-        """
-        if not self._dataset and not self._dataset_map:
-            Logger().error("Dataset not read. Please read the dataset before getting questions.")
-            raise ValueError(
-                "Dataset not read. Please read the dataset before getting questions.")
-
-        match = re.match(r'^(conv-.\d+)-(.*)$',
-                         question_id)
-
-        if not match:
-            Logger().error(
-                f"Invalid question id format: {question_id}. Expected format: conv-<sample_id>-<message_id>")
-            raise ValueError(
-                f"Invalid question id format: {question_id}. Expected format: conv-<sample_id>-<message_id>"
-            )
-
-        sample_id = str(match.group(1))
-        message_id = str(match.group(2))
-
-        if sample_id not in self._dataset_map:  # type: ignore
-            Logger().error(
-                f"Sample id {sample_id} not found in the dataset.")
-            raise ValueError(
-                f"Sample id {sample_id} not found in the dataset.")
+            corpus_cache.save_corpus(corpus)
+        super()._log_dataset_stats(corpus)
 
-        return next((
-            qa for qa in self._dataset_map[sample_id]['qa']  # type: ignore
-            if get_content_hash(qa['question']) == message_id), None
-        )
+        return corpus
 
 
 QA_PROMPT_RELEVANT = '''You are a helpful Question Answering assistant. You will be presented with snippets from a \
@@ -1,12 +1,12 @@
 """Musique dataset class."""
 
-import json
 import os
 from logger.logger import Logger
 from models.dataset import Dataset, DatasetSample, DatasetSampleInstance
 from models.document import Document
 from models.question_answer import QuestionAnswer, QuestionCategory
 from utils.hash_utils import get_content_hash
+from utils.json_utils import iter_json_records, prefer_jsonl
 from utils.question_utils import filter_questions
 
 
@@ -27,32 +27,32 @@ class MuSiQue(Dataset):
         Logger().info("Reading the MuSiQue dataset")
         conversation_id = self._args.conversation
 
-        with open(os.path.join("data", "musique", "musique_dev.json"), encoding="utf-8") as musique_dataset:
-            dataset = [
-                DatasetSample(
-                    sample_id=sample['id'],
-                    sample=DatasetSampleInstance(
-                        qa=filter_questions([QuestionAnswer(
-                            docs=[Document(
-                                doc_id=get_content_hash(doc['paragraph_text']),
-                                content=f'{doc["title"]}:{doc["paragraph_text"]}')
-                                for doc in sample['paragraphs'] if doc['is_supporting']],
-                            question_id=sample['id'],
-                            question=sample['question'],
-                            answer=[str(sample['answer'])] +
-                            sample['answer_aliases'],
-                            category=QuestionCategory.MULTI_HOP
-                        )], self._args.questions, self._args.category)
-                    )
+        file_path = os.path.join("data", "musique", "musique_dev.json")
+
+        dataset = super()._read_cached(file_path, lambda: (
+            DatasetSample(
+                sample_id=sample['id'],
+                sample=DatasetSampleInstance(
+                    qa=filter_questions([QuestionAnswer(
+                        docs=[Document(
+                            doc_id=get_content_hash(doc['paragraph_text']),
+                            content=f'{doc["title"]}:{doc["paragraph_text"]}')
+                            for doc in sample['paragraphs'] if doc['is_supporting']],
+                        question_id=sample['id'],
+                        question=sample['question'],
+                        answer=[str(sample['answer'])] +
+                        sample['answer_aliases'],
+                        category=QuestionCategory.MULTI_HOP
+                    )], self._args.questions, self._args.category)
                 )
-                for sample in json.load(musique_dataset)
-                if conversation_id is None or sample['id'] == conversation_id
-            ]
-            dataset = super().process_dataset(dataset)
-            Logger().info(
-                f"MuSiQue dataset read successfully. Total samples: {len(dataset)}")
+            )
+            for sample in iter_json_records(file_path)
+            if conversation_id is None or sample['id'] == conversation_id
+        ))
+        Logger().info(
+            f"MuSiQue dataset read successfully. Total samples: {len(dataset)}")
 
-            return dataset
+        return dataset
 
     def read_corpus(self) -> list[Document]:
         """
@@ -61,15 +61,16 @@ class MuSiQue(Dataset):
         Returns:
             corpus (list[str]): the corpus
         """
-        file_path = os.path.join("data", "musique", "musique_corpus.json")
-        with open(file_path, encoding="utf-8") as musique_corpus:
-            corpus = json.load(musique_corpus)
-            # pylint: disable=duplicate-code
+        file_path = prefer_jsonl(os.path.join("data", "musique", "musique_corpus.json"))
+        corpus_cache = super()._get_corpus_cache(file_path)
+        corpus = corpus_cache.load_corpus()
+        if corpus is None:
             corpus = [
-                Document(doc_id=get_content_hash(doc['text']), content=f'{doc["title"]}:{doc["text"]}')
-                for doc in corpus
+                Document(doc_id=get_content_hash(doc['text']), content=f'{doc["title"]}:{doc["text"]}',
+                         title=doc['title'])
+                for doc in iter_json_records(file_path)
             ]
-            super()._log_dataset_stats(corpus)
-            # pylint: disable=enable-code
+            corpus_cache.save_corpus(corpus)
+        super()._log_dataset_stats(corpus)
 
-            return corpus
+        return corpus
@@ -10,7 +10,7 @@ if __name__ == "__main__":
     # Read the MusiQue dataset
     generate_corpus(
         input_path='musique_dev.json',
-        output_path='musique_corpus.json',
+        output_path='musique_corpus.jsonl',
         context_extractor=lambda context: {
             'title': context['title'], 'text': context['paragraph_text']},
         context_key='paragraphs'
@@ -1,12 +1,12 @@
 """2Wiki dataset module."""
 
-import json
 import os
 from logger.logger import Logger
 from models.dataset import Dataset, DatasetSample, DatasetSampleInstance
 from models.document import Document
 from models.question_answer import QuestionAnswer, QuestionCategory
 from utils.hash_utils import get_content_hash
+from utils.json_utils import iter_json_records, prefer_jsonl
 from utils.question_utils import filter_questions
 
 
@@ -29,34 +29,33 @@ class TwoWiki(Dataset):
 
         # pylint: disable=duplicate-code
         file_path = os.path.join("data", "twowikimultihopqa", "dev.json")
-        with open(file_path, encoding="utf-8") as two_wiki_dataset:
-            dataset = [
-                DatasetSample(
-                    sample_id=sample['_id'],
-                    sample=DatasetSampleInstance(
-                        qa=filter_questions([QuestionAnswer(
-                            docs=[Document(doc_id=get_content_hash(' '.join(doc[1])), content=' '.join(doc[1]))
-                                  for doc in sample['context']
-                                  if any(doc[0] == fact[0] for fact in sample['supporting_facts'])],
-                            question_id=sample['_id'],
-                            question=sample['question'],
-                            answer=[str(sample['answer'])],
-                            category=QuestionCategory.COMPARISON
-                            if sample['type'] in ('comparison', 'bridge_comparison') else (
-                                QuestionCategory.MULTI_HOP
-                                if sample['type'] in ('inference', 'compositional') else QuestionCategory.NONE
-                            )
-                        )], self._args.questions, self._args.category)
-                    )
+
+        dataset = super()._read_cached(file_path, lambda: (
+            DatasetSample(
+                sample_id=sample['_id'],
+                sample=DatasetSampleInstance(
+                    qa=filter_questions([QuestionAnswer(
+                        docs=[Document(doc_id=get_content_hash(' '.join(doc[1])), content=' '.join(doc[1]))
+                              for doc in sample['context']
+                              if any(doc[0] == fact[0] for fact in sample['supporting_facts'])],
+                        question_id=sample['_id'],
+                        question=sample['question'],
+                        answer=[str(sample['answer'])],
+                        category=QuestionCategory.COMPARISON
+                        if sample['type'] in ('comparison', 'bridge_comparison') else (
+                            QuestionCategory.MULTI_HOP
+                            if sample['type'] in ('inference', 'compositional') else QuestionCategory.NONE
+                        )
+                    )], self._args.questions, self._args.category)
                 )
-                for sample in json.load(two_wiki_dataset)
-                if conversation_id is None or sample['_id'] == conversation_id
-            ]
-            dataset = super().process_dataset(dataset)
-            Logger().info(
-                f"2Wiki dataset read successfully. Total samples: {len(dataset)}")
+            )
+            for sample in iter_json_records(file_path)
+            if conversation_id is None or sample['_id'] == conversation_id
+        ))
+        Logger().info(
+            f"2Wiki dataset read successfully. Total samples: {len(dataset)}")
 
-            return dataset
+        return dataset
         # pylint: enable=duplicate-code
 
     def read_corpus(self) -> list[Document]:
@@ -67,13 +66,15 @@ class TwoWiki(Dataset):
             corpus (list[Document]): the corpus
         """
         Logger().info("Reading the 2Wiki dataset corpus")
-        file_path = os.path.join("data", "twowikimultihopqa", "corpus.json")
-        with open(file_path, encoding="utf-8") as twowiki_corpus:
-            corpus = json.load(twowiki_corpus)
+        file_path = prefer_jsonl(os.path.join("data", "twowikimultihopqa", "corpus.json"))
+        corpus_cache = super()._get_corpus_cache(file_path)
+        corpus = corpus_cache.load_corpus()
+        if corpus is None:
             corpus = [
-                Document(doc_id=get_content_hash(doc['text']), content=doc['text'])
-                for doc in corpus
+                Document(doc_id=get_content_hash(doc['text']), content=doc['text'], title=doc.get('title'))
+                for doc in iter_json_records(file_path)
             ]
-            super()._log_dataset_stats(corpus)
+            corpus_cache.save_corpus(corpus)
+        super()._log_dataset_stats(corpus)
 
-            return corpus
+        return corpus
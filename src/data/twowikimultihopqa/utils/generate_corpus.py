@@ -10,5 +10,5 @@ if __name__ == "__main__":
     # Read the 2wikimultihopQA dataset
     generate_corpus(
         input_path='dev.json',
-        output_path='corpus.json',
+        output_path='corpus.jsonl',
         context_extractor=lambda context: {'title': context[0], 'text': ' '.join(context[1])})
@@ -1,6 +1,7 @@
 """Dataset utilities for reading and processing datasets."""
 import json
 from typing import Callable, Any
+from utils.json_utils import iter_json_records
 
 
 def generate_corpus(
@@ -11,7 +12,7 @@ def generate_corpus(
 ) -> None:
     """
     Generate a corpus from the input dataset by extracting documents from the context.
-    The documents are saved to a new file in JSON format.
+    The dataset is streamed and the documents are saved to a new file in JSON lines format as they are extracted.
 
     Args:
         input_path (str): the path to the input dataset file
@@ -19,30 +20,23 @@ def generate_corpus(
         context_extractor (Callable[[Any], dict[str, str]]): a function that extracts documents from the context
         context_key (str, optional): the property to extract the context from the dataset. Defaults to 'context'.
     """
-    with open(input_path, 'r', encoding='utf-8') as f, open(output_path, 'w', encoding='utf-8') as outfile:
-        dataset = json.load(f)
+    total_docs = 0
+    # Dedup documents based on identical content
+    seen_texts = set()
 
-        documents = [
-            context_extractor(context)
-            for item in dataset
-            for context in item[context_key]
-        ]
+    with open(output_path, 'w', encoding='utf-8') as outfile:
+        for item in iter_json_records(input_path):
+            for context in item[context_key]:
+                doc = context_extractor(context)
+                total_docs += 1
 
-        total_docs = len(documents)
-        print(f'Extracted {total_docs} documents from {input_path}.')
+                text = doc.get('text')
+                if text in seen_texts:
+                    continue
 
-        # Dedup documents based on identical content
-        seen_texts = set()
-        unique_documents = []
-        for doc in documents:
-            text = doc.get('text')
-            if text not in seen_texts:
                 seen_texts.add(text)
-                unique_documents.append(doc)
-        documents = unique_documents
+                outfile.write(json.dumps(doc) + '\n')
 
-        print(f'Deduped {total_docs - len(documents)} documents.')
-        print(f'Generated {len(documents)} documents.')
-
-        # Save the documents to a new file
-        json.dump(documents, outfile, indent=4)
+    print(f'Extracted {total_docs} documents from {input_path}.')
+    print(f'Deduped {total_docs - len(seen_texts)} documents.')
+    print(f'Generated {len(seen_texts)} documents.')
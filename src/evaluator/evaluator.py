@@ -5,6 +5,7 @@ import json
 from typing import Optional, Any
 from openai.types import Batch
 from azure_open_ai.batch import wait_for_batch_job_and_save_result
+from azure_open_ai.response_cache import write_cached_results
 from evaluator.bleu_evaluator import eval_bleu_score
 from evaluator.exact_match_evaluator import eval_exact_match
 from evaluator.f1_evaluator import eval_f1_score
@@ -16,12 +17,14 @@ from evaluator.rogue_evaluator import eval_rogue_score
 from logger.logger import Logger
 from models.dataset import Dataset
 from models.document import Document
+from utils.question_utils import split_custom_id
 
 
 def evaluator(args, dataset: Dataset) -> None:
     """
     Orchestrates the evaluation of the model's performance on the dataset.
     It evaluates the model's performance based on the provided arguments and dataset.
+    Results of a sweep over several values of k are evaluated separately for each k.
 
     Args:
         args (Namespace): the arguments passed to the script
@@ -46,54 +49,100 @@ def evaluator(args, dataset: Dataset) -> None:
     with open(args.evaluation, "r", encoding="utf-8") as evaluation_file:
         evaluation = [json.loads(line) for line in evaluation_file]
 
-        if args.retrieval:
-            doc_pairs = [pair for pair in (extract_doc_pair(dataset,
-                                                            eval_item) for eval_item in evaluation) if pair is not None]
-            evaluate_retrieval(doc_pairs)
-        elif args.metric:
-            metrics = [m for m in (extract_metrics(eval_item)
-                                   for eval_item in evaluation) if m is not None]
-            eval_metrics(metrics)
-        elif args.judge_eval and not args.judge_eval_path:
-            batch: Optional[Batch] = None
-            doc_pairs = []
-            if args.eval_batch:
-                doc_pairs = [(q, ans[0], act)
-                             for pairs in
-                             (extract_qa_pairs_with_question(dataset, eval_item)
-                              for eval_item in evaluation)
-                             for q, ans, act in pairs]
-            else:
-                doc_pairs = [(q, ans[0], act)
-                             for q, ans, act in
-                             [pair for pair in
-                             (extract_qa_pair_with_question(dataset, eval_item)
-                              for eval_item in evaluation)
-                             if pair is not None]]
-            batch = eval_judge_score(args.model, doc_pairs)
-
-            if batch is not None:
-                Logger().info(
-                    f"Batch job {batch.id} submitted. Waiting for completion ...")
-                wait_for_batch_job_and_save_result(
-                    batch, get_eval_output_path())
-        elif args.eval_batch:
-            qa_pairs = [pair for pairs in (extract_qa_pairs(dataset,
-                                                            eval_item) for eval_item in evaluation) for pair in pairs]
-            evaluate(qa_pairs, args)
-        else:
-            qa_pairs = [pair for pair in (extract_qa_pair(dataset,
-                                                          eval_item) for eval_item in evaluation) if pair is not None]
-            evaluate(qa_pairs, args)
+    for k, eval_items in group_by_k(evaluation).items():
+        if k is not None:
+            Logger().info(f"Evaluating results retrieved at k={k}")
+
+        evaluate_items(args, dataset, eval_items, None if k is None else f'k{k}')
+
+
+def group_by_k(evaluation: list[dict[str, Any]]) -> dict[Optional[int], list[dict[str, Any]]]:
+    """
+    Groups the evaluation items by the retrieval depth their custom ids are tagged with in a sweep over several
+    values of k. The tag is removed from the custom ids so that they match the question ids of the dataset.
+
+    Args:
+        evaluation (list[dict[str, Any]]): the evaluation items
 
+    Returns:
+        groups (dict[Optional[int], list[dict[str, Any]]]): the evaluation items by k, None if not tagged
+    """
+    groups: dict[Optional[int], list[dict[str, Any]]] = {}
+
+    for eval_item in evaluation:
+        question_id, k = split_custom_id(eval_item['custom_id'])
+        groups.setdefault(k, []).append(eval_item if k is None else {**eval_item, 'custom_id': question_id})
+
+    return groups
+
+
+def evaluate_items(args, dataset: Dataset, evaluation: list[dict[str, Any]], postfix: Optional[str] = None) -> None:
+    """
+    Evaluates the given evaluation items based on the provided arguments.
 
-def evaluate_retrieval(doc_pairs: list[tuple[list[Document] | None, list[Document]]]) -> None:
+    Args:
+        args (Namespace): the arguments passed to the script
+        dataset (Dataset): the dataset to be processed
+        evaluation (list[dict[str, Any]]): the evaluation items
+        postfix (Optional[str]): the postfix of the judge evaluation output file
+    """
+    if args.retrieval:
+        doc_pairs = [pair for pair in (extract_doc_pair(dataset,
+                                                        eval_item) for eval_item in evaluation) if pair is not None]
+        evaluate_retrieval(doc_pairs)
+    elif args.metric:
+        metrics = [m for m in (extract_metrics(eval_item)
+                               for eval_item in evaluation) if m is not None]
+        eval_metrics(metrics)
+    elif args.judge_eval and not args.judge_eval_path:
+        batch: Optional[Batch] = None
+        doc_pairs = []
+        if args.eval_batch:
+            doc_pairs = [(q, ans[0], act)
+                         for pairs in
+                         (extract_qa_pairs_with_question(dataset, eval_item)
+                          for eval_item in evaluation)
+                         for q, ans, act in pairs]
+        else:
+            doc_pairs = [(q, ans[0], act)
+                         for q, ans, act in
+                         [pair for pair in
+                         (extract_qa_pair_with_question(dataset, eval_item)
+                          for eval_item in evaluation)
+                         if pair is not None]]
+        batch, cached_results = eval_judge_score(args.model, doc_pairs)
+
+        if batch is not None:
+            Logger().info(
+                f"Batch job {batch.id} submitted. Waiting for completion ...")
+            wait_for_batch_job_and_save_result(
+                batch, get_eval_output_path(postfix))
+
+        write_cached_results(cached_results, get_eval_output_path(postfix))
+    elif args.eval_batch:
+        qa_pairs = [pair for pairs in (extract_qa_pairs(dataset,
+                                                        eval_item) for eval_item in evaluation) for pair in pairs]
+        evaluate(qa_pairs, args)
+    else:
+        qa_pairs = [pair for pair in (extract_qa_pair(dataset,
+                                                      eval_item) for eval_item in evaluation) if pair is not None]
+        evaluate(qa_pairs, args)
+
+
+def evaluate_retrieval(
+    doc_pairs: list[tuple[list[Document] | None, list[Document]]],
+    k_list: Optional[list[int]] = None
+) -> dict[int, float]:
     """
     Evaluates retrieval performance based on the provided document pairs.
     Evaluates the recall score across various Ks.
 
     Args:
         doc_pairs (list[tuple[list[Document], list[Document]]]): the ground truth documents and the model's documents
+        k_list (Optional[list[int]]): the Ks to evaluate. All the default Ks if not specified
+
+    Returns:
+        recall_at_k (dict[int, float]): the recall score across the Ks
     """
     if len(doc_pairs) == 0:
         Logger().error("No doc pairs found. Please check the evaluation file.")
@@ -101,13 +150,15 @@ def evaluate_retrieval(doc_pairs: list[tuple[list[Document] | None, list[Documen
 
     Logger().info("Evaluating retrieval score")
 
-    recall_at_k = eval_retrieval_recall(doc_pairs)
+    recall_at_k = eval_retrieval_recall(doc_pairs, k_list)
 
     for k, recall in recall_at_k.items():
         Logger().info(f"Recall at {k}: {recall}")
 
+    return recall_at_k
+
 # pylint: disable=too-many-locals
-def evaluate(qa_pairs: list[tuple[list[str], str]], args) -> None:
+def evaluate(qa_pairs: list[tuple[list[str], str]], args) -> dict[str, Optional[float]]:
     """
     Evaluates question answering performance based on the provided question-answer pairs.
     Evaluates the exact match score, F1 score, precision, recall, and BERT score (if applicable).
@@ -116,6 +167,9 @@ def evaluate(qa_pairs: list[tuple[list[str], str]], args) -> None:
         qa_pairs (list[tuple[list[str], str]]): the ground truth answers and the model's answers
 
         args (Namespace): the arguments passed to the script
+
+    Returns:
+        scores (dict[str, Optional[float]]): the scores by metric
     """
     if len(qa_pairs) == 0:
         Logger().error("No question-answer pairs found. Please check the evaluation file.")
@@ -148,6 +202,17 @@ def evaluate(qa_pairs: list[tuple[list[str], str]], args) -> None:
     Logger().info(f"ROUGE-2 recall: {rogue_recall_2}")
     Logger().info(f"BLEU score: {bleu_score}")
 
+    return {
+        'em': em,
+        'f1': f1,
+        'precision': precision,
+        'recall': recall,
+        'rouge': rogue,
+        'rouge_2': rogue_2,
+        'bleu': bleu_score,
+        'bert': bert_score,
+    }
+
 
 def extract_metrics(eval_item: dict[str, Any]) -> Optional[dict[str, int]]:
     """
@@ -165,6 +230,9 @@ def extract_metrics(eval_item: dict[str, Any]) -> Optional[dict[str, int]]:
         completion_tokens = eval_item['response']['body']['usage']['completion_tokens']
         prompt_tokens = eval_item['response']['body']['usage']['prompt_tokens']
         total_tokens = eval_item['response']['body']['usage']['total_tokens']
+        # Only reported by deployments that support prompt caching
+        cached_tokens = (eval_item['response']['body']['usage'].get('prompt_tokens_details') or {}) \
+            .get('cached_tokens') or 0
     except KeyError:
         Logger().error(
             f"KeyError: 'usage metrics' not found in the evaluation item: {eval_item['custom_id']}")
@@ -173,7 +241,8 @@ def extract_metrics(eval_item: dict[str, Any]) -> Optional[dict[str, int]]:
     return {
         'completion_tokens': int(completion_tokens),
         'prompt_tokens': int(prompt_tokens),
-        'total_tokens': int(total_tokens)
+        'total_tokens': int(total_tokens),
+        'cached_tokens': int(cached_tokens)
     }
 
 
@@ -202,7 +271,7 @@ def extract_doc_pair(
 
     Logger().debug(f"Question found: {question['question']}")
 
-    expected_docs = dataset.get_supporting_docs(eval_item['custom_id'])
+    expected_docs = question.get('docs')
     actual_docs = [Document(
         doc_id=result['doc_id'],
         content=result['content']
@@ -361,14 +430,19 @@ def extract_qa_pair_with_question(dataset: Dataset, eval_item: dict[str, Any]) -
     return qa_pair
 
 
-def get_eval_output_path() -> str:
+def get_eval_output_path(postfix: Optional[str] = None) -> str:
     """
     Get the output path for the L1 evaluation job results.
 
+    Args:
+        postfix (Optional[str]): the postfix of the file name, e.g., the k of a sweep
+
     Returns:
         str: the output path
     """
     output_dir = os.path.join(os.path.normpath(
         os.getcwd() + os.sep + os.pardir), 'output' + os.sep + 'eval_jobs')
+    name = (f'eval_results_{Logger().get_run_id()}.jsonl'
+            if postfix is None else f'eval_results_{Logger().get_run_id()}_{postfix}.jsonl')
     return os.path.join(
-        output_dir, f'eval_results_{Logger().get_run_id()}.jsonl')
+        output_dir, name)
@@ -6,7 +6,10 @@ from azure_open_ai.batch_evaluation import queue_evaluation_batch_job
 from logger.logger import Logger
 
 
-def eval_judge_score(model: Optional[str], qa_pairs: list[tuple[str, str, str]]) -> Optional[Batch]:
+def eval_judge_score(
+    model: Optional[str],
+    qa_pairs: list[tuple[str, str, str]]
+) -> tuple[Optional[Batch], list[dict]]:
     """
     Evaluate the question answer pairs based on a score given by an LLM judge.
     Uploads a batch job to Azure OpenAI for evaluation.
@@ -15,6 +18,9 @@ def eval_judge_score(model: Optional[str], qa_pairs: list[tuple[str, str, str]])
     Args:
         model (str): The model to be used for evaluation.
         qa_pairs (list[tuple[str, str]]): A list of tuples containing question, expected answer and given answer pairs.
+
+    Returns:
+        tuple[Optional[Batch], list[dict]]: The batch job if any evaluation is queued and the cached evaluations.
     """
     return queue_evaluation_batch_job(
         model=model or 'gpt-4o-mini',
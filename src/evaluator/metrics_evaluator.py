@@ -21,6 +21,7 @@ def eval_metrics(metrics: list[dict[str, int]]) -> dict[str, float]:
         'completion_tokens',
         'prompt_tokens',
         'total_tokens',
+        'cached_tokens',
     ]
 
     # Compute the total for each metric
@@ -31,6 +32,9 @@ def eval_metrics(metrics: list[dict[str, int]]) -> dict[str, float]:
 
     Logger().info(f"Total metrics: {total_metrics}")
 
+    cached_ratio = total_metrics['cached_tokens'] / max(1, total_metrics['prompt_tokens'])
+    Logger().info(f"Cached prompt tokens ratio: {cached_ratio:.4f}")
+
     avg_metrics = {}
     for metric in metric_keys:
         avg_metrics[metric] = sum(
@@ -1,6 +1,7 @@
 
 """Retrieval Evaluator Module."""
 
+from typing import Optional
 from logger.logger import Logger
 from models.document import Document
 
@@ -8,34 +9,45 @@ from models.document import Document
 K_LIST = [1, 2, 5, 10, 20, 100]
 
 
-def eval_retrieval_recall(doc_pairs: list[tuple[list[Document] | None, list[Document]]]) -> dict[int, float]:
+def eval_retrieval_recall(
+    doc_pairs: list[tuple[list[Document] | None, list[Document]]],
+    k_list: Optional[list[int]] = None
+) -> dict[int, float]:
     """
     Evaluates the recall between the ground truth documents and the model's retrieved documents.
 
     Args:
         doc_pairs (list[tuple[list[Document], list[Document]]]): \
 A list of pairs with the ground documents and the retrieved documents.
+        k_list (list[int], optional): the Ks to evaluate. K_LIST if not specified
 
     Returns:
         recall_at_k (dict[int, float]): the recall score across various Ks
     """
-    recall_at_k = [recall_score(gt, a) for (gt, a) in doc_pairs]
+    k_list = k_list or K_LIST
+
+    recall_at_k = [recall_score(gt, a, k_list) for (gt, a) in doc_pairs]
 
     avg_recall_at_k = {
         k: sum(d[k] for d in recall_at_k) / len(recall_at_k)
-        for k in K_LIST
+        for k in k_list
     }
 
     return avg_recall_at_k
 
 
-def recall_score(expected_docs: list[Document] | None, actual_docs: list[Document]) -> dict[int, float]:
+def recall_score(
+    expected_docs: list[Document] | None,
+    actual_docs: list[Document],
+    k_list: Optional[list[int]] = None
+) -> dict[int, float]:
     """
     Evaluates the recall between the ground truth documents and the model's retrieved documents.
 
     Args:
         expected_docs (list[Document]): the ground truth documents
         actual_docs (list[Document]): the model's retrieved documents
+        k_list (list[int], optional): the Ks to evaluate. K_LIST if not specified
 
     Returns:
         recall_at_k (dict[int, float]): the recall score across various Ks
@@ -44,7 +56,7 @@ def recall_score(expected_docs: list[Document] | None, actual_docs: list[Documen
     assert actual_docs, "Actual documents list is empty."
 
     recall_at_k = {}
-    for k in K_LIST:
+    for k in k_list or K_LIST:
         if len(actual_docs) < k:
             Logger().warn(f'Length of actual docs is less than {k}, retrieval at K may not be accurate')
         top_k_docs = actual_docs[:k]
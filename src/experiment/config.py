@@ -0,0 +1,129 @@
+"""Experiment config module to load an experiment run and expand its matrix of experiments."""
+import json
+from typing import Any, Optional
+
+from logger.logger import Logger
+
+# Resources of an experiment run that are not specified in its config
+DEFAULT_RESOURCES = {
+    # Maximum number of stages running at the same time
+    'workers': 4,
+    # Maximum number of stages of GPU agents indexing or retrieving at the same time
+    'gpus': 1,
+    # Maximum number of stages of CPU agents indexing or retrieving at the same time. Each of them uses a pool of
+    # processes of its own
+    'cpus': 2,
+    # Maximum number of chat completion requests in flight across all the LLM stages
+    'llm_concurrency': 16,
+    # Maximum number of LLM stages running at the same time, which share the LLM concurrency evenly
+    'llm_stages': 1,
+}
+
+
+class Experiment(dict):
+    """
+    Experiment class to store a single experiment of the matrix of an experiment run.
+    It inherits from dict and initializes the dictionary with the given parameters.
+
+    Args:
+        dict (Any): dictionary to store the experiment
+        dataset (dict[str, Any]): the dataset arguments, e.g., {"dataset": "hotpot", "limit": 100}
+        agent (str): the agent
+        k (Optional[int]): the number of documents to retrieve, None for the default of the agent
+        model (Optional[str]): the model answering the questions, None to only retrieve
+    """
+
+    def __init__(self, dataset: dict[str, Any], agent: str, k: Optional[int], model: Optional[str]) -> None:
+        dict.__init__(self, dataset=dataset, agent=agent, k=k, model=model)
+
+
+def load_config(path: str) -> dict[str, Any]:
+    """
+    Loads and validates the config of an experiment run. The config is a JSON object with:
+
+        - datasets: the arguments of each dataset, e.g., [{"dataset": "hotpot", "limit": 100}]
+        - agents: the agents, e.g., ["bm25", "dense"]
+        - k (optional): the numbers of documents to retrieve, e.g., [1, 5, 10]
+        - models (optional): the models answering the questions. Only retrieval is run if empty
+        - options (optional): arguments of index.py shared by all the experiments, e.g., {"bert-eval": true}
+        - resources (optional): the limits of the scheduler. See DEFAULT_RESOURCES
+
+    Args:
+        path (str): the path of the config file
+
+    Returns:
+        config (dict[str, Any]): the config with the default resources filled in
+
+    Raises:
+        ValueError: if the config is not valid
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    if not isinstance(config, dict):
+        raise ValueError("Experiment config must be a JSON object")
+
+    for key in ['datasets', 'agents']:
+        if not isinstance(config.get(key), list) or len(config[key]) == 0:
+            Logger().error(f"Experiment config must have a non-empty list of {key}")
+            raise ValueError(f"Experiment config must have a non-empty list of {key}")
+
+    for dataset in config['datasets']:
+        if not isinstance(dataset, dict) or 'dataset' not in dataset:
+            raise ValueError(f"Dataset {dataset} must be an object with a dataset name")
+
+    unknown = set(config.get('resources', {})) - set(DEFAULT_RESOURCES)
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown resources in experiment config: {sorted(unknown)}")
+
+    config['k'] = sorted(set(config.get('k') or []))
+    config['models'] = config.get('models') or []
+    config['options'] = config.get('options') or {}
+    config['resources'] = {**DEFAULT_RESOURCES, **config.get('resources', {})}
+
+    return config
+
+
+def expand_matrix(config: dict[str, Any]) -> list[Experiment]:
+    """
+    Expands the config of an experiment run into the matrix of its experiments.
+
+    Args:
+        config (dict[str, Any]): the config of the experiment run
+
+    Returns:
+        experiments (list[Experiment]): an experiment for each dataset, agent, k and model
+    """
+    return [
+        Experiment(dataset, agent, k, model)
+        for dataset in config['datasets']
+        for agent in config['agents']
+        for model in config['models'] or [None]
+        for k in config['k'] or [None]
+    ]
+
+
+def to_argv(options: dict[str, Any]) -> list[str]:
+    """
+    Converts options into the command line arguments of index.py, using the long name of each argument.
+
+    Args:
+        options (dict[str, Any]): the options, e.g., {"limit": 100, "bert-eval": true, "k": [1, 5]}
+
+    Returns:
+        argv (list[str]): the command line arguments, e.g., ["--limit", "100", "--bert-eval", "--k", "1", "5"]
+    """
+    argv = []
+
+    for name, value in options.items():
+        if value is None or value is False:
+            continue
+
+        argv.append(f'--{name}')
+
+        if isinstance(value, list):
+            argv.extend(str(v) for v in value)
+        elif value is not True:
+            argv.append(str(value))
+
+    return argv
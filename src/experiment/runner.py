@@ -0,0 +1,416 @@
+"""Experiment runner module to run the matrix of experiments of an experiment run with shared stages."""
+import json
+import os
+from argparse import Namespace
+from concurrent.futures import Future
+from typing import Any, Optional
+
+from agents.hippo_rag.hippo_rag import model_label
+from evaluator.evaluator import evaluate, evaluate_retrieval, extract_qa_pair, extract_qa_pairs, group_by_k
+from experiment.config import Experiment, expand_matrix, to_argv
+from experiment.scheduler import StageScheduler
+from index import parse_args
+from logger.logger import Logger
+from models.agent import Agent
+from models.dataset import Dataset
+from models.document import Document
+from orchestrator.orchestrator import AGENTS, DATASETS
+from predictor.checkpoint import Checkpoint
+from predictor.predictor import answer_questions, batch_question_answering, get_qa_output_path
+from retriever.retriever import expand_k_values, get_retrieval_output_path, retrieve_questions
+from utils.token_utils import TokenCounter
+
+# Agents that index and retrieve on the GPU
+GPU_AGENTS = {'dense', 'colbertv2', 'hippo'}
+# Columns of the summary table
+SUMMARY_COLUMNS = ['dataset', 'agent', 'model', 'k', 'recall@k', 'em', 'f1', 'rouge', 'bleu', 'bert', 'status']
+
+
+# pylint: disable-next=too-few-public-methods
+class ExperimentRunner:
+    """
+    Runs the matrix of experiments of an experiment run. The experiments are split into stages (dataset load,
+    corpus index, retrieval, LLM and evaluation) and each stage runs once for all the experiments that share it:
+
+        - a dataset is loaded once for all its agents, models and values of k
+        - a corpus is indexed and retrieved once per agent for all the models and values of k, retrieving at the
+        largest k (agents whose index or retrieval depends on the model, such as HippoRAG, once per model)
+        - the questions are answered once per agent and model for all the values of k, with the jobs of each k
+        tagged in their custom id
+        - the answers are evaluated once per agent and model for all the values of k
+
+    The stages are scheduled on a pool of workers with limits on the stages using the GPU, the CPU and the LLM,
+    and the scores of all the experiments are written to a single summary table.
+    """
+
+    def __init__(self, config: dict[str, Any], run_id: str):
+        self._config = config
+        self._run_id = run_id
+
+        resources = config['resources']
+        self._llm_concurrency = max(1, resources['llm_concurrency'] // resources['llm_stages'])
+        self._scheduler = StageScheduler(resources['workers'], {
+            'gpu': resources['gpus'],
+            'cpu': resources['cpus'],
+            'llm': resources['llm_stages'],
+        })
+
+    def run(self) -> list[dict[str, Any]]:
+        """
+        Runs all the experiments and writes the summary table.
+
+        Returns:
+            rows (list[dict[str, Any]]): the scores of each experiment
+        """
+        experiments = expand_matrix(self._config)
+
+        Logger().info(f"Running {len(experiments)} experiments of experiment run {self._run_id}")
+
+        # Experiments that only differ in k share all their stages
+        groups: dict[str, list[Experiment]] = {}
+        for experiment in experiments:
+            key = json.dumps([experiment['dataset'], experiment['agent'], experiment['model']], sort_keys=True)
+            groups.setdefault(key, []).append(experiment)
+
+        evaluations: list[tuple[list[Experiment], Optional[Future]]] = []
+        for group in groups.values():
+            try:
+                evaluations.append((group, self._schedule(group[0])))
+            except ValueError as e:
+                Logger().error(f"Experiments of {get_label(group[0], group[0]['model'])} cannot run: {e}")
+                evaluations.append((group, None))
+
+        rows = []
+        for group, future in evaluations:
+            try:
+                if future is None:
+                    raise RuntimeError("Experiments not scheduled")
+
+                rows.extend(future.result())
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                Logger().error(f"Experiments of {get_label(group[0], group[0]['model'])} failed: {e}")
+                rows.extend({
+                    'dataset': get_dataset_label(experiment['dataset']),
+                    'agent': experiment['agent'],
+                    'model': experiment['model'],
+                    'k': experiment['k'],
+                    'status': 'failed',
+                } for experiment in group)
+
+        self._scheduler.shutdown()
+
+        TokenCounter().log_stats()
+
+        write_summary(rows, get_summary_output_path())
+
+        return rows
+
+    # pylint: disable-next=too-many-locals
+    def _schedule(self, experiment: Experiment) -> Future:
+        """
+        Schedules the stages of the experiments of a dataset, agent and model, reusing the stages already scheduled
+        for other experiments.
+
+        Args:
+            experiment (Experiment): any of the experiments of the dataset, agent and model
+
+        Returns:
+            future (Future): the scores of the experiments for each k
+        """
+        dataset_key = json.dumps(experiment['dataset'], sort_keys=True)
+        agent_name = experiment['agent']
+        model = experiment['model']
+
+        index_args = self._get_args(experiment, 'retrieve')
+        probe = AGENTS[agent_name](index_args)
+
+        # Agents whose index or retrieval depends on the model are indexed with the model
+        model_dependent = probe.standalone or probe.support_batch
+        if model_dependent:
+            if model is None:
+                raise ValueError(f"Agent {agent_name} needs a model to retrieve documents")
+            index_args = self._get_args(experiment, 'predict')
+
+        index_key = (dataset_key, agent_name, model if model_dependent else None)
+        resource = 'gpu' if agent_name in GPU_AGENTS else 'cpu'
+
+        dataset = self._scheduler.stage(
+            ('dataset', dataset_key), lambda: load_dataset(index_args))
+        agent = self._scheduler.stage(
+            ('index', *index_key), lambda dataset: index_dataset(index_args, dataset), [dataset], resource)
+
+        retrieval = None
+        if not probe.support_batch:
+            label = get_label(experiment, model if model_dependent else None)
+            retrieval = self._scheduler.stage(
+                ('retrieve', *index_key),
+                lambda dataset, agent: self._retrieve(index_args, label, dataset, agent),
+                [dataset, agent], resource)
+
+        answers = None
+        if model is not None:
+            answer_args = self._get_args(experiment, 'predict')
+            answer_deps = [dataset, agent] + ([retrieval] if retrieval is not None else [])
+            answers = self._scheduler.stage(
+                ('answer', dataset_key, agent_name, model),
+                lambda *results: self._answer(answer_args, get_label(experiment, model), results),
+                answer_deps, 'llm')
+
+        eval_args = self._get_args(experiment, 'eval')
+        eval_deps = [dataset, agent] + [stage for stage in [retrieval, answers] if stage is not None]
+
+        return self._scheduler.stage(
+            ('eval', dataset_key, agent_name, model),
+            lambda dataset, agent, *results: evaluate_experiments(
+                eval_args, experiment, dataset, agent,
+                results[0] if retrieval is not None else None,
+                results[-1] if answers is not None else None),
+            eval_deps)
+
+    def _get_args(self, experiment: Experiment, execution: str) -> Namespace:
+        """
+        Builds the arguments of index.py of a stage of an experiment.
+
+        Args:
+            experiment (Experiment): the experiment
+            execution (str): the execution mode of the stage
+
+        Returns:
+            args (Namespace): the arguments
+        """
+        return parse_args(to_argv({
+            **self._config['options'],
+            **experiment['dataset'],
+            'execution': execution,
+            'agent': experiment['agent'],
+            'model': experiment['model'] if execution != 'retrieve' else None,
+            'k': self._config['k'] or None,
+            'concurrency': self._llm_concurrency,
+        }))
+
+    def _retrieve(
+        self,
+        args: Namespace,
+        label: str,
+        dataset: Dataset,
+        agent: Agent
+    ) -> list[tuple[dict[str, Any], Optional[str]]]:
+        """
+        Retrieves the documents for all the questions at the largest k and writes the retrieval results of each k.
+
+        Args:
+            args (Namespace): the arguments of the stage
+            label (str): the label of the dataset and agent
+            dataset (Dataset): the dataset
+            agent (Agent): the agent with the dataset indexed
+
+        Returns:
+            results (list[tuple[dict[str, Any], Optional[str]]]): the retrieval result and notes of each question
+        """
+        results = retrieve_questions(dataset, agent, Checkpoint(f'{self._run_id}_{label}'))
+
+        with open(get_retrieval_output_path(label), 'w', encoding='utf-8') as f:
+            for result_json, _ in expand_k_values(results, agent, args.k_values):
+                f.write(json.dumps(result_json) + '\n')
+
+        return results
+
+    def _answer(self, args: Namespace, label: str, stage_results: tuple) -> str:
+        """
+        Answers the questions with the model for all the values of k.
+
+        Args:
+            args (Namespace): the arguments of the stage
+            label (str): the label of the dataset, agent and model
+            stage_results (tuple): the results of the stages the answers depend on, which are the dataset, the agent \
+with the dataset indexed and, if the agent retrieves documents for each question, the retrieval results
+
+        Returns:
+            output_path (str): the path of the QA output file
+        """
+        dataset, agent, *retrieval = stage_results
+        results = retrieval[0] if len(retrieval) > 0 else None
+
+        checkpoint = Checkpoint(f'{self._run_id}_{label}')
+
+        if results is None:
+            batch_question_answering(dataset, agent, args, checkpoint, label)
+        else:
+            answer_questions(results, agent, args, checkpoint, label)
+
+        return get_qa_output_path(label)
+
+
+def load_dataset(args: Namespace) -> Dataset:
+    """
+    Loads a dataset.
+
+    Args:
+        args (Namespace): the arguments of the stage
+
+    Returns:
+        dataset (Dataset): the dataset already read
+    """
+    dataset = DATASETS[args.dataset](args)
+    _ = dataset.read()
+
+    return dataset
+
+
+def index_dataset(args: Namespace, dataset: Dataset) -> Agent:
+    """
+    Indexes a dataset with an agent.
+
+    Args:
+        args (Namespace): the arguments of the stage
+        dataset (Dataset): the dataset already read
+
+    Returns:
+        agent (Agent): the agent with the dataset indexed
+    """
+    agent = AGENTS[args.agent](args)
+    agent.index(dataset)
+
+    return agent
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments,too-many-locals
+def evaluate_experiments(
+    args: Namespace,
+    experiment: Experiment,
+    dataset: Dataset,
+    agent: Agent,
+    results: Optional[list[tuple[dict[str, Any], Optional[str]]]],
+    output_path: Optional[str]
+) -> list[dict[str, Any]]:
+    """
+    Evaluates the experiments of a dataset, agent and model for all the values of k.
+    The recall at k is computed from the retrieval results at the largest k, and the QA scores from the answers
+    of each k. Agents whose answers do not depend on k are evaluated once.
+
+    Args:
+        args (Namespace): the arguments of the stage
+        experiment (Experiment): any of the experiments of the dataset, agent and model
+        dataset (Dataset): the dataset
+        agent (Agent): the agent with the dataset indexed
+        results (Optional[list[tuple[dict[str, Any], Optional[str]]]]): the retrieval results, if any
+        output_path (Optional[str]): the path of the QA output file, if the questions were answered
+
+    Returns:
+        rows (list[dict[str, Any]]): the scores of each k
+    """
+    doc_pairs = []
+    if results is not None:
+        doc_pairs = [(docs, [Document(doc_id=result['doc_id'], content=result['content'])
+                             for result in result_json['result']])
+                     for result_json, _ in results
+                     if (docs := dataset.get_supporting_docs(result_json['custom_id']))]
+
+    groups: dict[Optional[int], list[dict[str, Any]]] = {}
+    if output_path is not None:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            groups = group_by_k([json.loads(line) for line in f])
+
+    k_values = [] if agent.standalone or agent.support_batch else args.k_values
+
+    rows = []
+    for k in k_values or [None]:
+        Logger().info(f"Evaluating experiment {get_label(experiment)} at k={k}")
+
+        row: dict[str, Any] = {
+            'dataset': get_dataset_label(experiment['dataset']),
+            'agent': experiment['agent'],
+            'model': experiment['model'],
+            'k': k,
+            'status': 'ok',
+        }
+
+        if k is not None and len(doc_pairs) > 0:
+            # The QA scores have a recall of their own, which is the token-level recall of the answers
+            row['recall@k'] = evaluate_retrieval(doc_pairs, [k])[k]
+
+        # Answers of a single k are not tagged
+        eval_items = groups.get(k if len(k_values) > 1 else None, [])
+        if agent.support_batch:
+            qa_pairs = [pair for eval_item in eval_items for pair in extract_qa_pairs(dataset, eval_item)]
+        else:
+            qa_pairs = [pair for pair in (extract_qa_pair(dataset, eval_item) for eval_item in eval_items)
+                        if pair is not None]
+
+        if len(qa_pairs) > 0:
+            row.update(evaluate(qa_pairs, args))
+
+        rows.append(row)
+
+    return rows
+
+
+def write_summary(rows: list[dict[str, Any]], output_path: str) -> None:
+    """
+    Writes the scores of all the experiments as a markdown table and logs it.
+
+    Args:
+        rows (list[dict[str, Any]]): the scores of each experiment
+        output_path (str): the path of the summary file
+    """
+    def format_value(value: Any) -> str:
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return f'{value:.4f}'
+        return str(value)
+
+    lines = [
+        '| ' + ' | '.join(SUMMARY_COLUMNS) + ' |',
+        '|' + '|'.join('---' for _ in SUMMARY_COLUMNS) + '|',
+    ] + ['| ' + ' | '.join(format_value(row.get(column)) for column in SUMMARY_COLUMNS) + ' |' for row in rows]
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    Logger().info("Experiment summary:\n" + '\n'.join(lines))
+    Logger().info(f"Saved the summary of {len(rows)} experiments to {output_path}")
+
+
+def get_dataset_label(dataset: dict[str, Any]) -> str:
+    """
+    Gets a label for the dataset arguments of an experiment that is safe to use as part of a file name.
+
+    Args:
+        dataset (dict[str, Any]): the dataset arguments, e.g., {"dataset": "hotpot", "limit": 100}
+
+    Returns:
+        label (str): the label, e.g., "hotpot-limit100"
+    """
+    return '-'.join([str(dataset['dataset'])] + [
+        f'{name}{value}' for name, value in sorted(dataset.items()) if name != 'dataset'
+    ]).replace('/', '_').replace(os.sep, '_')
+
+
+def get_label(experiment: Experiment, model: Optional[str] = None) -> str:
+    """
+    Gets a label for the dataset, agent and model of an experiment that is safe to use as part of a file name.
+
+    Args:
+        experiment (Experiment): the experiment
+        model (Optional[str]): the model, if the label depends on it
+
+    Returns:
+        label (str): the label, e.g., "hotpot-limit100_bm25_gpt-4o-mini"
+    """
+    label = f"{get_dataset_label(experiment['dataset'])}_{experiment['agent']}"
+
+    return label if model is None else f'{label}_{model_label(model)}'
+
+
+def get_summary_output_path() -> str:
+    """
+    Get the output path for the summary of the experiment run.
+
+    Returns:
+        str: the output path
+    """
+    output_dir = os.path.join(os.path.normpath(
+        os.getcwd() + os.sep + os.pardir), 'output' + os.sep + 'experiments')
+    return os.path.join(
+        output_dir, f'summary_{Logger().get_run_id()}.md')
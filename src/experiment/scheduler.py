@@ -0,0 +1,110 @@
+"""Stage scheduler module to run the stages of an experiment run on a pool of workers."""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+from logger.logger import Logger
+
+
+class StageScheduler:
+    """
+    Runs the stages of an experiment run on a pool of worker threads. Each stage is identified by a key, so a stage
+    shared by several experiments is scheduled once and all of them wait for the same result.
+    A stage starts only when the stages it depends on have finished, so workers never block on other stages, and
+    it holds a slot of its resource while running, which bounds how many stages of each kind run at the same time.
+    A stage fails if any of the stages it depends on fails.
+    """
+
+    def __init__(self, workers: int, resources: dict[str, int]):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._resources = {name: threading.Semaphore(slots) for name, slots in resources.items()}
+        self._stages: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def stage(
+        self,
+        key: Hashable,
+        fn: Callable[..., Any],
+        deps: Optional[list[Future]] = None,
+        resource: Optional[str] = None
+    ) -> Future:
+        """
+        Schedules a stage unless a stage with the same key is already scheduled.
+
+        Args:
+            key (Hashable): the key of the stage
+            fn (Callable[..., Any]): the stage, called with the results of the stages it depends on
+            deps (Optional[list[Future]]): the stages it depends on
+            resource (Optional[str]): the resource the stage holds a slot of while running
+
+        Returns:
+            future (Future): the result of the stage
+        """
+        with self._lock:
+            if key in self._stages:
+                return self._stages[key]
+
+            future: Future = Future()
+            self._stages[key] = future
+
+        deps = deps or []
+        remaining = [len(deps)]
+        remaining_lock = threading.Lock()
+
+        def run() -> Any:
+            try:
+                if resource is None:
+                    Logger().info(f"Running stage {key}")
+                    return fn(*[dep.result() for dep in deps])
+
+                with self._resources[resource]:
+                    Logger().info(f"Running stage {key}")
+                    return fn(*[dep.result() for dep in deps])
+            except Exception as e:
+                Logger().error(f"Stage {key} failed: {e}")
+                raise
+
+        def start() -> None:
+            failed = [dep.exception() for dep in deps if dep.exception() is not None]
+
+            if len(failed) > 0:
+                future.set_exception(failed[0])  # type: ignore
+                return
+
+            self._executor.submit(run).add_done_callback(lambda f: copy_result(f, future))
+
+        def on_dep_done(_: Future) -> None:
+            with remaining_lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+
+            if ready:
+                start()
+
+        if len(deps) == 0:
+            start()
+
+        for dep in deps:
+            dep.add_done_callback(on_dep_done)
+
+        return future
+
+    def shutdown(self) -> None:
+        """
+        Waits for the running stages to finish and stops the workers.
+        """
+        self._executor.shutdown(wait=True)
+
+
+def copy_result(source: Future, target: Future) -> None:
+    """
+    Copies the result or the exception of a finished future to another future.
+
+    Args:
+        source (Future): the finished future
+        target (Future): the future to complete
+    """
+    if source.exception() is not None:
+        target.set_exception(source.exception())  # type: ignore
+    else:
+        target.set_result(source.result())
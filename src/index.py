@@ -1,14 +1,21 @@
 """Evaluating agent-based architectures for retrieval and answer generation tasks."""
 import argparse
+from typing import Optional
 from dotenv import load_dotenv
 
 from logger.logger import Logger
 from orchestrator.orchestrator import Orchestrator
+from utils.arg_utils import add_dataset_args
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     """
     Parses the command line arguments.
+    Several values of k are swept with a single retrieval at the largest k, so k is set to the largest value and
+    all the values are kept in ascending order in k_values.
+
+    Args:
+        argv (Optional[list[str]]): the arguments to parse. The arguments of the script if not specified
 
     Returns:
         argparse.Namespace: parsed arguments
@@ -18,21 +25,11 @@ def parse_args() -> argparse.Namespace:
         description='Evaluate various agent-based architectures for retrieval and answer generation tasks'
     )
 
-    parser.add_argument('-e', '--execution', choices=['eval', 'predict'], required=True,
+    parser.add_argument('-e', '--execution', choices=['eval', 'predict', 'retrieve'], required=True,
                         help='mode of execution (required)')
 
     # Dataset processing arguments
-    parser.add_argument('-d', '--dataset', choices=['locomo', 'hotpot', '2wiki', 'musique'], required=True,
-                        help='dataset to be processed (required)')
-    parser.add_argument('-c', '--conversation', type=str,
-                        help='conversation id to be extracted from the dataset - (optional)')
-    parser.add_argument('-q', '--questions', type=int,
-                        help='number of questions to be processed in each dataset sample (optional)')
-    parser.add_argument('-ct', '--category', type=int,
-                        help='category to be extracted from the dataset (optional)')
-    parser.add_argument('-l', '--limit', type=int,
-                        help='limit the number of samples to process. \
-Ignored if conversation id is provided (optional)')
+    add_dataset_args(parser)
 
     # Predict mode arguments
     parser.add_argument('-m', '--model', choices=['gpt-4o-mini', 'o3-mini', 'gpt-4o-mini-batch',
@@ -41,14 +38,31 @@ Ignored if conversation id is provided (optional)')
                         help='model deployment identifier (required in predict mode)')
 
     parser.add_argument('-a', '--agent', choices=['default', 'oracle', 'bm25', 'dense',
-                                                  'colbertv2', 'hippo'],
+                                                  'colbertv2', 'hippo', 'phrase_graph', 'bridge'],
                         default='default', help='agent to be used (required in predict mode)')
 
     parser.add_argument('-np', '--noop', action='store_true',
                         help='do not run actual prediction (optional)')
 
-    parser.add_argument('-k', '--k', type=int,
-                        help='number of documents to be retrieved for agents that support k argument (optional)')
+    parser.add_argument('-k', '--k', type=int, nargs='+',
+                        help='number of documents to be retrieved for agents that support k argument (optional). \
+Several values sweep over k with a single retrieval at the largest value, tagging each job by k')
+
+    parser.add_argument('-cc', '--concurrency', type=int, default=16,
+                        help='maximum number of chat completion requests in flight for models that do not support \
+batch deployments (optional)')
+
+    parser.add_argument('-pl', '--pipeline', action='store_true',
+                        help='stream questions through retrieval and the LLM instead of running each phase for all \
+questions. Only supported for models without batch deployments (optional)')
+
+    parser.add_argument('-rs', '--resume', type=str,
+                        help='id of a previous prediction run to resume from its checkpoint under output/checkpoints. \
+Questions already retrieved or answered are skipped (optional)')
+
+    parser.add_argument('-ps', '--prefix-stable', action='store_true',
+                        help='reuse the same context for all question batches of a corpus region so that consecutive \
+requests share a cacheable prompt prefix. Only used by agents that support batch reasoning (optional)')
 
     # Evaluation mode arguments
     parser.add_argument('-ev', '--evaluation', type=str,
@@ -65,7 +79,8 @@ Ignored if conversation id is provided (optional)')
 If not provided, an evaluation file is generated')
 
     parser.add_argument('-r', '--retrieval', action='store_true',
-                        help='run retrieval evaluation (optional)')
+                        help='run retrieval evaluation (optional). In retrieve mode, the recall is computed on \
+the retrieved documents (optional)')
 
     parser.add_argument('-mt', '--metric', action='store_true',
                         help='run metric evaluation (optional)')
@@ -73,7 +88,12 @@ If not provided, an evaluation file is generated')
     parser.add_argument('-eb', '--eval-batch', action='store_true',
                         help='run batch evaluation (optional)')
 
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+
+    args.k_values = sorted(set(args.k or []))
+    args.k = max(args.k_values) if args.k_values else None
+
+    return args
 
 
 def main():
@@ -62,6 +62,16 @@ class Logger(metaclass=Singleton):
         """
         self._logger.debug(message)
 
+    def is_debug_enabled(self) -> bool:
+        """
+        Checks whether messages at the DEBUG level are logged, so that expensive debug information is only
+        computed when it is used.
+
+        Returns:
+            enabled (bool): whether DEBUG messages are logged
+        """
+        return self._logger.isEnabledFor(logging.DEBUG)
+
     def error(self, message: str) -> None:
         """
         Logs a message at the ERROR level.
@@ -6,6 +6,7 @@ from typing import Optional
 from models.dataset import Dataset
 from models.question_answer import QuestionAnswer
 from models.retrieved_result import RetrievedResult
+from utils.token_utils import assemble_context
 
 
 class NoteBook:
@@ -18,12 +19,12 @@ class NoteBook:
         self._notes = None
         self._questions = None
 
-    def update_notes(self, notes: str) -> None:
+    def update_notes(self, notes: Optional[str]) -> None:
         """
         Updates the notebook with the given notes.
 
         Args:
-            notes (str): the notes to be added to the notebook
+            notes (Optional[str]): the notes to be added to the notebook
         """
         self._notes = notes
 
@@ -97,6 +98,9 @@ class Agent(ABC):
         self._args = args
         self._index = None
         self._corpus = None
+        self._qa_prompt: Optional[str] = None
+        # Dataset class and id of the QA prompt, so that it can be built for other models than the one of the agent
+        self._qa_prompt_source: Optional[tuple[type[Dataset], str]] = None
         self.support_batch = False
         self.standalone = False
 
@@ -140,6 +144,90 @@ class Agent(ABC):
             notebooks (list[NoteBook]): the detailed findings to help answer all questions (context)
         """
 
+    def use_qa_prompt(self, dataset: Dataset, prompt_id: str) -> None:
+        """
+        Sets the QA prompt of the agent to the prompt of the dataset for the model of the agent.
+
+        Args:
+            dataset (Dataset): the dataset indexed
+            prompt_id (str): the id of the prompt in the dataset, e.g., "qa_rel"
+        """
+        self._qa_prompt = dataset.get_prompt(prompt_id)
+        self._qa_prompt_source = (type(dataset), prompt_id)
+
+    def build_notes(self, sources: list[RetrievedResult], prompt: Optional[str]) -> Optional[str]:
+        """
+        Builds the QA prompt of a question from its retrieved sources within the context length of the model.
+        No prompt is built in retrieve mode since only the sources are used.
+
+        Args:
+            sources (list[RetrievedResult]): the retrieved sources in rank order
+            prompt (Optional[str]): the QA prompt with a {context} placeholder
+
+        Returns:
+            notes (Optional[str]): the QA prompt with the sources as context, None in retrieve mode
+        """
+        if self._args.execution == 'retrieve' or prompt is None:
+            return None
+
+        return assemble_context([source['content'] for source in sources], prompt, self._args.model)
+
+    def build_sweep_notes(
+        self,
+        sources: list[RetrievedResult],
+        k: Optional[int],
+        model: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Builds the QA prompt of a question at a retrieval depth of a sweep over several values of k from the sources
+        retrieved at the largest depth, so that the sweep indexes and retrieves only once.
+        The prompt can be built for a model other than the model of the agent, e.g., when the same retrieval
+        results are answered by several models, in which case the QA prompt of the dataset for that model is used.
+
+        Args:
+            sources (list[RetrievedResult]): the sources retrieved at the largest depth in rank order
+            k (Optional[int]): the retrieval depth, all the sources if not specified
+            model (Optional[str]): the model whose context length bounds the prompt. If not specified, the model of \
+the agent is used and no prompt is built in retrieve mode
+
+        Returns:
+            notes (Optional[str]): the QA prompt with the top k sources as context
+        """
+        if model is None:
+            return self.build_notes(sources[:k], self._qa_prompt)
+
+        if self._qa_prompt_source is None:
+            return None
+
+        dataset_type, prompt_id = self._qa_prompt_source
+
+        return assemble_context(
+            [source['content'] for source in sources[:k]], dataset_type.get_prompts(model)[prompt_id], model)
+
+    def build_notebook(self, ranked_docs: list[tuple[int, float]]) -> NoteBook:
+        """
+        Builds the notebook of a question from the documents of the indexed corpus retrieved for it.
+
+        Args:
+            ranked_docs (list[tuple[int, float]]): the position in the corpus and the score of each retrieved \
+document in rank order
+
+        Returns:
+            notebook (NoteBook): the notebook with the retrieved documents as sources and the QA prompt as notes
+        """
+        corpus = self._corpus or []
+        retrieved_docs = [RetrievedResult(
+            doc_id=corpus[idx]['doc_id'],
+            content=corpus[idx]['content'],
+            score=score
+        ) for idx, score in ranked_docs]
+
+        notebook = NoteBook()
+        notebook.update_sources(retrieved_docs)
+        notebook.update_notes(self.build_notes(retrieved_docs, self._qa_prompt))
+
+        return notebook
+
     def multiprocessing_reason(self, questions: list[str]) -> list[NoteBook]:
         """
         Processes the questions in parallel using multiprocessing.
@@ -1,11 +1,12 @@
 """A module to create a dataset class."""
 
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Callable, Iterable, Optional
 
 from logger.logger import Logger
 from models.document import Document
 from models.question_answer import QuestionAnswer
+from utils.dataset_cache import DatasetCache
 from utils.token_utils import average_content_length
 
 
@@ -59,14 +60,28 @@ class Dataset(ABC):
         self._args = args
         self._dataset = None
         self._dataset_map = None
-        self._prompt_dict = {
-            'qa_rel': (QA_PROMPT_RELEVANT if (args.model is not None) and
-                       args.model in ('o3-mini', 'gpt-4o-mini', 'gpt-4o-mini-batch') else QA_PROMPT_RELEVANT_EXPLICIT),
-            'qa_all': QA_PROMPT_ALL,
-        }
+        self._question_map = None
+        self._prompt_dict = self.get_prompts(args.model)
 
         self.name = name
 
+    @classmethod
+    def get_prompts(cls, model: Optional[str]) -> dict[str, str]:
+        """
+        Gets the prompts of the dataset for the given model, which depend on the model but not on the samples read.
+
+        Args:
+            model (Optional[str]): the model the prompts are built for, if any
+
+        Returns:
+            prompts (dict[str, str]): the prompts by prompt id
+        """
+        return {
+            'qa_rel': (QA_PROMPT_RELEVANT if (model is not None) and
+                       model in ('o3-mini', 'gpt-4o-mini', 'gpt-4o-mini-batch') else QA_PROMPT_RELEVANT_EXPLICIT),
+            'qa_all': QA_PROMPT_ALL,
+        }
+
     @abstractmethod
     def read(self) -> list[DatasetSample]:
         """
@@ -85,6 +100,34 @@ class Dataset(ABC):
             corpus (list[Document]): a list of documents from the dataset
         """
 
+    def take_samples(self, samples: Iterable[DatasetSample]) -> list[DatasetSample]:
+        """
+        Consumes a stream of dataset samples until the samples kept by process_dataset are found, so that the rest
+        of the source file is not parsed when a conversation or a limit is given.
+
+        Args:
+            samples (Iterable[DatasetSample]): the samples streamed from the source file
+
+        Returns:
+            dataset (list[DatasetSample]): the samples read
+        """
+        limit = self._args.limit
+        conversation_id = self._args.conversation
+
+        dataset = []
+        answerable = 0
+        for sample in samples:
+            dataset.append(sample)
+            if len(sample['sample']['qa']) > 0:
+                answerable += 1
+
+            if conversation_id is not None and sample['sample_id'] == conversation_id:
+                break
+            if limit is not None and 0 <= limit <= answerable:
+                break
+
+        return dataset
+
     def process_dataset(self, dataset: list[DatasetSample]) -> list[DatasetSample]:
         """
         Creates a quick lookup table for the dataset and performs any necessary processing.
@@ -105,14 +148,109 @@ class Dataset(ABC):
             for sample in dataset
         ] # type: ignore
 
+        self._index_dataset(dataset)
+
+        return dataset
+
+    def _index_dataset(self, dataset: list[DatasetSample]) -> None:
+        """
+        Creates the lookup tables of the samples and of the questions of the dataset by id.
+
+        Args:
+            dataset (list[DatasetSample]): the processed dataset
+        """
         self._dataset = dataset
         self._dataset_map = {
             sample['sample_id']: sample['sample']
             for sample in dataset
         }
 
+        # The first question is kept when the same question id appears more than once
+        self._question_map = {}
+        for sample in dataset:
+            for qa in sample['sample']['qa']:
+                self._question_map.setdefault(qa['question_id'], qa)
+
+    def _read_cached(self, file_path: str, samples_fn: Callable[[], Iterable[DatasetSample]]) -> list[DatasetSample]:
+        """
+        Reads the processed dataset from the binary cache of the given source file if it is up to date. Otherwise, the
+        samples are streamed from the source file until the ones kept are found, processed and cached.
+
+        Args:
+            file_path (str): the path of the source file of the dataset
+            samples_fn (Callable[[], Iterable[DatasetSample]]): streams the samples from the source file, which is \
+only called if the dataset is not cached
+
+        Returns:
+            dataset (list[DatasetSample]): the processed dataset
+        """
+        dataset = self._load_cached_dataset(file_path)
+        if dataset is not None:
+            return dataset
+
+        dataset = self.process_dataset(self.take_samples(samples_fn()))
+        self._save_cached_dataset(file_path, dataset)
+
         return dataset
 
+    def _load_cached_dataset(self, file_path: str) -> Optional[list[DatasetSample]]:
+        """
+        Loads the processed dataset from the binary cache of the given source file if it is up to date.
+
+        Args:
+            file_path (str): the path of the source file of the dataset
+
+        Returns:
+            dataset (Optional[list[DatasetSample]]): the processed dataset if it is cached, None otherwise
+        """
+        dataset = self._get_dataset_cache(file_path).load_samples()
+
+        if dataset is not None:
+            self._index_dataset(dataset)
+
+        return dataset
+
+    def _save_cached_dataset(self, file_path: str, dataset: list[DatasetSample]) -> None:
+        """
+        Stores the processed dataset in the binary cache of the given source file.
+
+        Args:
+            file_path (str): the path of the source file of the dataset
+            dataset (list[DatasetSample]): the processed dataset
+        """
+        self._get_dataset_cache(file_path).save_samples(dataset)
+
+    def _get_dataset_cache(self, file_path: str) -> DatasetCache:
+        """
+        Gets the binary cache of the processed dataset read from the given source file, keyed by the arguments
+        used to filter its samples and questions.
+
+        Args:
+            file_path (str): the path of the source file of the dataset
+
+        Returns:
+            cache (DatasetCache): the dataset cache
+        """
+        return DatasetCache(self.name or '', 'samples', file_path, {
+            'conversation': self._args.conversation,
+            'questions': self._args.questions,
+            'category': self._args.category,
+            'limit': self._args.limit,
+        })
+
+    def _get_corpus_cache(self, file_path: str, params: Optional[dict] = None) -> DatasetCache:
+        """
+        Gets the binary cache of the corpus read from the given source file.
+
+        Args:
+            file_path (str): the path of the source file of the corpus
+            params (Optional[dict]): the arguments used to filter the corpus, if any
+
+        Returns:
+            cache (DatasetCache): the corpus cache
+        """
+        return DatasetCache(self.name or '', 'corpus', file_path, params)
+
     def get_question(self, question_id: str) -> Optional[QuestionAnswer]:
         """
         Gets a question from the dataset.
@@ -121,22 +259,23 @@ class Dataset(ABC):
             question_id (str): the unique identifier of the question to retrieve
 
         Raises:
-            ValueError: if the dataset has not been read or the question id is not found in the dataset
+            ValueError: if the dataset has not been read
 
         Returns:
-            question (QuestionAnswer): the retrieved question
+            question (Optional[QuestionAnswer]): the retrieved question if found, None otherwise
         """
-        if not self._dataset_map:
+        if self._question_map is None:
             Logger().error("Dataset not read. Please read the dataset before getting questions.")
             raise ValueError(
                 "Dataset not read. Please read the dataset before getting questions.")
 
-        if question_id not in self._dataset_map:
+        question = self._question_map.get(question_id)
+
+        if question is None:
             Logger().error(
                 f"Question id {question_id} not found in the dataset.")
-            return None
 
-        return next((qa for qa in self._dataset_map[question_id]['qa'] if qa['question_id'] == question_id), None)
+        return question
 
     def get_supporting_docs(self, question_id: str) -> Optional[list[Document]]:
         """
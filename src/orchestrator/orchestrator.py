@@ -2,11 +2,13 @@
 
 from typing import Type
 from agents.bm25.bm25 import BM25
+from agents.bridge.bridge import Bridge
 from agents.colbertv2.colbertv2 import ColbertV2
 from agents.default.default import Default
 from agents.dense.dense import Dense
 from agents.hippo_rag.hippo_rag import HippoRAG
 from agents.oracle.oracle import Oracle
+from agents.phrase_graph.phrase_graph import PhraseGraph
 from data.hotpot.hotpot import Hotpot
 from data.locomo.locomo import Locomo
 from data.musique.musique import MuSiQue
@@ -16,6 +18,27 @@ from logger.logger import Logger
 from models.agent import Agent
 from models.dataset import Dataset
 from predictor.predictor import predictor
+from retriever.retriever import retriever
+
+# Datasets by the name used in the command line arguments
+DATASETS: dict[str, Type[Dataset]] = {
+    'locomo': Locomo,
+    'hotpot': Hotpot,
+    '2wiki': TwoWiki,
+    'musique': MuSiQue,
+}
+
+# Agents by the name used in the command line arguments
+AGENTS: dict[str, Type[Agent]] = {
+    'default': Default,
+    'oracle': Oracle,
+    'bm25': BM25,
+    'dense': Dense,
+    'colbertv2': ColbertV2,
+    'hippo': HippoRAG,
+    'phrase_graph': PhraseGraph,
+    'bridge': Bridge,
+}
 
 # pylint: disable-next=too-few-public-methods
 class Orchestrator:
@@ -27,32 +50,16 @@ class Orchestrator:
     def __init__(self, args):
         self._config = args
 
-        datasets: dict[str, Type[Dataset]] = {
-            'locomo': Locomo,
-            'hotpot': Hotpot,
-            '2wiki': TwoWiki,
-            'musique': MuSiQue,
-        }
-
-        if args.dataset not in datasets:
+        if args.dataset not in DATASETS:
             Logger().error(f"Dataset {args.dataset} not supported")
             raise ValueError(f"Dataset {args.dataset} not supported")
 
-        agents: dict[str, Type[Agent]] = {
-            'default': Default,
-            'oracle': Oracle,
-            'bm25': BM25,
-            'dense': Dense,
-            'colbertv2': ColbertV2,
-            'hippo': HippoRAG,
-        }
-
-        if args.agent not in agents:
+        if args.agent not in AGENTS:
             Logger().error(f"Agent {args.agent} not supported")
             raise ValueError(f"Agent {args.agent} not supported")
 
-        self.agent = agents[args.agent](args)
-        self.dataset = datasets[args.dataset](args)
+        self.agent = AGENTS[args.agent](args)
+        self.dataset = DATASETS[args.dataset](args)
 
     def run(self):
         """
@@ -67,6 +74,9 @@ class Orchestrator:
         elif self._config.execution == 'eval':
             Logger().info("Running predictor")
             evaluator(self._config, self.dataset)
+        elif self._config.execution == 'retrieve':
+            Logger().info("Running retriever")
+            retriever(self._config, self.dataset, self.agent)
         else:
             Logger().error(
                 f"Execution mode {self._config.execution} not supported")
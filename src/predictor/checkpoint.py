@@ -0,0 +1,138 @@
+"""Checkpoint module to resume prediction runs."""
+import json
+import os
+import threading
+from typing import Any
+
+from logger.logger import Logger
+
+
+class Checkpoint:
+    """
+    Append-only checkpoint of a prediction run stored under output/checkpoints/<run_id>.
+    Retrieval results and answers are appended per question id as they finish, and each line is flushed right away,
+    so a run that crashes only loses the results in flight. A truncated last line is ignored when loading.
+    """
+
+    def __init__(self, run_id: str):
+        self._run_id = run_id
+        self._dir = os.path.join(os.path.normpath(
+            os.getcwd() + os.sep + os.pardir), 'output' + os.sep + 'checkpoints' + os.sep + run_id)
+        self._lock = threading.Lock()
+
+        os.makedirs(self._dir, exist_ok=True)
+
+        Logger().info(f"Checkpointing prediction run at {self._dir}")
+
+    def get_run_id(self) -> str:
+        """
+        Gets the id of the checkpointed run.
+
+        Returns:
+            run_id (str): the id of the run
+        """
+        return self._run_id
+
+    def load_retrieval(self) -> dict[str, tuple[dict[str, Any], str]]:
+        """
+        Loads the checkpointed retrieval results.
+
+        Returns:
+            results (dict[str, tuple[dict[str, Any], str]]): the retrieval result and the prompt by question id
+        """
+        return {
+            line['custom_id']: ({
+                'custom_id': line['custom_id'],
+                'question': line['question'],
+                'result': line['result']
+            }, line['notes'])
+            for line in self._read('retrieval')
+        }
+
+    def append_retrieval(self, results: list[tuple[dict[str, Any], str]]) -> None:
+        """
+        Appends retrieval results to the checkpoint.
+
+        Args:
+            results (list[tuple[dict[str, Any], str]]): the retrieval results and their prompts
+        """
+        self._append('retrieval', [{**result, 'notes': notes} for result, notes in results])
+
+    def load_answers(self) -> dict[str, dict[str, Any]]:
+        """
+        Loads the checkpointed answers.
+
+        Returns:
+            answers (dict[str, dict[str, Any]]): the answer in the format of a batch output line by custom id
+        """
+        return {str(line['custom_id']): line for line in self._read('answers')}
+
+    def append_answer(self, answer: dict[str, Any]) -> None:
+        """
+        Appends an answer to the checkpoint.
+
+        Args:
+            answer (dict[str, Any]): the answer in the format of a batch output line
+        """
+        self._append('answers', [answer])
+
+    def load_batches(self) -> list[dict[str, Any]]:
+        """
+        Loads the checkpointed batch jobs.
+
+        Returns:
+            batches (list[dict[str, Any]]): the id of each batch job, the custom ids of its jobs and the path of \
+its batch file
+        """
+        return self._read('batches')
+
+    def append_batch(self, batch_id: str, custom_ids: list[str], path: str) -> None:
+        """
+        Appends a queued batch job to the checkpoint.
+
+        Args:
+            batch_id (str): the id of the batch job
+            custom_ids (list[str]): the custom ids of the jobs in the batch
+            path (str): the path of the batch file, used to queue the failed jobs again
+        """
+        self._append('batches', [{'batch_id': batch_id, 'custom_ids': custom_ids, 'path': path}])
+
+    def _append(self, name: str, lines: list[dict[str, Any]]) -> None:
+        """
+        Appends lines to a checkpoint file.
+
+        Args:
+            name (str): the name of the checkpoint file
+            lines (list[dict[str, Any]]): the lines to append
+        """
+        with self._lock, open(os.path.join(self._dir, f'{name}.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(line) + '\n' for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read(self, name: str) -> list[dict[str, Any]]:
+        """
+        Reads the lines of a checkpoint file, skipping a truncated last line.
+
+        Args:
+            name (str): the name of the checkpoint file
+
+        Returns:
+            lines (list[dict[str, Any]]): the lines of the checkpoint file
+        """
+        path = os.path.join(self._dir, f'{name}.jsonl')
+
+        if not os.path.exists(path):
+            return []
+
+        lines = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    lines.append(json.loads(line))
+                except json.JSONDecodeError:
+                    Logger().warn(f"Skipping truncated line in checkpoint file {path}")
+
+        Logger().info(f"Loaded {len(lines)} lines from checkpoint file {path}")
+
+        return lines
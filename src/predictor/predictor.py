@@ -1,16 +1,27 @@
 """Predictor module."""
 import json
 import os
-from typing import Optional
+import queue
+import threading
+from typing import Any, Optional
 from openai.types.chat.chat_completion import ChatCompletion
-from openai.types import Batch
-from azure_open_ai.batch import queue_batch_job, wait_for_batch_job_and_save_result
-from azure_open_ai.chat_completions import chat_completions
+from azure_open_ai.batch import retrieve_batch_job, write_batch_files
+from azure_open_ai.batch_manager import BatchManager
+from azure_open_ai.chat_completions import chat_completions, chat_completions_stream
+from azure_open_ai.response_cache import split_cached_jobs
 from logger.logger import Logger
 from models.agent import Agent
 from models.dataset import Dataset
+from predictor.checkpoint import Checkpoint
+from retriever.retriever import expand_k_values, get_retrieval_output_path, retrieve_questions
 from utils.model_utils import supports_batch, supports_temperature_param
-from utils.token_utils import estimate_cost, estimate_num_tokens, get_max_output_tokens, truncate_prompt_if_needed
+from utils.question_utils import get_custom_ids
+from utils.token_utils import TokenCounter, estimate_cost, get_max_output_tokens, truncate_prompt_if_needed
+
+# Number of questions retrieved at once in pipeline mode, small enough for the LLM to start early
+RETRIEVAL_CHUNK_SIZE_PIPELINE = 64
+# Maximum number of requests and answers waiting between the stages of the pipeline
+PIPELINE_QUEUE_SIZE = 256
 
 
 def predictor(args, dataset: Dataset, agent: Agent) -> None:
@@ -24,7 +35,8 @@ def predictor(args, dataset: Dataset, agent: Agent) -> None:
         agent (Agent): the agent to use
 
     Raises:
-        ValueError: if the model deployment identifier is not provided
+        ValueError: if the model deployment identifier is not provided or the agent does not support a sweep over \
+several values of k
     """
     if args.model is None and not args.noop:
         Logger().error(
@@ -32,62 +44,79 @@ def predictor(args, dataset: Dataset, agent: Agent) -> None:
 Please provide the model deployment identifier using the -m flag.""")
         raise ValueError("Model deployment identifier not provided")
 
+    if len(args.k_values) > 1 and (agent.support_batch or agent.standalone):
+        Logger().error(f"Agent {args.agent} does not support a sweep over several values of k.")
+        raise ValueError(f"Agent {args.agent} does not support a sweep over several values of k")
+
     _ = dataset.read()
     agent.index(dataset)
 
-    batches: Optional[list[Batch]] = None
+    checkpoint = Checkpoint(args.resume or Logger().get_run_id())
 
     if agent.support_batch:
         # Batch here means that questions are batched together in a single request and
         # batches are sent in a batch request
-        batches = batch_question_answering(dataset, agent, args)
+        batch_question_answering(dataset, agent, args, checkpoint)
+    elif args.pipeline and not agent.standalone:
+        pipeline_question_answering(dataset, agent, args, checkpoint)
     else:
-        batches = question_answering(
-            dataset, agent, args)
+        question_answering(
+            dataset, agent, args, checkpoint)
 
-    if batches is not None:
-        for i, batch in enumerate(batches):
-            Logger().info(
-                f"Batch job queued with ID: {batch.id} and status: {batch.status}")
+    TokenCounter().log_stats()
 
-            wait_for_batch_job_and_save_result(batch, get_qa_output_path(str(i)))
-
-# pylint: disable-next=too-many-locals
-def question_answering(dataset: Dataset, agent: Agent, args) -> Optional[list[Batch]]:
+def question_answering(dataset: Dataset, agent: Agent, args, checkpoint: Checkpoint) -> None:
     """
     Generates predictions for the given dataset using the specified agent.
     The predictions are generated by indexing the dataset and then using the agent to process it.
+    Retrieval results are checkpointed in chunks of questions, and questions already retrieved or answered in
+    the checkpoint are skipped. In a sweep over several values of k, each question is retrieved once at the largest k
+    and answered once per k.
     """
-    questions = dataset.get_questions()
+    results = retrieve_questions(dataset, agent, checkpoint)
 
-    all_questions = [q for _, question_set in questions.items()
-                     for q in question_set]
+    answer_questions(results, agent, args, checkpoint)
 
-    notebooks = agent.multiprocessing_reason(
-        questions=[q['question'] for q in all_questions])
 
-    results = [({'custom_id': question["question_id"],
-                 'question': question['question'],
-                 'result': result.get_sources()}, result.get_notes())
-               for result, question in zip(notebooks, all_questions)]
+def answer_questions(
+    results: list[tuple[dict[str, Any], Optional[str]]],
+    agent: Agent,
+    args,
+    checkpoint: Checkpoint,
+    postfix: Optional[str] = None,
+) -> None:
+    """
+    Answers the retrieved questions with the LLM, or with the notes of the agent if the agent is standalone, and
+    writes the retrieval results and the answers. Questions already answered in the checkpoint are skipped.
 
-    with open(get_retrieval_output_path(), 'w', encoding='utf-8') as f:
+    Args:
+        results (list[tuple[dict[str, Any], Optional[str]]]): the retrieval result and the prompt of each question
+        agent (Agent): the agent that retrieved the results
+        args (Namespace): the arguments passed to the script
+        checkpoint (Checkpoint): the checkpoint of the run
+        postfix (Optional[str]): the postfix of the output files, e.g., the experiment of an experiment run. If \
+given, the prompts are built again for the model of the arguments
+    """
+    if not agent.standalone:
+        results = expand_k_values(results, agent, args.k_values, None if postfix is None else args.model)
+
+    with open(get_retrieval_output_path(postfix), 'w', encoding='utf-8') as f:
         for result_json, _ in results:
             r = json.dumps(result_json)
             f.write(r + '\n')
 
     if agent.standalone:
-        with open(get_qa_output_path(), 'w', encoding='utf-8') as f:
-            for result, question in zip(notebooks, all_questions):
+        with open(get_qa_output_path(postfix), 'w', encoding='utf-8') as f:
+            for result, notes in results:
                 result_json = {
-                    "custom_id": question["question_id"],
+                    "custom_id": result["custom_id"],
                     "response": {
                         "body": {
                             "choices": [
                                 {
                                     "message": {
                                         "role": "assistant",
-                                        "content": result.get_notes()
+                                        "content": notes
                                     }
                                 }
                             ]
@@ -97,60 +126,203 @@ def question_answering(dataset: Dataset, agent: Agent, args) -> Optional[list[Ba
                 r = json.dumps(result_json)
                 f.write(r + '\n')
 
-        return None
+        return
 
-    prompts = {}
-    for result_json, prompt in results:
-        prompts[result_json['custom_id']] = prompt
+    answers = checkpoint.load_answers()
+    results = [(result_json, prompt) for result_json, prompt in results if result_json['custom_id'] not in answers]
 
-    guard_job(results, args.model, args.noop)
+    if len(results) > 0:
+        guard_job(results, args.model, args.noop)  # type: ignore
 
     open_ai_requests = [
-        {
-            "custom_id": question["question_id"],
-            "method": "POST",
-            "url": "/chat/completions",
-            "body": {
-                "model": args.model,
-                "messages": [
-                    {"role": "system",
-                     "content": truncate_prompt_if_needed(prompts[question["question_id"]], args.model)},
-                    {"role": "user", "content": question["question"]}
-                ],
-                "stop": ["\n"],
-                "temperature": default_job_args['temperature'] if supports_temperature_param(args.model) else None,
-                "frequency_penalty": default_job_args['frequency_penalty'],
-                "presence_penalty": default_job_args['presence_penalty'],
-                "max_completion_tokens": 500,
-            },
-        }
-        for question in all_questions
+        get_qa_job(result_json['custom_id'], result_json['question'], prompt, args.model)  # type: ignore
+        for result_json, prompt in results
     ]
 
-    if not supports_batch(args.model):
-        results = chat_completions([
-            {
-                "custom_id": open_ai_request['custom_id'],
-                **open_ai_request['body']
-            }
-            for open_ai_request in open_ai_requests
-        ])
+    answer_jobs(open_ai_requests, answers, args, checkpoint, get_qa_output_path(postfix))
 
-        chat_completions_to_jsonl(results)
 
-        return None
+# pylint: disable-next=too-many-locals,too-many-statements
+def pipeline_question_answering(dataset: Dataset, agent: Agent, args, checkpoint: Checkpoint) -> None:
+    """
+    Generates predictions for the given dataset streaming the questions through retrieval and the LLM, instead of
+    running each phase for all questions before the next one.
+    A retrieval thread retrieves chunks of questions and queues their requests as soon as each chunk finishes,
+    the LLM engine sends them while the next chunk is being retrieved, and a writer thread appends the answers to
+    disk as they return. Queues between stages are bounded, so only a few chunks of prompts are held in memory.
 
-    batched_jobs = split_jobs(open_ai_requests, 190)
+    Args:
+        dataset (Dataset): the dataset to be processed
+        agent (Agent): the agent to use
+        args (Namespace): the arguments passed to the script
+        checkpoint (Checkpoint): the checkpoint of the run
+
+    Raises:
+        ValueError: if the model supports batch deployments
+    """
+    if supports_batch(args.model):
+        raise ValueError("Pipeline mode is only supported for models without batch deployments.")
+
+    questions = dataset.get_questions()
+
+    all_questions = [q for _, question_set in questions.items()
+                     for q in question_set]
+
+    retrieved = checkpoint.load_retrieval()
+    answers = checkpoint.load_answers()
+    answered = {q['question_id'] for q in all_questions
+                if all(custom_id in answers for custom_id in get_custom_ids(q['question_id'], args.k_values))}
+    pending_questions = [q for q in all_questions if q['question_id'] not in answered]
 
     Logger().info(
-        f"Total number of batches: {len(batched_jobs)}.")
+        f"Running pipeline for {len(pending_questions)} questions. Questions already answered: {len(answered)}.")
+
+    jobs_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    results_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    errors: list[Exception] = []
+    failed: list[str] = []
+
+    def retrieve() -> None:
+        # Estimated cost of the jobs queued by all the chunks so far, which is guarded instead of the cost of each chunk
+        queued_cost = 0.0
+
+        try:
+            with open(get_retrieval_output_path(), 'w', encoding='utf-8') as f:
+                for question in all_questions:
+                    if question['question_id'] in answered and question['question_id'] in retrieved:
+                        for result_json, _ in expand_k_values(
+                                [retrieved[question['question_id']]], agent, args.k_values):
+                            f.write(json.dumps(result_json) + '\n')
+
+                for i in range(0, len(pending_questions), RETRIEVAL_CHUNK_SIZE_PIPELINE):
+                    if stop.is_set():
+                        break
+
+                    chunk = pending_questions[i:i + RETRIEVAL_CHUNK_SIZE_PIPELINE]
+                    missing = [q for q in chunk if q['question_id'] not in retrieved]
+
+                    if len(missing) > 0:
+                        notebooks = agent.multiprocessing_reason(
+                            questions=[q['question'] for q in missing])
+
+                        chunk_results = [({'custom_id': question["question_id"],
+                                           'question': question['question'],
+                                           'result': result.get_sources()}, result.get_notes())
+                                         for result, question in zip(notebooks, missing)]
+
+                        checkpoint.append_retrieval(chunk_results)
+                        retrieved.update({result_json['custom_id']: (result_json, notes)
+                                          for result_json, notes in chunk_results})
+
+                    results = expand_k_values(
+                        [retrieved[question['question_id']] for question in chunk], agent, args.k_values)
+
+                    for result_json, _ in results:
+                        f.write(json.dumps(result_json) + '\n')
+                    f.flush()
+
+                    results = [(result_json, prompt) for result_json, prompt in results
+                               if result_json['custom_id'] not in answers]
+
+                    if len(results) > 0:
+                        queued_cost = guard_job(results, args.model, args.noop, queued_cost)
+
+                    for result_json, prompt in results:
+                        job = get_qa_job(result_json['custom_id'], result_json['question'], prompt, args.model)
+                        jobs_queue.put({"custom_id": job['custom_id'], **job['body']})
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            errors.append(e)
+        finally:
+            jobs_queue.put(None)
+
+    def write() -> None:
+        with open(get_qa_output_path(), 'w', encoding='utf-8') as f:
+            for result_json in answers.values():
+                f.write(json.dumps(result_json) + '\n')
+
+            for result_json in iter(results_queue.get, None):
+                checkpoint.append_answer(result_json)
+                f.write(json.dumps(result_json) + '\n')
+                f.flush()
+
+    retrieval_thread = threading.Thread(target=retrieve, daemon=True)
+    writer_thread = threading.Thread(target=write, daemon=True)
+    retrieval_thread.start()
+    writer_thread.start()
+
+    try:
+        chat_completions_stream(
+            iter(jobs_queue.get, None),
+            concurrency=args.concurrency,
+            on_complete=lambda completion, custom_id: results_queue.put(completion_to_json(completion, custom_id)),
+            on_error=lambda _, custom_id: failed.append(custom_id))
+    finally:
+        # Unblocks the retrieval thread if the engine stopped before consuming all the jobs
+        stop.set()
+        while retrieval_thread.is_alive():
+            try:
+                jobs_queue.get(timeout=1)
+            except queue.Empty:
+                pass
+
+        results_queue.put(None)
+        writer_thread.join()
+
+    if len(errors) > 0:
+        Logger().error(f"Retrieval stage of the pipeline failed: {errors[0]}")
+        raise errors[0]
+
+    if len(failed) > 0:
+        Logger().warn(
+            f"{len(failed)} questions could not be answered. Resume the run with -rs {checkpoint.get_run_id()} \
+to retry them.")
+
 
-    return [queue_batch_job(batch) for batch in batched_jobs if batch is not None]
+def get_qa_job(custom_id: str, question: str, prompt: str, model: str) -> dict:
+    """
+    Builds the chat completion job to answer a single question.
 
+    Args:
+        custom_id (str): the custom id of the job
+        question (str): the question
+        prompt (str): the system prompt with the retrieved context
+        model (str): the model deployment identifier
 
-def batch_question_answering(dataset: Dataset, agent: Agent, args) -> Optional[list[Batch]]:
+    Returns:
+        dict: the job in the format of a batch request
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system",
+                 "content": truncate_prompt_if_needed(prompt, model)},
+                {"role": "user", "content": question}
+            ],
+            "stop": ["\n"],
+            "temperature": default_job_args['temperature'] if supports_temperature_param(model) else None,
+            "frequency_penalty": default_job_args['frequency_penalty'],
+            "presence_penalty": default_job_args['presence_penalty'],
+            "max_completion_tokens": 500,
+        },
+    }
+
+
+def batch_question_answering(
+    dataset: Dataset,
+    agent: Agent,
+    args,
+    checkpoint: Checkpoint,
+    postfix: Optional[str] = None
+) -> None:
     """
     Generates predictions for the given dataset using the specified agent.
+    Question batches already answered in the checkpoint are skipped.
+    The answers are written to the QA output file with the given postfix, if any.
     """
     questions = dataset.get_questions()
 
@@ -158,13 +330,18 @@ def batch_question_answering(dataset: Dataset, agent: Agent, args) -> Optional[l
                                    for _, question_set in questions.items()
                                    for q in question_set])
 
+    # Batches are planned deterministically, so a resumed run assigns the same custom ids to the same batches
     results = [({
-        'custom_id': f'{Logger().get_run_id()}-{i}',
+        'custom_id': f'{checkpoint.get_run_id()}-{i}',
         'question': notebook.get_questions(),
         'result': notebook.get_sources()
     }, notebook.get_notes()) for i, notebook in enumerate(notebooks)]
 
-    guard_job(results, args.model, args.noop)
+    answers = checkpoint.load_answers()
+    results = [(result, context) for result, context in results if result['custom_id'] not in answers]
+
+    if len(results) > 0:
+        guard_job(results, args.model, args.noop)
 
     jobs = [{
             "custom_id": result['custom_id'],
@@ -211,8 +388,33 @@ def batch_question_answering(dataset: Dataset, agent: Agent, args) -> Optional[l
             }
             for (result, context) in results]
 
+    answer_jobs(jobs, answers, args, checkpoint, get_qa_output_path(postfix))
+
+
+def answer_jobs(
+    jobs: list[dict],
+    answers: dict[str, dict],
+    args,
+    checkpoint: Checkpoint,
+    output_path: Optional[str] = None
+) -> None:
+    """
+    Sends the jobs that are not answered yet, either as chat completions or as batch jobs, and saves all the
+    answers to a single result file.
+    Chat completion answers are checkpointed as they complete. Batch jobs are checkpointed once queued, so that
+    a resumed run waits for them instead of queuing them again, and their answers once their job finishes.
+
+    Args:
+        jobs (list[dict]): the jobs that are not answered in the checkpoint
+        answers (dict[str, dict]): the answers in the checkpoint by custom id
+        args (Namespace): the arguments passed to the script
+        checkpoint (Checkpoint): the checkpoint of the run
+        output_path (Optional[str]): the path of the result file. The QA output path of the run if not specified
+    """
+    output_path = output_path or get_qa_output_path()
+
     Logger().info(
-        f"Total number of jobs: {len(jobs)}.")
+        f"Total number of jobs: {len(jobs)}. Jobs already answered: {len(answers)}.")
 
     if not supports_batch(args.model):
         results = chat_completions([
@@ -221,82 +423,110 @@ def batch_question_answering(dataset: Dataset, agent: Agent, args) -> Optional[l
                 **open_ai_request['body']
             }
             for open_ai_request in jobs
-        ])
+        ], concurrency=args.concurrency,
+            on_complete=lambda completion, custom_id: checkpoint.append_answer(
+                completion_to_json(completion, custom_id)))
 
-        chat_completions_to_jsonl(results)
+        chat_completions_to_jsonl(results, list(answers.values()), output_path)
 
-        return None
+        return
 
-    # Estimate the size of each job in MBs
-    batched_jobs = split_jobs(jobs, 190)
+    batch_manager = BatchManager(
+        on_submit=lambda batch, shard: checkpoint.append_batch(batch.id, shard[1], shard[0]),
+        on_result=checkpoint.append_answer)
 
-    Logger().info(
-        f"Total number of batches: {len(batched_jobs)}.")
+    # Batches queued before resuming the run are waited for again unless all their jobs are answered
+    queued_batches = [batch for batch in checkpoint.load_batches()
+                      if any(custom_id not in answers for custom_id in batch['custom_ids'])]
+    queued_ids = {custom_id for batch in queued_batches for custom_id in batch['custom_ids']}
+
+    for batch in queued_batches:
+        batch_manager.add(retrieve_batch_job(batch['batch_id']), (batch.get('path'), batch['custom_ids']))
+
+    if len(queued_batches) > 0:
+        Logger().info(f"Waiting for {len(queued_batches)} batches queued before resuming the run.")
 
-    return [queue_batch_job(batch) for batch in batched_jobs]
+    cached_results, jobs = split_cached_jobs([job for job in jobs if job['custom_id'] not in queued_ids])
 
+    if len(jobs) > 0:
+        batch_manager.submit(write_batch_files(jobs))
 
-def split_jobs(jobs: list[dict], max_size: int) -> list[list[dict]]:
+    failed = batch_manager.wait(output_path, list(answers.values()) + cached_results)
+
+    if len(failed) > 0:
+        Logger().warn(
+            f"{len(failed)} jobs could not be answered. Resume the run with -rs {checkpoint.get_run_id()} \
+to retry them.")
+
+
+def chat_completions_to_jsonl(
+    results: list[tuple[ChatCompletion, str]],
+    previous_results: Optional[list[dict]] = None,
+    output_path: Optional[str] = None
+) -> None:
     """
-    Splits the jobs into smaller batches if the total size exceeds the maximum size.
+    Convert the results of the chat completions to JSONL format.
 
     Args:
-        jobs (list[dict]): the list of jobs
-        max_size (int): the maximum size of each batch
-
-    Returns:
-        list[list[dict]]: the list of batches
+        results (list[tuple[dict, str]]): the results of the chat completions
+        previous_results (Optional[list[dict]]): the results of a previous run in JSONL format, written first
+        output_path (Optional[str]): the path of the result file. The QA output path of the run if not specified
     """
-    batched_jobs = []
-    current_batch = []
-    current_batch_size = 0
+    prompt_tokens = 0
+    cached_tokens = 0
+
+    with open(output_path or get_qa_output_path(), 'w', encoding='utf-8') as f:
+        for result_json in previous_results or []:
+            f.write(json.dumps(result_json) + '\n')
 
-    for job in jobs:
-        job_size = len(json.dumps(job).encode('utf-8')) / \
-            (1024 * 1024)  # Convert bytes to MB
-        if current_batch_size + job_size > max_size:
-            batched_jobs.append(current_batch)
-            current_batch = []
-            current_batch_size = 0
-        current_batch.append(job)
-        current_batch_size += job_size
+        for result, custom_id in results:
+            result_json = completion_to_json(result, custom_id)
+            prompt_tokens += result_json['response']['body']['usage']['prompt_tokens']
+            cached_tokens += result_json['response']['body']['usage']['prompt_tokens_details']['cached_tokens']
 
-    if len(current_batch) > 0:
-        batched_jobs.append(current_batch)
+            f.write(json.dumps(result_json) + '\n')
 
-    return batched_jobs
+    Logger().info(
+        f"Cached prompt tokens: {cached_tokens} out of {prompt_tokens} \
+({100.0 * cached_tokens / max(1, prompt_tokens):.2f}%)")
 
 
-def chat_completions_to_jsonl(results: list[tuple[ChatCompletion, str]]) -> None:
+def completion_to_json(result: ChatCompletion, custom_id: str) -> dict:
     """
-    Convert the results of the chat completions to JSONL format.
+    Convert a chat completion to the format of a line of a batch output file.
 
     Args:
-        results (list[tuple[dict, str]]): the results of the chat completions
+        result (ChatCompletion): the chat completion
+        custom_id (str): the custom id of the job
+
+    Returns:
+        dict: the chat completion in the format of a batch output line
     """
-    with open(get_qa_output_path(), 'w', encoding='utf-8') as f:
-        for result, custom_id in results:
-            r = json.dumps({
-                "custom_id": custom_id,
-                "response": {
-                    "body": {
-                        "choices": [
-                            {
-                                "message": {
-                                    "role": "assistant",
-                                    "content": result.choices[0].message.content
-                                }
-                            }
-                        ],
-                        "usage": {
-                            "completion_tokens": result.usage.completion_tokens if result.usage else 0,
-                            "prompt_tokens": result.usage.prompt_tokens if result.usage else 0,
-                            "total_tokens": result.usage.total_tokens if result.usage else 0
+    details = result.usage.prompt_tokens_details if result.usage else None
+
+    return {
+        "custom_id": custom_id,
+        "response": {
+            "body": {
+                "choices": [
+                    {
+                        "message": {
+                            "role": "assistant",
+                            "content": result.choices[0].message.content
                         }
                     }
+                ],
+                "usage": {
+                    "completion_tokens": result.usage.completion_tokens if result.usage else 0,
+                    "prompt_tokens": result.usage.prompt_tokens if result.usage else 0,
+                    "total_tokens": result.usage.total_tokens if result.usage else 0,
+                    "prompt_tokens_details": {
+                        "cached_tokens": (details.cached_tokens or 0) if details else 0
+                    }
                 }
-            })
-            f.write(r + '\n')
+            }
+        }
+    }
 
 
 def get_qa_output_path(postfix: Optional[str] = None) -> str:
@@ -314,20 +544,7 @@ def get_qa_output_path(postfix: Optional[str] = None) -> str:
         output_dir, name)
 
 
-def get_retrieval_output_path() -> str:
-    """
-    Get the output path for the batch job results.
-
-    Returns:
-        str: the output path
-    """
-    output_dir = os.path.join(os.path.normpath(
-        os.getcwd() + os.sep + os.pardir), 'output' + os.sep + 'retrieval_jobs')
-    return os.path.join(
-        output_dir, f'retrieval_results_{Logger().get_run_id()}.jsonl')
-
-
-def guard_job(results: list[tuple[dict, str]], model: str, stop: bool) -> None:
+def guard_job(results: list[tuple[dict, str]], model: str, stop: bool, queued_cost: float = 0.0) -> float:
     """
     Guard the job based on the estimated cost.
 
@@ -335,9 +552,14 @@ def guard_job(results: list[tuple[dict, str]], model: str, stop: bool) -> None:
         results (list[tuple[dict, str]]): the results of the job
         model (str): the deployment model name
         stop (bool): whether to stop the job
+        queued_cost (float): the estimated cost of the jobs of the same run already queued, e.g., by the previous \
+chunks of a pipeline, which counts towards the cost limits
 
     Raises:
         RuntimeError: if the cost exceeds $2.0
+
+    Returns:
+        cost (float): the estimated cost of the jobs already queued and the jobs of the results
     """
     if not isinstance(model, str) or len(model) <= 0:
         raise ValueError(
@@ -349,10 +571,10 @@ def guard_job(results: list[tuple[dict, str]], model: str, stop: bool) -> None:
             "Returning without queuing job. Please check the arguments."
         )
 
-    cost = 0.0
+    cost = queued_cost
 
-    for _, prompt in results:
-        token_count = estimate_num_tokens(prompt, model)
+    # Prompts are counted once here and the counts are reused when the prompts are truncated and rate limited
+    for token_count in TokenCounter().count_batch([prompt for _, prompt in results], model):
         cost += estimate_cost(token_count, model)
         if token_count > 15000:
             Logger().warn(
@@ -365,7 +587,8 @@ def guard_job(results: list[tuple[dict, str]], model: str, stop: bool) -> None:
     if cost > 0.0:
         Logger().info(f"Estimated cost: {cost:.2f}")
 
-    if cost > 0.4:
+    # Warns once when the jobs queued in several calls exceed the limit
+    if cost > 0.4 >= queued_cost:
         Logger().warn(
             "Estimated cost exceeds $0.4. \
 Please review the questions and ensure they are not too verbose.")
@@ -376,6 +599,8 @@ Please review the questions and ensure they are not too verbose.")
         )
         raise RuntimeError("Program terminated forcefully.")
 
+    return cost
+
 
 default_job_args = {
     'temperature': 0.0,
@@ -0,0 +1,166 @@
+"""Retriever module to run the retrieval stage of the agents without the LLM."""
+import json
+import os
+from typing import Any, Optional
+
+from evaluator.retrieval_evaluator import K_LIST, eval_retrieval_recall
+from logger.logger import Logger
+from models.agent import Agent
+from models.dataset import Dataset
+from models.document import Document
+from predictor.checkpoint import Checkpoint
+from utils.question_utils import get_custom_ids
+
+# Number of questions retrieved between two checkpoints
+RETRIEVAL_CHUNK_SIZE = 1_000
+
+
+def retriever(args, dataset: Dataset, agent: Agent) -> None:
+    """
+    Indexes the dataset and retrieves the documents for its questions using the specified agent, without building
+    prompts, estimating costs or sending requests to the LLM. The retrieval results are written in the same format
+    as the retrieval results of the predictor, and the recall is computed inline if requested.
+    In a sweep over several values of k, the documents are retrieved once at the largest k and the results of each k
+    are sliced from them.
+
+    Args:
+        args (Namespace): the arguments passed to the script
+        dataset (Dataset): the dataset to be processed
+        agent (Agent): the agent to use
+
+    Raises:
+        ValueError: if the agent does not retrieve documents for each question
+    """
+    if agent.support_batch:
+        Logger().error(f"Agent {args.agent} does not retrieve documents for each question.")
+        raise ValueError(f"Agent {args.agent} does not support retrieve mode")
+
+    _ = dataset.read()
+    agent.index(dataset)
+
+    checkpoint = Checkpoint(args.resume or Logger().get_run_id())
+
+    results = retrieve_questions(dataset, agent, checkpoint)
+    sweep_results = expand_k_values(results, agent, args.k_values)
+
+    output_path = get_retrieval_output_path()
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for result_json, _ in sweep_results:
+            f.write(json.dumps(result_json) + '\n')
+
+    Logger().info(f"Saved {len(sweep_results)} retrieval results to {output_path}")
+
+    if args.retrieval:
+        Logger().info("Evaluating retrieval score")
+
+        recall_at_k = eval_retrieval_recall([(
+            dataset.get_supporting_docs(result_json['custom_id']),
+            [Document(doc_id=result['doc_id'], content=result['content']) for result in result_json['result']]
+        ) for result_json, _ in results], k_list=sorted(set(K_LIST) | set(args.k_values)))
+
+        for k, recall in recall_at_k.items():
+            Logger().info(f"Recall at {k}: {recall}")
+
+
+def retrieve_questions(
+    dataset: Dataset,
+    agent: Agent,
+    checkpoint: Checkpoint
+) -> list[tuple[dict[str, Any], Optional[str]]]:
+    """
+    Retrieves the documents for all the questions of the dataset in chunks of questions using the agent.
+    Retrieval results are checkpointed as each chunk finishes, and questions already retrieved in the checkpoint
+    are skipped.
+
+    Args:
+        dataset (Dataset): the dataset already read
+        agent (Agent): the agent with the dataset already indexed
+        checkpoint (Checkpoint): the checkpoint of the run
+
+    Returns:
+        results (list[tuple[dict[str, Any], Optional[str]]]): the retrieval result and the prompt of each question \
+in the order of the dataset
+    """
+    questions = dataset.get_questions()
+
+    all_questions = [q for _, question_set in questions.items()
+                     for q in question_set]
+
+    retrieved = checkpoint.load_retrieval()
+    pending_questions = [q for q in all_questions if q['question_id'] not in retrieved]
+
+    if len(retrieved) > 0:
+        Logger().info(
+            f"Resuming run {checkpoint.get_run_id()}: {len(all_questions) - len(pending_questions)} \
+questions already retrieved")
+
+    for i in range(0, len(pending_questions), RETRIEVAL_CHUNK_SIZE):
+        chunk = pending_questions[i:i + RETRIEVAL_CHUNK_SIZE]
+
+        notebooks = agent.multiprocessing_reason(
+            questions=[q['question'] for q in chunk])
+
+        chunk_results = [({'custom_id': question["question_id"],
+                           'question': question['question'],
+                           'result': result.get_sources()}, result.get_notes())
+                         for result, question in zip(notebooks, chunk)]
+
+        checkpoint.append_retrieval(chunk_results)  # type: ignore
+        retrieved.update({result_json['custom_id']: (result_json, notes) for result_json, notes in chunk_results})
+
+        Logger().info(f"Retrieved documents for {len(retrieved)} out of {len(all_questions)} questions")
+
+    return [retrieved[question['question_id']] for question in all_questions]
+
+
+def expand_k_values(
+    results: list[tuple[dict[str, Any], Optional[str]]],
+    agent: Agent,
+    k_values: Optional[list[int]],
+    model: Optional[str] = None
+) -> list[tuple[dict[str, Any], Optional[str]]]:
+    """
+    Derives the retrieval results and prompts of each retrieval depth of a sweep over several values of k by slicing
+    the ranked sources retrieved at the largest depth. The custom ids of the derived results are tagged by k.
+    The results are returned unchanged if there is a single retrieval depth, unless the prompts are built for a
+    given model.
+
+    Args:
+        results (list[tuple[dict[str, Any], Optional[str]]]): the retrieval results at the largest depth and their \
+prompts
+        agent (Agent): the agent that retrieved the results
+        k_values (Optional[list[int]]): the retrieval depths of the sweep in ascending order
+        model (Optional[str]): the model the prompts are built for. The model of the agent if not specified
+
+    Returns:
+        results (list[tuple[dict[str, Any], Optional[str]]]): the retrieval results and prompts of each depth
+    """
+    if model is None and (not k_values or len(k_values) <= 1):
+        return results
+
+    return [({
+        'custom_id': custom_id,
+        'question': result_json['question'],
+        'result': result_json['result'][:k]
+    }, agent.build_sweep_notes(result_json['result'], k, model))
+        for result_json, _ in results
+        for k, custom_id in zip(k_values or [None], get_custom_ids(result_json['custom_id'], k_values))]
+
+
+def get_retrieval_output_path(postfix: Optional[str] = None) -> str:
+    """
+    Get the output path for the retrieval results.
+
+    Args:
+        postfix (Optional[str]): the postfix of the file name, e.g., the experiment of an experiment run
+
+    Returns:
+        str: the output path
+    """
+    output_dir = os.path.join(os.path.normpath(
+        os.getcwd() + os.sep + os.pardir), 'output' + os.sep + 'retrieval_jobs')
+    name = (f'retrieval_results_{Logger().get_run_id()}.jsonl'
+            if postfix is None else f'retrieval_results_{Logger().get_run_id()}_{postfix}.jsonl')
+    return os.path.join(
+        output_dir, name)
@@ -0,0 +1,54 @@
+"""Running a matrix of experiments with shared stages from an experiment config."""
+import argparse
+from typing import Optional
+from dotenv import load_dotenv
+
+from experiment.config import load_config
+from experiment.runner import ExperimentRunner
+from logger.logger import Logger
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+
+    Args:
+        argv (Optional[list[str]]): the arguments to parse. The arguments of the script if not specified
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='agent-eval-mem-experiments',
+        description='Run a matrix of experiments over datasets, agents, values of k and models, running the stages \
+shared by several experiments once'
+    )
+
+    parser.add_argument('-c', '--config', type=str, required=True,
+                        help='path to the JSON config of the experiment run (required)')
+
+    parser.add_argument('-rs', '--resume', type=str,
+                        help='id of a previous experiment run to resume from its checkpoints under \
+output/checkpoints (optional)')
+
+    return parser.parse_args(argv)
+
+
+def main():
+    """
+    Entry point to run a matrix of experiments.
+    """
+    args = parse_args()
+
+    config = load_config(args.config)
+
+    ExperimentRunner(config, args.resume or Logger().get_run_id()).run()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    Logger().info(
+        f"Starting experiment run with execution id: {Logger().get_run_id()}")
+    main()
+    Logger().info(
+        f"Terminating experiment run with execution id: {Logger().get_run_id()}")
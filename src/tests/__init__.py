@@ -0,0 +1 @@
+"""Unit tests. Run them from the src folder with `python -m unittest discover tests`."""
@@ -0,0 +1,123 @@
+"""Tests of the context tokens per question of the question batches planned by the default agent."""
+import random
+import unittest
+from typing import Optional
+from unittest import mock
+
+from agents.default.default import (MAX_BATCH_SIZE, MAX_SHARED_BATCH_SIZE, ContextTokenCounter,
+                                    get_context_doc_indices, plan_batches)
+from models.document import Document
+from models.question_answer import QuestionAnswer, QuestionCategory
+from utils.token_utils import TokenCounter
+
+# Maximum number of tokens of the context of a batch
+MAX_TOKENS = 20000
+# Number of words of each document, which are counted as one token each
+DOC_WORDS = 100
+
+
+def count_words(_, texts: list[str], __: str) -> list[int]:
+    """
+    Counts one token per word so that the tests do not need to download an encoding.
+    """
+    return [len(text.split()) for text in texts]
+
+
+def build_corpus(
+    num_folders: int,
+    questions_per_folder: int,
+    docs_per_question: int
+) -> tuple[list[Document], list[QuestionAnswer]]:
+    """
+    Builds a corpus where each question is supported by the first two of its own contiguous documents.
+    """
+    docs: list[Document] = []
+    questions: list[QuestionAnswer] = []
+
+    for folder in range(num_folders):
+        folder_id: Optional[str] = f'conv-{folder}' if num_folders > 1 else None
+        for question in range(questions_per_folder):
+            question_docs = [Document(doc_id=f'{folder}-{question}-{i}', content=' '.join(['word'] * DOC_WORDS),
+                                      folder_id=folder_id)
+                             for i in range(docs_per_question)]
+            docs.extend(question_docs)
+            questions.append(QuestionAnswer(question_id=f'{folder}-{question}', question='?', answer=[],
+                                            category=QuestionCategory.NONE, docs=question_docs[:2]))
+
+    return docs, questions
+
+
+def context_tokens_per_question(
+    batches: list[list[QuestionAnswer]],
+    docs: list[Document],
+    token_counter: ContextTokenCounter
+) -> float:
+    """
+    Computes the number of context tokens per question of the batches, checking that every context holds the
+    supporting docs of its questions.
+    """
+    doc_ids = [doc['doc_id'] for doc in docs]
+    docs_map = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+    context_tokens = 0
+    for batch in batches:
+        must_have_docs = [doc['doc_id'] for question in batch for doc in question['docs']]
+        context = get_context_doc_indices(doc_ids, docs_map, must_have_docs, MAX_TOKENS, token_counter)
+
+        assert {docs_map[doc_id] for doc_id in must_have_docs} <= set(context)
+        context_tokens += token_counter.count_docs(context)
+
+    return context_tokens / sum(len(batch) for batch in batches)
+
+
+class TestPlanBatches(unittest.TestCase):
+    """Tests of the batches planned by the default agent against fixed batches in dataset order."""
+
+    def setUp(self):
+        patcher = mock.patch.object(TokenCounter, 'count_batch', count_words)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_fewer_tokens_per_question(self, docs: list[Document], questions: list[QuestionAnswer]) -> None:
+        """
+        Asserts that the planned batches use fewer context tokens per question than fixed batches.
+        """
+        token_counter = ContextTokenCounter(docs, 'gpt-4o-mini')
+        docs_map = {doc['doc_id']: i for i, doc in enumerate(docs)}
+
+        planned = plan_batches(questions, docs_map, token_counter, MAX_TOKENS, MAX_SHARED_BATCH_SIZE)
+        fixed = [questions[i:i + MAX_BATCH_SIZE] for i in range(0, len(questions), MAX_BATCH_SIZE)]
+
+        planned_tokens = context_tokens_per_question(planned, docs, token_counter)
+        fixed_tokens = context_tokens_per_question(fixed, docs, token_counter)
+
+        self.assertEqual(sorted(q['question_id'] for batch in planned for q in batch),
+                         sorted(q['question_id'] for q in questions))
+        self.assertLess(planned_tokens, fixed_tokens)
+
+        for batch in planned:
+            self.assertLessEqual(len(batch), MAX_SHARED_BATCH_SIZE)
+            self.assertEqual(len({doc['folder_id'] for q in batch for doc in q['docs']}), 1)
+
+    def test_contiguous_evidence(self):
+        """Questions whose evidence lies in the order of the dataset share fewer, larger contexts."""
+        docs, questions = build_corpus(1, 200, 10)
+
+        self.assert_fewer_tokens_per_question(docs, questions)
+
+    def test_shuffled_evidence(self):
+        """Questions whose evidence is scattered across the corpus are grouped by position."""
+        docs, questions = build_corpus(1, 200, 10)
+        random.Random(0).shuffle(questions)
+
+        self.assert_fewer_tokens_per_question(docs, questions)
+
+    def test_folders(self):
+        """Questions of the same conversation share its context without mixing conversations."""
+        docs, questions = build_corpus(8, 20, 5)
+
+        self.assert_fewer_tokens_per_question(docs, questions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Tests of the QA prompts built by an experiment run against the ones of a single run of index.py."""
+import unittest
+from argparse import Namespace
+from typing import Optional
+from unittest import mock
+
+from agents.oracle.oracle import Oracle
+from data.locomo.locomo import Locomo
+from models.dataset import Dataset, DatasetSample, DatasetSampleInstance
+from models.document import Document
+from models.question_answer import QuestionAnswer, QuestionCategory
+from utils.token_utils import TokenCounter
+
+# Models answering the same retrieval results of an experiment run
+MODELS = ['gpt-4o-mini', 'o3-mini', 'Qwen/Qwen2.5-14B-Instruct']
+
+DOCS = [
+    Document(doc_id='1', content='The Mickey Mouse Club is an American variety television show.'),
+    Document(doc_id='2', content='Walt Disney and Ub Iwerks had created Oswald.'),
+]
+QUESTION = 'What was the old show named after a character created by Walt Disney?'
+
+
+def get_args(execution: str, model: Optional[str]) -> Namespace:
+    """
+    Gets the arguments of index.py that a stage of an experiment run uses, which have no model in retrieve mode.
+    """
+    return Namespace(execution=execution, model=model, dataset='hotpot', conversation=None, questions=None,
+                     category=None, limit=None, agent='oracle', k=None, k_values=None)
+
+
+def count_words(_, texts: list[str], __: str) -> list[int]:
+    """
+    Counts one token per word so that the tests do not need to download an encoding.
+    """
+    return [len(text.split()) for text in texts]
+
+
+class SampleDataset(Dataset):
+    """Dataset with a single question supported by all the documents."""
+
+    def read(self) -> list[DatasetSample]:
+        return self.process_dataset([DatasetSample(sample_id='1', sample=DatasetSampleInstance(qa=[QuestionAnswer(
+            question_id='1', question=QUESTION, answer=['The Mickey Mouse Club'], category=QuestionCategory.NONE,
+            docs=DOCS)]))])
+
+    def read_corpus(self) -> list[Document]:
+        return DOCS
+
+
+class SampleLocomo(Locomo):
+    """Locomo dataset with the samples of SampleDataset."""
+
+    read = SampleDataset.read
+    read_corpus = SampleDataset.read_corpus
+
+
+class TestExperimentPrompts(unittest.TestCase):
+    """Tests that an experiment run answers with the same prompts as index.py for each model."""
+
+    def setUp(self):
+        patcher = mock.patch.object(TokenCounter, 'count_batch', count_words)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def index(self, dataset_type: type[Dataset], args: Namespace, dataset_model: Optional[str]) -> Oracle:
+        """
+        Indexes a dataset loaded with the given model, as the dataset stage shared by the agents does.
+        """
+        dataset = dataset_type(get_args('retrieve', dataset_model))
+        dataset.read()
+
+        agent = Oracle(args)
+        agent.index(dataset)
+
+        return agent
+
+    def assert_same_prompts(self, dataset_type: type[Dataset]) -> None:
+        """
+        Asserts that the prompts of the runner match the ones of index.py whatever the model the shared dataset
+        was loaded with.
+        """
+        for dataset_model in [None] + MODELS:
+            runner_agent = self.index(dataset_type, get_args('retrieve', None), dataset_model)
+            sources = runner_agent.reason(QUESTION).get_sources()
+
+            for model in MODELS:
+                index_args = get_args('predict', model)
+                index_agent = self.index(dataset_type, index_args, model)
+
+                self.assertEqual(runner_agent.build_sweep_notes(sources, None, model),
+                                 index_agent.reason(QUESTION).get_notes(), (dataset_model, model))
+
+    def test_prompts_depend_on_model(self):
+        """The relevant passages prompt of the answering model is used, not the one the dataset was loaded with."""
+        self.assert_same_prompts(SampleDataset)
+
+    def test_dataset_prompts(self):
+        """Datasets that override the prompts use them for all the models."""
+        self.assert_same_prompts(SampleLocomo)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Tests of the token counts used to size contexts against the exact counts of the tiktoken encodings."""
+import unittest
+
+from agents.default.default import ContextTokenCounter, get_content
+from models.document import Document
+from utils.token_utils import TokenCounter
+
+# Model whose encoding is used in the tests
+MODEL = 'gpt-4o-mini'
+
+# Lines ending in punctuation, trailing whitespace or blank lines, which the pre-tokenizer merges with the line break
+LINES = [
+    'The Mickey Mouse Club is an American variety television show.',
+    'It aired intermittently from 1955 to 1996 and returned in 2017 to social media. ',
+    'Walt Disney and Ub Iwerks had created Oswald.\n',
+    'Universal subsequently severed its link to Mintz!',
+    'Q: "When did Caroline and Melanie go to a pride festival together?"',
+    '  indented line with trailing tabs\t',
+    '',
+    'Last line?',
+]
+
+
+def load_encoding():
+    """
+    Loads the encoding of the test model, skipping the test if it cannot be downloaded.
+    """
+    try:
+        return TokenCounter().get_encoding(MODEL)
+    # pylint: disable-next=broad-exception-caught
+    except Exception as e:
+        raise unittest.SkipTest(f"Encoding of {MODEL} is not available: {e}") from e
+
+
+class TestContextTokenCounter(unittest.TestCase):
+    """Tests of the prefix sum token counts of the default agent."""
+
+    def test_count_is_upper_bound_of_rendered_content(self):
+        """The count of every slice is at least the exact count and at most one token per line break above it."""
+        encoding = load_encoding()
+        docs = [Document(doc_id=str(i), content=line, folder_id=f'conv-{i // 3}') for i, line in enumerate(LINES)]
+        counter = ContextTokenCounter(docs, MODEL)
+
+        for start in range(len(docs)):
+            for end in range(start + 1, len(docs) + 1):
+                content = get_content(docs[start:end])
+                exact = len(encoding.encode(content, disallowed_special=()))
+                counted = counter.count(start, end)
+
+                self.assertGreaterEqual(counted, exact, content)
+                self.assertLessEqual(counted - exact, content.count('\n'), content)
+                self.assertEqual(counter.count_docs(list(range(start, end))), counted)
+
+    def test_separators_merge_with_line_ends(self):
+        """The separators of the rendered content are merged by the pre-tokenizer, so counts are not exact."""
+        encoding = load_encoding()
+        merged = ['end.', 'end ', 'end\n']
+
+        self.assertTrue(any(
+            len(encoding.encode(line + '\n' + 'next')) < len(encoding.encode(line)) + 1 + len(encoding.encode('next'))
+            for line in merged
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
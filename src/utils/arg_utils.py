@@ -0,0 +1,22 @@
+"""A module to add the command line arguments shared by the scripts that process a dataset."""
+import argparse
+
+
+def add_dataset_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the arguments that select the dataset to be processed and its samples.
+
+    Args:
+        parser (argparse.ArgumentParser): the parser to add the arguments to
+    """
+    parser.add_argument('-d', '--dataset', choices=['locomo', 'hotpot', '2wiki', 'musique'], required=True,
+                        help='dataset to be processed (required)')
+    parser.add_argument('-c', '--conversation', type=str,
+                        help='conversation id to be extracted from the dataset - (optional)')
+    parser.add_argument('-q', '--questions', type=int,
+                        help='number of questions to be processed in each dataset sample (optional)')
+    parser.add_argument('-ct', '--category', type=int,
+                        help='category to be extracted from the dataset (optional)')
+    parser.add_argument('-l', '--limit', type=int,
+                        help='limit the number of samples to process. \
+Ignored if conversation id is provided (optional)')
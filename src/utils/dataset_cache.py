@@ -0,0 +1,184 @@
+"""Compiled binary cache of the parsed questions and corpus of a dataset."""
+import json
+import os
+import pickle
+import shutil
+from typing import Any, Optional
+import numpy as np
+from logger.logger import Logger
+from models.document import Document
+from utils.hash_utils import get_content_hash
+
+# Version of the cache format. Bump it whenever the parsing of a dataset changes so that stale caches are not read
+CACHE_VERSION = 1
+# Fields of a document stored in the corpus cache
+CORPUS_FIELDS = ('doc_id', 'content', 'title', 'folder_id')
+
+
+def _write_strings(path: str, values: list[Optional[str]]) -> None:
+    """
+    Writes a list of strings as a single UTF-8 blob, the character offset of each string and a mask of missing values.
+
+    Args:
+        path (str): the path of the files without extension
+        values (list[Optional[str]]): the strings to write
+    """
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) if value is not None else 0 for value in values])
+
+    with open(path + '.bin', 'wb') as blob:
+        blob.write(''.join(value for value in values if value is not None).encode('utf-8'))
+
+    np.save(path + '.offsets.npy', offsets)
+    np.save(path + '.none.npy', np.array([value is None for value in values], dtype=np.bool_))
+
+
+def _read_strings(path: str) -> list[Optional[str]]:
+    """
+    Reads a list of strings written by _write_strings.
+    The blob is read and decoded at once, and every string is a slice of it.
+
+    Args:
+        path (str): the path of the files without extension
+
+    Returns:
+        values (list[Optional[str]]): the strings
+    """
+    with open(path + '.bin', 'r', encoding='utf-8', newline='') as blob:
+        text = blob.read()
+
+    offsets = np.load(path + '.offsets.npy').tolist()
+    missing = np.load(path + '.none.npy').tolist()
+
+    return [
+        None if missing[i] else text[offsets[i]:offsets[i + 1]]
+        for i in range(len(missing))
+    ]
+
+
+class DatasetCache:
+    """
+    Binary cache of a dataset file stored under temp/dataset_cache.
+    The cache is keyed by the path, modification time and size of the source file and by the arguments used to filter
+    it, so it is rebuilt whenever any of them changes.
+    The questions are stored as a pickle, while the corpus is stored as one blob per document field plus the offsets
+    of each document, which are sliced when loaded instead of parsing the source JSON and hashing every passage.
+    The cache can be disabled by setting the DISABLE_DATASET_CACHE environment variable to 1.
+    """
+
+    def __init__(self, name: str, kind: str, file_path: str, params: Optional[dict[str, Any]] = None):
+        self._path = None
+
+        if os.getenv("DISABLE_DATASET_CACHE", None) == "1":
+            return
+
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+
+        key = get_content_hash(json.dumps({
+            'version': CACHE_VERSION,
+            'file_path': os.path.abspath(file_path),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'params': params or {},
+        }, sort_keys=True))
+
+        self._path = os.path.join(os.path.normpath(
+            os.getcwd() + os.sep + os.pardir), 'temp' + os.sep + 'dataset_cache' + os.sep + name + os.sep +
+            f'{kind}-{key}')
+
+    def load_samples(self) -> Optional[list]:
+        """
+        Loads the cached questions of the dataset.
+
+        Returns:
+            dataset (Optional[list]): the processed dataset samples if they are cached, None otherwise
+        """
+        if self._path is None or not os.path.isdir(self._path):
+            return None
+
+        try:
+            with open(os.path.join(self._path, 'samples.pkl'), 'rb') as samples:
+                dataset = pickle.load(samples)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            Logger().warn(f"Could not read the dataset cache at {self._path}: {e}")
+            return None
+
+        Logger().info(f"Read {len(dataset)} dataset samples from the cache at {self._path}")
+
+        return dataset
+
+    def save_samples(self, dataset: list) -> None:
+        """
+        Caches the questions of the dataset.
+
+        Args:
+            dataset (list): the processed dataset samples
+        """
+        self._save(lambda path: self._write_samples(path, dataset))
+
+    def load_corpus(self) -> Optional[list[Document]]:
+        """
+        Loads the cached corpus of the dataset.
+
+        Returns:
+            corpus (Optional[list[Document]]): the corpus if it is cached, None otherwise
+        """
+        if self._path is None or not os.path.isdir(self._path):
+            return None
+
+        try:
+            fields = {field: _read_strings(os.path.join(self._path, field)) for field in CORPUS_FIELDS}
+        except (OSError, ValueError) as e:
+            Logger().warn(f"Could not read the corpus cache at {self._path}: {e}")
+            return None
+
+        corpus = [
+            Document(doc_id=doc_id, content=content, title=title, folder_id=folder_id)  # type: ignore
+            for doc_id, content, title, folder_id in zip(*(fields[field] for field in CORPUS_FIELDS))
+        ]
+
+        Logger().info(f"Read {len(corpus)} documents from the corpus cache at {self._path}")
+
+        return corpus
+
+    def save_corpus(self, corpus: list[Document]) -> None:
+        """
+        Caches the corpus of the dataset.
+
+        Args:
+            corpus (list[Document]): the corpus
+        """
+        self._save(lambda path: self._write_corpus(path, corpus))
+
+    def _save(self, write) -> None:
+        """
+        Writes the cache to a temporary folder which is then renamed so that readers never see a partial cache.
+
+        Args:
+            write (Callable[[str], None]): writes the cache files to the given folder
+        """
+        if self._path is None or os.path.isdir(self._path):
+            return
+
+        tmp_path = f'{self._path}.tmp-{os.getpid()}'
+        try:
+            os.makedirs(tmp_path, exist_ok=True)
+            write(tmp_path)
+            os.rename(tmp_path, self._path)
+        except OSError as e:
+            Logger().warn(f"Could not write the dataset cache at {self._path}: {e}")
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @staticmethod
+    def _write_samples(path: str, dataset: list) -> None:
+        with open(os.path.join(path, 'samples.pkl'), 'wb') as samples:
+            pickle.dump(dataset, samples, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _write_corpus(path: str, corpus: list[Document]) -> None:
+        for field in CORPUS_FIELDS:
+            _write_strings(os.path.join(path, field), [doc.get(field) for doc in corpus])
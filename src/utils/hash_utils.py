@@ -15,3 +15,18 @@ def get_content_hash(content: str) -> str:
     sha256_hash = hashlib.sha256()
     sha256_hash.update(content.encode('utf-8'))
     return sha256_hash.hexdigest()
+
+
+def get_corpus_fingerprint(doc_keys: list[str]) -> str:
+    """
+    Gets a fingerprint that uniquely identifies a corpus by the set of keys of its documents, e.g., their ids or the
+    hashes of their content.
+    The fingerprint does not depend on the order of the documents.
+
+    Args:
+        doc_keys (list[str]): the key of each document in the corpus
+
+    Returns:
+        fingerprint (str): the corpus fingerprint
+    """
+    return get_content_hash('\n'.join(sorted(set(doc_keys))))
@@ -0,0 +1,141 @@
+"""JSON utilities to stream the records of large dataset files."""
+import json
+import os
+import re
+from typing import Any, Iterator, TextIO
+
+# Number of characters read from a file at a time when streaming a JSON array
+CHUNK_SIZE = 1 << 20
+# Whitespace allowed between the tokens of a JSON document
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Characters that can follow an element of a JSON array
+DELIMITERS = frozenset(' \t\n\r,]')
+
+
+def _skip_whitespace(file: TextIO, buffer: str, pos: int) -> tuple[str, int]:
+    """
+    Skips the whitespace at the given position, reading more of the file until a non whitespace character is found.
+
+    Args:
+        file (TextIO): the file being streamed
+        buffer (str): the characters read from the file and not consumed yet
+        pos (int): the position in the buffer
+
+    Returns:
+        result (tuple[str, int]): the buffer and the position of the next non whitespace character, which is the length
+        of the buffer if the end of the file is reached
+    """
+    while True:
+        pos = WHITESPACE.match(buffer, pos).end()  # type: ignore
+        if pos < len(buffer):
+            return buffer, pos
+
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            return buffer, pos
+
+        # Everything before the position is whitespace, so it can be dropped
+        buffer, pos = chunk, 0
+
+
+def iter_json_array(file_path: str) -> Iterator[Any]:
+    """
+    Streams the elements of a JSON file whose top level value is an array without loading the whole file.
+    Each element is decoded as soon as it is read, so the memory used is bounded by the size of the largest element.
+
+    Args:
+        file_path (str): the path of the JSON file
+
+    Raises:
+        ValueError: if the file is not a well formed JSON array
+
+    Yields:
+        element (Any): the elements of the array
+    """
+    decoder = json.JSONDecoder()
+
+    with open(file_path, encoding='utf-8') as file:
+        buffer, pos = _skip_whitespace(file, '', 0)
+        if pos == len(buffer) or buffer[pos] != '[':
+            raise ValueError(f"Expected a JSON array in {file_path}")
+
+        buffer, pos = _skip_whitespace(file, buffer, pos + 1)
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        while True:
+            while True:
+                try:
+                    element, end = decoder.raw_decode(buffer, pos)
+                    # A number at the end of the buffer may be truncated, so a value is only taken once it is
+                    # followed by a delimiter
+                    if end < len(buffer) and buffer[end] in DELIMITERS:
+                        break
+                except json.JSONDecodeError:
+                    end = -1
+
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    if end < 0:
+                        raise ValueError(f"Malformed JSON array in {file_path} at character {pos} of the buffer")
+                    break
+
+                buffer, pos = buffer[pos:] + chunk, 0
+
+            yield element
+
+            buffer, pos = _skip_whitespace(file, buffer, end)
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            if pos == len(buffer) or buffer[pos] != ',':
+                raise ValueError(f"Expected ',' or ']' after an element of the JSON array in {file_path}")
+
+            buffer, pos = _skip_whitespace(file, buffer, pos + 1)
+
+
+def iter_json_lines(file_path: str) -> Iterator[Any]:
+    """
+    Streams the records of a JSON lines file.
+
+    Args:
+        file_path (str): the path of the JSON lines file
+
+    Yields:
+        record (Any): the record of each non empty line
+    """
+    with open(file_path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_records(file_path: str) -> Iterator[Any]:
+    """
+    Streams the records of a dataset file, which is either a JSON lines file or a JSON array.
+
+    Args:
+        file_path (str): the path of the dataset file
+
+    Yields:
+        record (Any): the records of the file
+    """
+    if file_path.endswith('.jsonl'):
+        yield from iter_json_lines(file_path)
+    else:
+        yield from iter_json_array(file_path)
+
+
+def prefer_jsonl(file_path: str) -> str:
+    """
+    Gets the JSON lines version of a JSON file if it exists, so that corpora generated in JSON lines format are
+    preferred over the ones generated as a JSON array by previous versions.
+
+    Args:
+        file_path (str): the path of the JSON file
+
+    Returns:
+        file_path (str): the path of the JSON lines file if it exists, the given path otherwise
+    """
+    jsonl_path = os.path.splitext(file_path)[0] + '.jsonl'
+
+    return jsonl_path if os.path.exists(jsonl_path) else file_path
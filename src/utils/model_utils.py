@@ -1,4 +1,6 @@
 """Utilities for models."""
+import os
+from typing import Optional
 
 
 def supports_temperature_param(model: str) -> bool:
@@ -24,6 +26,8 @@ def supports_temperature_param(model: str) -> bool:
 def supports_batch(model: str) -> bool:
     """
     Checks if the model supports batch processing.
+    Any model supports it when the LLM_BATCH_ENDPOINT environment variable points to a batch server, e.g., the
+    local batch server in azure_open_ai.local_batch_server.
 
     Args:
         model (str): the model identifier
@@ -38,4 +42,27 @@ def supports_batch(model: str) -> bool:
         'o3-mini',
     ]
 
+    if os.getenv("LLM_BATCH_ENDPOINT"):
+        return True
+
     return model in models_with_batch
+
+
+def get_rate_limits(model: str) -> tuple[Optional[int], Optional[int]]:
+    """
+    Get the requests per minute (RPM) and tokens per minute (TPM) quotas of a model deployment.
+    Models served by VLLM have no quota.
+
+    Args:
+        model (str): the model identifier
+
+    Returns:
+        rate_limits (tuple[Optional[int], Optional[int]]): the RPM and TPM quotas, None if there is no quota
+    """
+    # Quotas of the standard deployments
+    rate_limits_map = {
+        'gpt-4o-mini': (2_500, 250_000),
+        'o3-mini': (500, 50_000),
+    }
+
+    return rate_limits_map.get(model, (None, None))
@@ -3,6 +3,9 @@
 from typing import Optional
 from models.question_answer import QuestionAnswer, QuestionCategory
 
+# Separator between the question id and the retrieval depth in the custom ids of a sweep over several values of k
+K_SEPARATOR = '#k'
+
 
 def filter_questions(
     questions: list[QuestionAnswer],
@@ -40,3 +43,40 @@ def filter_questions(
         {q['question_id']: q for q in filtered_questions}.values())
 
     return filtered_questions[:limit]
+
+
+def get_custom_ids(question_id: str, k_values: Optional[list[int]] = None) -> list[str]:
+    """
+    Gets the custom ids of the jobs of a question. In a sweep over several values of k, each value has its own job
+    whose custom id is tagged by k, e.g., "<question_id>#k5".
+
+    Args:
+        question_id (str): the question id
+        k_values (list[int], optional): the retrieval depths of the sweep in ascending order
+
+    Returns:
+        custom_ids (list[str]): the custom ids in the order of the retrieval depths
+    """
+    if not k_values or len(k_values) <= 1:
+        return [question_id]
+
+    return [f'{question_id}{K_SEPARATOR}{k}' for k in k_values]
+
+
+def split_custom_id(custom_id: str) -> tuple[str, Optional[int]]:
+    """
+    Splits the custom id of a job into its question id and the retrieval depth it is tagged with.
+
+    Args:
+        custom_id (str): the custom id
+
+    Returns:
+        question_id (str): the question id
+        k (Optional[int]): the retrieval depth, None if the custom id is not tagged
+    """
+    question_id, separator, k = str(custom_id).rpartition(K_SEPARATOR)
+
+    if separator and k.isdigit():
+        return question_id, int(k)
+
+    return str(custom_id), None
@@ -1,9 +1,123 @@
 """Utilities for tokenization and token counting."""
+import threading
 from typing import Optional
 import tiktoken
 
 from logger.logger import Logger
 from models.document import Document
+from utils.hash_utils import get_content_hash
+from utils.singleton import Singleton
+
+# Maximum number of token counts kept in memory. The counts are dropped all at once when it is exceeded
+MAX_CACHED_COUNTS = 2_000_000
+# Number of threads used by tiktoken to encode a batch of texts
+ENCODING_THREADS = 8
+
+
+class TokenCounter(metaclass=Singleton):
+    """
+    Counts the tokens of prompts and documents, encoding each distinct content once per encoding.
+    Counts are memoized by the hash of the content, so the same prompt counted by the cost guard, the truncation
+    and the rate limiter, or the same document counted by the dataset stats and the agents, is only encoded once.
+    Batches of texts are encoded in parallel with the batch encoder of tiktoken.
+    """
+
+    def __init__(self):
+        self._counts: dict[tuple[str, str], int] = {}
+        self._encodings: dict[str, tiktoken.Encoding] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def count(self, text: str, model: str) -> int:
+        """
+        Counts the tokens of a text.
+
+        Args:
+            text (str): the text
+            model (str): the model whose encoding is used
+
+        Returns:
+            num_tokens (int): the number of tokens of the text
+        """
+        return self.count_batch([text], model)[0]
+
+    def count_batch(self, texts: list[str], model: str) -> list[int]:
+        """
+        Counts the tokens of several texts, encoding the ones not counted before in parallel.
+
+        Args:
+            texts (list[str]): the texts
+            model (str): the model whose encoding is used
+
+        Returns:
+            num_tokens (list[int]): the number of tokens of each text
+        """
+        encoding = self.get_encoding(model)
+        keys = [(encoding.name, get_content_hash(text)) for text in texts]
+
+        with self._lock:
+            counts = {key: self._counts[key] for key in keys if key in self._counts}
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in counts}
+
+        if len(missing) > 0:
+            encoded = encoding.encode_batch(list(missing.values()), num_threads=ENCODING_THREADS,
+                                            disallowed_special=())
+            counts.update(zip(missing.keys(), (len(tokens) for tokens in encoded)))
+
+        with self._lock:
+            if len(self._counts) + len(missing) > MAX_CACHED_COUNTS:
+                Logger().info(f"Dropping {len(self._counts)} cached token counts")
+                self._counts.clear()
+
+            self._counts.update((key, counts[key]) for key in missing)
+            self._hits += len(keys) - len(missing)
+            self._misses += len(missing)
+
+        return [counts[key] for key in keys]
+
+    def truncate(self, text: str, model: str, max_tokens: int) -> str:
+        """
+        Truncates a text to a maximum number of tokens. The text is only encoded again if it must be truncated.
+
+        Args:
+            text (str): the text
+            model (str): the model whose encoding is used
+            max_tokens (int): the maximum number of tokens
+
+        Returns:
+            truncated_text (str): the text truncated to at most max_tokens tokens
+        """
+        if self.count(text, model) <= max_tokens:
+            return text
+
+        encoding = self.get_encoding(model)
+
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+    def get_encoding(self, model: str) -> tiktoken.Encoding:
+        """
+        Gets the encoding of a model, loading it once.
+
+        Args:
+            model (str): the model identifier
+
+        Returns:
+            encoding (tiktoken.Encoding): the encoding of the model
+        """
+        if model not in self._encodings:
+            self._encodings[model] = get_encoding(model)
+
+        return self._encodings[model]
+
+    def log_stats(self) -> None:
+        """
+        Logs the hit rate of the token counts.
+        """
+        Logger().info(
+            f"Token counts: {self._hits} hits, {self._misses} misses \
+({100.0 * self._hits / max(1, self._hits + self._misses):.2f}% hit rate)")
 
 
 def average_content_length(corpus: list[Document], model: Optional[str] = None) -> tuple[float, float]:
@@ -22,8 +136,8 @@ def average_content_length(corpus: list[Document], model: Optional[str] = None)
     avg_tokens = 0.0
 
     if model is not None:
-        avg_tokens = sum(estimate_num_tokens(
-            doc['content'], model) for doc in corpus) / len(corpus)
+        avg_tokens = sum(TokenCounter().count_batch(
+            [doc['content'] for doc in corpus], model)) / len(corpus)
     return avg_length, avg_tokens
 
 
@@ -85,16 +199,58 @@ def truncate_prompt_if_needed(prompt: str, model: str) -> str:
         truncated_prompt (str): the truncated prompt
     """
     max_tokens = get_max_context_length(model)
-    encoding = get_encoding(model)
-    num_tokens = len(encoding.encode(prompt))
+    num_tokens = TokenCounter().count(prompt, model)
 
     if num_tokens > max_tokens:
         Logger().warn(f"Prompt exceeds max tokens ({max_tokens}). Truncating.")
-        return encoding.decode(encoding.encode(prompt)[:max_tokens])
+        return TokenCounter().truncate(prompt, model, max_tokens)
 
     return prompt
 
 
+def assemble_context(sources: list[str], prompt: str, model: Optional[str]) -> str:
+    """
+    Fills the context of a prompt with whole passages in rank order within the context length of the given model,
+    instead of joining all of them and truncating the prompt afterwards.
+    Passages that do not fit are dropped, and lower ranked passages that still fit are kept. If not even the first
+    passage fits, it is the only one used and it is truncated.
+
+    Args:
+        sources (list[str]): the contents of the passages in rank order
+        prompt (str): the prompt with a {context} placeholder
+        model (Optional[str]): the model identifier, if None or unknown all the passages are used
+
+    Returns:
+        prompt (str): the prompt with the passages that fit in its context
+    """
+    max_tokens = get_max_context_length(model) if model is not None else 0
+
+    if max_tokens <= 0 or len(sources) == 0:
+        return prompt.format(context='\n'.join(sources))
+
+    budget = max_tokens - TokenCounter().count(prompt.format(context=''), model)  # type: ignore
+
+    context = []
+    # Each passage is counted on its own plus one token for the line break that follows it, so the count of the
+    # context is an upper bound: the pre-tokenizer may merge a line break with the punctuation or whitespace that
+    # ends the passage before it, and the last passage is not followed by one. The template is counted with an empty
+    # context, so its tokens are included in full and any merge at the template/passage boundary only saves tokens
+    for source, num_tokens in zip(sources, TokenCounter().count_batch(sources, model)):  # type: ignore
+        if num_tokens + 1 <= budget:
+            context.append(source)
+            budget -= num_tokens + 1
+
+    if len(context) == 0:
+        Logger().warn(f"First passage exceeds max tokens ({max_tokens}). Truncating.")
+        context = [TokenCounter().truncate(sources[0], model, max(0, budget - 1))]  # type: ignore
+
+    if len(context) < len(sources):
+        Logger().warn(f"Dropped {len(sources) - len(context)} out of {len(sources)} passages exceeding max tokens \
+({max_tokens}).")
+
+    return prompt.format(context='\n'.join(context))
+
+
 def estimate_num_tokens(prompt: str, model: str) -> int:
     """
     Estimate the number of tokens in a prompt for a given model.
@@ -106,9 +262,7 @@ def estimate_num_tokens(prompt: str, model: str) -> int:
     Returns:
         estimate_tokens (int): an estimate of the number of tokens in the prompt when using the given model
     """
-    encoding = get_encoding(model)
-    num_tokens = len(encoding.encode(prompt))
-    return num_tokens
+    return TokenCounter().count(prompt, model)
 
 
 def estimate_cost(num_tokens: int, model: str) -> float: